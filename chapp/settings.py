@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
 from pathlib import Path
+import os
 import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'pms.middleware.QueryBudgetMiddleware',
+    'pms.routers.ReplicaMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,9 +81,17 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # seconds a connection is kept for the next request, 0 closes it after each one
+        'CONN_MAX_AGE': int(os.environ.get('PMS_CONN_MAX_AGE', 60)),
     }
 }
 
+# Pragmas run on every new SQLite connection (pms.sqlite): "production" turns on
+# WAL, synchronous=NORMAL, a busy timeout and larger caches; "default" leaves
+# SQLite's own settings. SQLITE_PRAGMAS overrides single pragmas of the profile.
+SQLITE_PROFILE = os.environ.get('PMS_SQLITE_PROFILE', 'production')
+SQLITE_PRAGMAS = {}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -124,6 +135,91 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# PMS
+
+# Number of bookings per page in the home and booking search listings
+BOOKINGS_PAGE_SIZE = 50
+
+# Where room availability is answered: "sql" (booking overlap queries and the
+# occupancy ledger) or "memory" (per-process interval index, brought up to date
+# from the booking change feed on every read)
+AVAILABILITY_BACKEND = 'sql'
+
+# Most (room, checkin, checkout) tuples accepted by the batch availability endpoint
+AVAILABILITY_BATCH_LIMIT = 10000
+
+# Answers the date check keeps per process with the "sql" backend (pms.memo), 0 turns it off.
+# Room versions live in the AVAILABILITY_MEMO_CACHE alias, the memo stays off unless that
+# cache is shared by every process (memcached, Redis, files): the default LocMemCache is not.
+AVAILABILITY_MEMO_SIZE = 4096
+AVAILABILITY_MEMO_CACHE = 'default'
+
+# Read replicas (pms.routers): the views in REPLICA_READ_VIEWS read from one of the
+# DATABASE_REPLICAS aliases, writes always go to "default". PMS_REPLICA_DB adds a
+# SQLite replica for local testing, refreshed with `python manage.py sync_replica`.
+DATABASE_ROUTERS = ['pms.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+if os.environ.get('PMS_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['PMS_REPLICA_DB'],
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+    }
+    DATABASE_REPLICAS = ['replica']
+REPLICA_READ_VIEWS = ['home', 'booking_search', 'booking_codes', 'rooms', 'room_details']
+# Seconds a client that just wrote keeps reading from the primary
+REPLICA_STICKY_SECONDS = 10
+
+# Most reservation codes the autocomplete endpoint returns
+CODE_AUTOCOMPLETE_LIMIT = 10
+
+# Most changes returned per page of the booking change feed (/bookings/changes/)
+CHANGE_FEED_LIMIT = 500
+
+# Seconds a process keeps its in-memory room catalog; room changes made through
+# the app clear it at once in the process that made them
+ROOM_CATALOG_TIMEOUT = 300
+
+# Seconds the dashboard figures of the day stay cached, booking writes clear them
+DASHBOARD_CACHE_TIMEOUT = 30
+
+# Most queries a request may run, by URL name (pms.middleware.QueryBudgetMiddleware).
+# Requests over budget are logged, and fail when QUERY_BUDGET_STRICT is on.
+# Neither reads nor writes depend on the number of bookings or the nights of a stay. The
+# write budgets leave room for the six profile pragmas of a request that opens its connection.
+# Streamed exports are left out: their queries run after the view returns.
+QUERY_BUDGETS = {
+    'home': 4,
+    'booking_search': 4,
+    'booking_codes': 2,
+    'search': 6,
+    'rooms': 2,
+    'availability_grid': 2,
+    'room_details': 2,
+    'dashboard': 2,
+    'dashboard_history': 5,
+    'check_booking_availability': 3,
+    'batch_availability': 1,
+    'availability_memo_stats': 0,
+    'booking_changes': 1,
+    'edit_booking': 8,
+    'booking': 28,
+    'edit_booking_dates': 25,
+    'delete_booking': 23,
+}
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_STRICT = False
+
 if 'test' in sys.argv:
     STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+    # tests roll back their transactions, which a process-wide index never sees
+    AVAILABILITY_BACKEND = 'sql'
+    # for the same reason the room catalog is read again on every use
+    ROOM_CATALOG_TIMEOUT = 0
+    # cached pages would leak between tests, cache tests enable a real cache
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    # a second database for the replica routing tests, empty like a lagging replica
+    DATABASES['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'replica.sqlite3'}
+    # a view over its query budget fails the test that requested it
+    QUERY_BUDGET_STRICT = True
 
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chapp.settings')
 
 application = get_wsgi_application()
+
+# load the room availability index before serving the first request
+from pms import availability  # noqa: E402
+
+availability.warm_up()
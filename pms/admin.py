@@ -1,5 +1,5 @@
 from django.contrib import admin
 
-from .models import Room, Booking, Customer, Room_type
+from .models import ArchivedBooking, BookingChange, Room, Booking, Customer, Rate, Room_type
 
-admin.site.register([Room, Booking, Customer, Room_type])
+admin.site.register([Room, Booking, Customer, Room_type, Rate, ArchivedBooking, BookingChange])
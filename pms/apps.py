@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class PmsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pms'
+
+    def ready(self):
+        # connect the booking signal receivers
+        from . import changes, signals, sqlite
+        post_migrate.connect(signals.install_fts, sender=self)
+        connection_created.connect(sqlite.apply_pragmas)
+        # the change feed cursor relies on SQLite's single writer
+        checks.register(changes.check_database)
@@ -0,0 +1,41 @@
+"""Moves long checked-out bookings off the Booking table.
+
+Availability checks, the occupancy ledger and the listings only care about
+stays that are not over yet, so bookings whose checkout is older than a
+cutoff go to ``ArchivedBooking`` with the same id, code and customer. Search
+and exports read both tables, the rollups keep the figures of archived
+bookings as history.
+"""
+from datetime import date
+from typing import Iterator, List
+
+from django.db import transaction
+
+from .models import ArchivedBooking, Booking
+
+
+def candidates(before: date):
+    # both states: a cancelled stay is as finished as a checked-out one
+    return Booking.objects.filter(checkout__lt=before)
+
+
+def archive_batch(ids: List[int]) -> int:
+    """Moves the given bookings to the archive in one transaction."""
+    with transaction.atomic():
+        rows = [ArchivedBooking(**{name: values[name] for name in ArchivedBooking.COPIED_FIELDS})
+                for values in Booking.objects.filter(id__in=ids).values(*ArchivedBooking.COPIED_FIELDS)]
+        # deleted first: the FTS row of the booking is freed before the archive
+        # trigger inserts it again under the same id, and the ledger rows go
+        # with the booking through the cascade
+        Booking.objects.filter(id__in=ids).delete()
+        ArchivedBooking.objects.bulk_create(rows)
+    return len(rows)
+
+
+def archive(before: date, batch_size: int = 1000) -> Iterator[int]:
+    """Archives every booking leaving before ``before``, yields the count of each batch."""
+    while True:
+        ids = list(candidates(before).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return
+        yield archive_batch(ids)
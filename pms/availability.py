@@ -0,0 +1,261 @@
+"""Room availability answered from SQL or from memory.
+
+With ``AVAILABILITY_BACKEND = "sql"``, the default, the questions go to the
+database (bookings and the occupancy ledger). With ``"memory"`` each process
+keeps the active stays of every room in a sorted interval list, built from
+the database on first use and kept current by the booking signals in
+``pms.signals``.
+
+Writes of other processes (workers, ``import_bookings``, ``archive_bookings``)
+reach the index through the booking change feed (``pms.changes``): every read
+first applies the changes recorded after the last one it saw, one indexed
+query that usually returns nothing. The feed's ids commit in order on SQLite
+only, the one database the app starts on.
+"""
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from . import occupancy, routers
+from .occupancy import as_date
+from .models import Booking, BookingChange
+
+logger = logging.getLogger(__name__)
+
+MEMORY = "memory"
+SQL = "sql"
+
+
+class RoomIntervals:
+    """Stays of a single room sorted by checkin, as day ordinals."""
+    __slots__ = ("starts", "stays", "longest")
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.stays: List[Tuple[int, int, int]] = []  # (checkin, checkout, booking id)
+        self.longest = 0
+
+    def add(self, start: int, end: int, booking_id: int) -> None:
+        stay = (start, end, booking_id)
+        position = bisect_right(self.stays, stay)
+        self.stays.insert(position, stay)
+        self.starts.insert(position, start)
+        self.longest = max(self.longest, end - start)
+
+    def remove(self, start: int, booking_id: int) -> None:
+        for position in range(bisect_left(self.starts, start), bisect_right(self.starts, start)):
+            if self.stays[position][2] == booking_id:
+                del self.stays[position]
+                del self.starts[position]
+                return
+
+    def conflicts(self, start: int, end: int, exclude: Optional[int] = None) -> List[int]:
+        # only stays beginning in (start - longest, end) can reach into [start, end)
+        low = bisect_left(self.starts, start - self.longest + 1)
+        high = bisect_left(self.starts, end)
+        return [booking_id for _, stay_end, booking_id in self.stays[low:high]
+                if stay_end > start and booking_id != exclude]
+
+    def __len__(self):
+        return len(self.stays)
+
+
+class AvailabilityIndex:
+    """Interval lists of the active bookings for every room."""
+
+    def __init__(self):
+        self._rooms: Dict[int, RoomIntervals] = {}
+        self._bookings: Dict[int, Tuple[int, int]] = {}  # booking id -> (room id, checkin)
+        self._lock = threading.Lock()
+        # id of the last change feed row the index reflects
+        self.seq = 0
+
+    @classmethod
+    def from_db(cls, bookings=None) -> "AvailabilityIndex":
+        # every active booking, or only those of the given queryset
+        index = cls()
+        if bookings is None:
+            bookings = Booking.objects.all()
+            # read before the stays: changes made during the build are applied again, harmlessly
+            index.seq = BookingChange.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        stays = (bookings
+                 .filter(state=Booking.NEW, room__isnull=False)
+                 .values_list("id", "room_id", "checkin", "checkout"))
+        for booking_id, room_id, checkin, checkout in stays.iterator():
+            index._add(booking_id, room_id, checkin, checkout)
+        return index
+
+    def _add(self, booking_id, room_id, checkin, checkout) -> None:
+        start, end = as_date(checkin).toordinal(), as_date(checkout).toordinal()
+        self._rooms.setdefault(room_id, RoomIntervals()).add(start, end, booking_id)
+        self._bookings[booking_id] = (room_id, start)
+
+    def _discard(self, booking_id) -> None:
+        previous = self._bookings.pop(booking_id, None)
+        if previous is not None:
+            room_id, start = previous
+            self._rooms[room_id].remove(start, booking_id)
+
+    def update(self, booking_id, room_id, state, checkin, checkout) -> None:
+        # replaces whatever the index knew about the booking
+        with self._lock:
+            self._discard(booking_id)
+            if state == Booking.NEW and room_id is not None:
+                self._add(booking_id, room_id, checkin, checkout)
+
+    def discard(self, booking_id) -> None:
+        with self._lock:
+            self._discard(booking_id)
+
+    def catch_up(self) -> None:
+        """Applies the change feed rows recorded after ``seq``, by any process."""
+        rows = list(BookingChange.objects
+                    .filter(id__gt=self.seq)
+                    .order_by("id")
+                    .values_list("id", "booking_id", "kind", "data"))
+        with self._lock:
+            for seq, booking_id, kind, data in rows:
+                # another thread may have applied newer rows meanwhile
+                if seq <= self.seq:
+                    continue
+                self._discard(booking_id)
+                if kind != BookingChange.REMOVED and data["state"] == Booking.NEW and data["room"] is not None:
+                    self._add(booking_id, data["room"], data["checkin"], data["checkout"])
+                self.seq = seq
+
+    def conflicts(self, room_id, checkin, checkout, exclude=None) -> List[int]:
+        start, end = as_date(checkin).toordinal(), as_date(checkout).toordinal()
+        with self._lock:
+            intervals = self._rooms.get(room_id)
+            if not intervals:
+                return []
+            return intervals.conflicts(start, end, exclude)
+
+    def conflicts_many(self, queries: Iterable[Tuple]) -> List[List[int]]:
+        # (room id, checkin, checkout, excluded booking id) tuples, under one lock
+        with self._lock:
+            results = []
+            for room_id, checkin, checkout, exclude in queries:
+                intervals = self._rooms.get(room_id)
+                start, end = as_date(checkin).toordinal(), as_date(checkout).toordinal()
+                results.append(intervals.conflicts(start, end, exclude) if intervals else [])
+            return results
+
+    def room_of(self, booking_id) -> Optional[int]:
+        previous = self._bookings.get(booking_id)
+        return previous[0] if previous else None
+
+    def occupied_rooms(self, checkin, checkout) -> Set[int]:
+        start, end = as_date(checkin).toordinal(), as_date(checkout).toordinal()
+        with self._lock:
+            return {room_id for room_id, intervals in self._rooms.items()
+                    if intervals.conflicts(start, end)}
+
+    def __len__(self):
+        return len(self._bookings)
+
+
+_index: Optional[AvailabilityIndex] = None
+_index_lock = threading.Lock()
+
+
+def uses_memory() -> bool:
+    return getattr(settings, "AVAILABILITY_BACKEND", SQL) == MEMORY
+
+
+def get_index() -> AvailabilityIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                # kept for the life of the process, never built from a replica
+                with routers.primary():
+                    _index = AvailabilityIndex.from_db()
+                return _index
+    with routers.primary():
+        _index.catch_up()
+    return _index
+
+
+def warm_up() -> None:
+    # builds the index at process start instead of on the first request
+    if not uses_memory():
+        return
+    try:
+        get_index()
+    except DatabaseError:
+        logger.warning("availability index not built, the database is not ready", exc_info=True)
+
+
+def reset() -> None:
+    # drops the index, the next read rebuilds it from the database
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def booking_changed(booking_id, room_id, state, checkin, checkout) -> None:
+    # called once the booking write is committed, an index not built yet
+    # will read the change from the database anyway
+    with _index_lock:
+        if _index is not None:
+            _index.update(booking_id, room_id, state, checkin, checkout)
+
+
+def booking_deleted(booking_id) -> None:
+    with _index_lock:
+        if _index is not None:
+            _index.discard(booking_id)
+
+
+def conflicting_bookings(room_id, checkin, checkout, exclude=None) -> List[int]:
+    """Ids of the active bookings of the room overlapping [checkin, checkout)."""
+    if uses_memory():
+        return get_index().conflicts(room_id, checkin, checkout, exclude)
+    return list(Booking.objects
+                .filter(room_id=room_id, state=Booking.NEW, checkin__lt=checkout, checkout__gt=checkin)
+                .exclude(pk=exclude)
+                .values_list("id", flat=True))
+
+
+def batch_conflicts(queries: List[Tuple]) -> List[List[int]]:
+    """Conflicting booking ids for each (room id, checkin, checkout, exclude) tuple.
+
+    From memory the tuples are answered by the index. With SQL one query reads
+    the active bookings of the rooms asked about over the whole window of the
+    batch, and the tuples are answered from an index built on the spot.
+    """
+    if not queries:
+        return []
+    if uses_memory():
+        return get_index().conflicts_many(queries)
+    window = Booking.objects.filter(room_id__in={query[0] for query in queries},
+                                    checkin__lt=max(as_date(query[2]) for query in queries),
+                                    checkout__gt=min(as_date(query[1]) for query in queries))
+    return AvailabilityIndex.from_db(window).conflicts_many(queries)
+
+
+def room_of(booking_id) -> Optional[int]:
+    # room of an active booking when the index knows it, None means "ask the database"
+    if uses_memory():
+        return get_index().room_of(booking_id)
+    return None
+
+
+def is_room_free(room_id, checkin, checkout, exclude=None) -> bool:
+    return not conflicting_bookings(room_id, checkin, checkout, exclude)
+
+
+def occupied_rooms(checkin, checkout) -> Iterable:
+    """Rooms taken for at least one night of [checkin, checkout).
+
+    Returns a set of ids from memory or a subquery over the occupancy ledger,
+    both usable in ``id__in`` lookups.
+    """
+    if uses_memory():
+        return get_index().occupied_rooms(checkin, checkout)
+    return occupancy.occupied_rooms(checkin, checkout)
@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def scratch_database(verbosity=0, name=None):
+    """Runs the block against a freshly migrated test database.
+
+    Benchmarks seed large amounts of data, this keeps them away from the
+    configured database the same way the test runner does. ``name`` gives
+    SQLite a database file instead of the shared in-memory one, whose table
+    locks fail at once rather than waiting, for benchmarks that write from
+    several threads.
+    """
+    old_name = connection.settings_dict["NAME"]
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    old_test_name = test_settings.get("NAME")
+    if name is not None:
+        test_settings["NAME"] = name
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        test_settings["NAME"] = old_test_name
@@ -0,0 +1,102 @@
+"""Seeded synthetic data for the benchmarks.
+
+The same sizes and seed always give the same rows, so two runs of the view
+benchmarks measure the same database. Stays of a room follow each other
+without overlapping, like the desk would book them, and the occupancy ledger
+and daily rollups are filled as the app would have left them.
+"""
+import random
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from pms import occupancy
+from pms.customers import build as build_customer
+from pms.models import Booking, Customer, Room, Room_type, RoomNight
+
+FIRST_NAMES = ("Ana", "Luis", "Eva", "Jorge", "Marta", "Pablo", "Lucía", "Diego", "Sara", "Hugo",
+               "Elena", "Iván", "Nuria", "Óscar", "Paula", "Raúl")
+LAST_NAMES = ("García", "Martínez", "López", "Sánchez", "Pérez", "Gómez", "Martín", "Jiménez",
+              "Ruiz", "Hernández", "Díaz", "Moreno", "Álvarez", "Romero")
+ROOM_TYPES = (("Individual", 20.0, 1), ("Doble", 30.0, 2), ("Triple", 40.0, 3), ("Suite", 80.0, 4))
+
+# share of bookings that end up cancelled
+CANCELLED = 0.1
+
+
+@dataclass
+class DatasetSize:
+    rooms: int = 500
+    bookings: int = 1_000_000
+    customers: int = 200_000
+    seed: int = 0
+
+    @property
+    def start(self) -> date:
+        # stays are spread around today so the dashboard and searches hit data
+        stays_per_room = max(self.bookings // max(self.rooms, 1), 1)
+        return date.today() - timedelta(days=stays_per_room * 3)
+
+
+def code(index: int) -> str:
+    # deterministic and unique, in the alphabet of the generated codes
+    return "S%07X" % index
+
+
+def generate(size: DatasetSize, batch_size: int = 5000, stdout=None) -> None:
+    rng = random.Random(size.seed)
+    with transaction.atomic():
+        room_types = Room_type.objects.bulk_create(
+            [Room_type(name=name, price=price, max_guests=guests) for name, price, guests in ROOM_TYPES])
+        rooms = Room.objects.bulk_create(
+            [Room(name="Room %s.%s" % (number // 100 + 1, number % 100),
+                  description="Synthetic room %s" % number, room_type=rng.choice(room_types))
+             for number in range(size.rooms)], batch_size=batch_size)
+        customer_ids = []
+        for start in range(0, size.customers, batch_size):
+            customers = [build_customer("%s %s" % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)),
+                                        "guest%s@example.com" % number, "6%08d" % number)
+                         for number in range(start, min(start + batch_size, size.customers))]
+            customer_ids += [customer.id for customer in Customer.objects.bulk_create(customers)]
+
+        prices = {room_type.id: room_type.price for room_type in room_types}
+        # next free night of every room
+        free_from = {room.id: size.start + timedelta(days=rng.randrange(7)) for room in rooms}
+        batch = []
+        for index in range(size.bookings):
+            room = rooms[index % len(rooms)]
+            checkin = free_from[room.id] + timedelta(days=rng.randrange(3))
+            checkout = checkin + timedelta(days=rng.randint(1, 6))
+            cancelled = rng.random() < CANCELLED
+            if not cancelled:
+                free_from[room.id] = checkout
+            batch.append(Booking(
+                room_id=room.id, customer_id=rng.choice(customer_ids) if customer_ids else None,
+                checkin=checkin, checkout=checkout, guests=1,
+                total=(checkout - checkin).days * prices[room.room_type_id], code=code(index),
+                state=Booking.DELETED if cancelled else Booking.NEW))
+            if len(batch) == batch_size:
+                _save_bookings(batch, rng)
+                batch = []
+                if stdout is not None:
+                    stdout.write("  %s/%s bookings" % (index + 1, size.bookings))
+        _save_bookings(batch, rng)
+    # the rollups come from the bookings, as the backfill would rebuild them
+    call_command("backfill_rollups", batch_size=batch_size, stdout=stdout or StringIO())
+
+
+def _save_bookings(bookings, rng) -> None:
+    if not bookings:
+        return
+    bookings = Booking.objects.bulk_create(bookings)
+    # creation dates a few weeks before the stay, ``created`` is auto_now_add
+    for booking in bookings:
+        created = datetime.combine(booking.checkin - timedelta(days=rng.randrange(60)), datetime.min.time())
+        booking.created = timezone.make_aware(created) if settings.USE_TZ else created
+    Booking.objects.bulk_update(bookings, ["created"])
+    RoomNight.objects.bulk_create([night for booking in bookings for night in occupancy.expected_nights(booking)])
@@ -0,0 +1,134 @@
+"""Latency and query counts of the pms views.
+
+Every case builds its requests from a seeded generator, so runs against the
+same dataset send the same requests. Results are plain dicts, written as JSON
+by ``bench_views`` and compared between releases with ``compare``.
+"""
+import random
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from pms import dashboard
+from pms.models import Booking, Customer, Room
+
+# a change smaller than this share of the baseline, or than NOISE_MS, is reported as noise
+NOISE = 0.10
+NOISE_MS = 1.0
+
+
+@dataclass
+class Case:
+    name: str
+    # returns (method, url, data) for one request
+    request: Callable[[random.Random], tuple]
+    # runs before every request, outside the measurement
+    setup: Optional[Callable[[], None]] = None
+
+
+def percentile(values: List[float], share: float) -> float:
+    # nearest-rank percentile of an already sorted list
+    index = max(int(round(share * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def cases() -> List[Case]:
+    room_ids = list(Room.objects.values_list("id", flat=True))
+    booking_ids = list(Booking.objects.filter(state=Booking.NEW).values_list("id", flat=True)[:10000])
+    names = list(Customer.objects.values_list("name", flat=True)[:1000]) or ["Ana"]
+    today = date.today()
+
+    def stay(rng):
+        checkin = today + timedelta(days=rng.randrange(-30, 60))
+        return checkin, checkin + timedelta(days=rng.randint(1, 7))
+
+    def room_search(rng):
+        checkin, checkout = stay(rng)
+        return "post", reverse("search"), {"checkin": checkin, "checkout": checkout, "guests": rng.randint(1, 4)}
+
+    def booking_search(rng):
+        return "get", reverse("booking_search"), {"filter": rng.choice(names).split()[0][:3]}
+
+    def room_details(rng):
+        return "get", reverse("room_details", kwargs={"pk": rng.choice(room_ids)}), {}
+
+    def rooms(rng):
+        return "get", reverse("rooms"), {"q": "%s." % rng.randint(1, 5)}
+
+    def check_availability(rng):
+        checkin, checkout = stay(rng)
+        url = reverse("check_booking_availability", kwargs={"pk": rng.choice(booking_ids)})
+        return "post", url, {"checkin": checkin, "checkout": checkout}
+
+    found = [
+        Case("home", lambda rng: ("get", reverse("home"), {})),
+        Case("room_search", room_search),
+        Case("booking_search", booking_search),
+        # the figures are cached, every request measures the query behind them
+        Case("dashboard", lambda rng: ("get", reverse("dashboard"), {}), setup=dashboard.invalidate),
+        Case("room_details", room_details),
+        Case("rooms", rooms),
+        Case("check_booking_availability", check_availability),
+    ]
+    # cases that need rows the dataset does not have are left out
+    return [case for case in found
+            if (room_ids or case.name not in ("room_details",))
+            and (booking_ids or case.name != "check_booking_availability")]
+
+
+def run(repeat: int = 50, warmup: int = 3, seed: int = 0, only: Optional[List[str]] = None) -> Dict[str, dict]:
+    client = Client()
+    results = {}
+    for case in cases():
+        if only and case.name not in only:
+            continue
+        rng = random.Random(seed)
+        latencies, queries = [], []
+        for iteration in range(warmup + repeat):
+            method, url, data = case.request(rng)
+            if case.setup:
+                case.setup()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                raise AssertionError("%s answered %s for %s" % (case.name, response.status_code, url))
+            if iteration >= warmup:
+                latencies.append(elapsed * 1000)
+                queries.append(len(captured))
+        latencies.sort()
+        results[case.name] = {
+            "runs": repeat,
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "queries": max(queries),
+        }
+    return results
+
+
+def compare(baseline: Dict[str, dict], current: Dict[str, dict]) -> List[dict]:
+    """One row per view present in both runs, with the relative change of p50 and p95."""
+    rows = []
+    for name in sorted(set(baseline) & set(current)):
+        before, after = baseline[name], current[name]
+        row = {"view": name, "queries": (before["queries"], after["queries"])}
+        for metric in ("p50_ms", "p95_ms"):
+            change = (after[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+            row[metric] = (before[metric], after[metric], change)
+        change = row["p95_ms"][2] if abs(after["p95_ms"] - before["p95_ms"]) >= NOISE_MS else 0.0
+        if after["queries"] > before["queries"] or change > NOISE:
+            row["verdict"] = "slower"
+        elif after["queries"] < before["queries"] or change < -NOISE:
+            row["verdict"] = "faster"
+        else:
+            row["verdict"] = "same"
+        rows.append(row)
+    return rows
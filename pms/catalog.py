@@ -0,0 +1,114 @@
+"""In-process cache of the rooms and their types.
+
+The catalog changes a few times a year but is read on every room listing
+keystroke and booking form, so each process keeps it in memory as compact
+``__slots__`` objects, indexed by id and by lowercase name. The ``Room`` and
+``Room_type`` signals in ``pms.signals`` drop it once a change is committed,
+and the next read rebuilds it with one query.
+
+Signals only reach their own process, other workers pick up a change after
+``ROOM_CATALOG_TIMEOUT`` seconds at the latest; 0 rebuilds it on every read.
+"""
+import threading
+import time
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from . import routers
+from .models import Room
+
+
+class RoomTypeEntry:
+    __slots__ = ("id", "name", "price", "max_guests")
+
+    def __init__(self, id, name, price, max_guests):
+        self.id = id
+        self.name = name
+        self.price = price
+        self.max_guests = max_guests
+
+    def __str__(self):
+        return self.name
+
+
+class RoomEntry:
+    __slots__ = ("id", "name", "description", "room_type")
+
+    def __init__(self, id, name, description, room_type: Optional[RoomTypeEntry]):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.room_type = room_type
+
+    def __str__(self):
+        return self.name
+
+    def as_dict(self) -> dict:
+        # the shape RoomsView has always sent, as from values("id", "name", "room_type__name")
+        return {"id": self.id, "name": self.name,
+                "room_type__name": self.room_type.name if self.room_type else None}
+
+
+class RoomCatalog:
+    def __init__(self, rooms: List[RoomEntry]):
+        self.rooms = sorted(rooms, key=lambda room: room.name)
+        self.by_id: Dict[int, RoomEntry] = {room.id: room for room in rooms}
+        self.by_name: Dict[str, RoomEntry] = {room.name.lower(): room for room in rooms}
+        self.built = time.monotonic()
+
+    @classmethod
+    def from_db(cls) -> "RoomCatalog":
+        types: Dict[int, RoomTypeEntry] = {}
+        rooms = []
+        values = Room.objects.values_list("id", "name", "description", "room_type_id", "room_type__name",
+                                          "room_type__price", "room_type__max_guests")
+        for room_id, name, description, type_id, type_name, price, max_guests in values:
+            room_type = None
+            if type_id is not None:
+                room_type = types.get(type_id)
+                if room_type is None:
+                    room_type = types[type_id] = RoomTypeEntry(type_id, type_name, price, max_guests)
+            rooms.append(RoomEntry(room_id, name, description, room_type))
+        return cls(rooms)
+
+    def get(self, room_id) -> Optional[RoomEntry]:
+        try:
+            return self.by_id.get(int(room_id))
+        except (TypeError, ValueError):
+            return None
+
+    def filter(self, query: str = "") -> List[RoomEntry]:
+        """Rooms whose name contains ``query``, case-insensitively, by name."""
+        query = query.lower()
+        if not query:
+            return list(self.rooms)
+        return [room for room in self.rooms if query in room.name.lower()]
+
+    def __len__(self):
+        return len(self.rooms)
+
+
+_catalog: Optional[RoomCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> RoomCatalog:
+    global _catalog
+    timeout = getattr(settings, "ROOM_CATALOG_TIMEOUT", 300)
+    catalog = _catalog
+    if catalog is None or time.monotonic() - catalog.built >= timeout:
+        with _catalog_lock:
+            catalog = _catalog
+            if catalog is None or time.monotonic() - catalog.built >= timeout:
+                # kept for minutes, a lagging replica must not seed it
+                with routers.primary():
+                    catalog = _catalog = RoomCatalog.from_db()
+    return catalog
+
+
+def reset() -> None:
+    # drops the catalog, the next read rebuilds it from the database
+    global _catalog
+    with _catalog_lock:
+        _catalog = None
@@ -0,0 +1,96 @@
+"""Append-only log of booking changes, read as a feed by incremental consumers.
+
+Every booking write adds a ``BookingChange`` row in the same transaction:
+the model signals cover single saves, bulk writers (importer, customer
+dedup) record their own. The row id is the cursor: a consumer keeps the
+last id it read and asks for ``?after=<id>``, so a sync costs O(changes)
+whatever the size of the booking table.
+
+The cursor needs ids to become visible in the order they are handed out.
+SQLite guarantees it, a database has one writer at a time and the id is
+taken inside its transaction. With concurrent writers an id could commit
+after a higher one a consumer has already read past, so the app refuses to
+start (``check_database``) on any other database.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.core import checks
+from django.db import connections, router
+
+from .models import Booking, BookingChange, Customer
+from .occupancy import as_date
+
+CUSTOMER_FIELDS = ("id", "name", "email", "phone")
+
+
+def customer_data(customer: Optional[Customer]) -> Optional[dict]:
+    if customer is None:
+        return None
+    return {name: getattr(customer, name) for name in CUSTOMER_FIELDS}
+
+
+def snapshot(booking: Booking, customer: Optional[dict] = None) -> dict:
+    return {"code": booking.code, "state": booking.state, "room": booking.room_id,
+            "checkin": as_date(booking.checkin).isoformat(), "checkout": as_date(booking.checkout).isoformat(),
+            "guests": booking.guests, "total": booking.total, "customer": customer}
+
+
+def kind_of(previous: Optional[dict], booking: Booking) -> str:
+    # previous is the stay the rollups stored before the save (see signals)
+    if previous is None:
+        return BookingChange.CREATED
+    if booking.state == Booking.DELETED and previous["state"] != Booking.DELETED:
+        return BookingChange.CANCELLED
+    if (previous["checkin"], previous["checkout"]) != (as_date(booking.checkin), as_date(booking.checkout)):
+        return BookingChange.DATES
+    return BookingChange.UPDATED
+
+
+def record(booking: Booking, kind: str) -> BookingChange:
+    # must run in the transaction of the booking write
+    customer = customer_data(booking.customer) if booking.customer_id else None
+    return BookingChange.objects.create(booking_id=booking.id, kind=kind, data=snapshot(booking, customer))
+
+
+def record_many(bookings: Iterable[Booking], kind: str, customers: Dict[int, dict]) -> None:
+    # bulk writers pass the customers they already have, keyed by id
+    BookingChange.objects.bulk_create(
+        [BookingChange(booking_id=booking.id, kind=kind, data=snapshot(booking, customers.get(booking.customer_id)))
+         for booking in bookings])
+
+
+def record_removed(booking: Booking) -> None:
+    # archived or deleted bookings: the customer is not read again
+    BookingChange.objects.create(booking_id=booking.id, kind=BookingChange.REMOVED,
+                                 data=snapshot(booking, {"id": booking.customer_id}))
+
+
+def customer_changed(customer: Customer, booking_ids: Optional[List[int]] = None) -> None:
+    """Records a CUSTOMER change for the bookings of ``customer``, or only ``booking_ids``."""
+    bookings = Booking.objects.filter(customer_id=customer.id)
+    if booking_ids is not None:
+        bookings = bookings.filter(id__in=booking_ids)
+    record_many(bookings, BookingChange.CUSTOMER, {customer.id: customer_data(customer)})
+
+
+def check_database(app_configs=None, **kwargs) -> List[checks.CheckMessage]:
+    # system check, registered by PmsConfig
+    alias = router.db_for_write(BookingChange)
+    vendor = connections[alias].vendor
+    if vendor == "sqlite":
+        return []
+    return [checks.Error(
+        "The booking change feed needs SQLite, %r uses %s." % (alias, vendor),
+        hint="Change ids must commit in order for the ?after= cursor, only SQLite's single writer ensures it.",
+        obj="pms.changes",
+        id="pms.E001",
+    )]
+
+
+def feed(after: int = 0, limit: int = 500) -> Tuple[List[dict], bool]:
+    """Changes with an id above ``after``, oldest first, and whether more are waiting."""
+    rows = list(BookingChange.objects
+                .filter(id__gt=after)
+                .order_by("id")
+                .values("id", "booking_id", "kind", "changed", "data")[:limit + 1])
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,117 @@
+"""One Customer per guest, found again by ``Customer.identity_key``.
+
+The key is the lowercased email and the digits of the phone, so the same
+guest typing their details slightly differently is still recognised.
+Lookups run in the booking transaction; rows created before the key existed,
+or twice by concurrent bookings, are merged by the ``dedup_customers`` command.
+"""
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from django.db import transaction
+from django.db.models import Count
+
+from . import changes
+from .models import ArchivedBooking, Booking, Customer
+
+
+def build(name: str, email: str, phone: str) -> Customer:
+    # for bulk_create, which skips Customer.save
+    return Customer(name=name, email=email, phone=phone, identity_key=Customer.identity(email, phone))
+
+
+def get_or_create(name: str, email: str, phone: str) -> Customer:
+    """The oldest customer with the same identity, or a new one."""
+    key = Customer.identity(email, phone)
+    customer = Customer.objects.filter(identity_key=key).order_by("id").first() if key else None
+    if customer is None:
+        customer = Customer.objects.create(name=name, email=email, phone=phone)
+    return customer
+
+
+def existing(keys: Iterable[str]) -> Dict[str, int]:
+    """Customer id of each known key, the oldest one when there are several."""
+    ids: Dict[str, int] = {}
+    keys = [key for key in set(keys) if key]
+    for key, customer_id in (Customer.objects.filter(identity_key__in=keys)
+                             .order_by("-id").values_list("identity_key", "id")):
+        ids[key] = customer_id
+    return ids
+
+
+def fill_keys(batch_size: int = 1000) -> Iterator[int]:
+    """Sets the key of customers that have none, yields the count of each batch."""
+    last_id = 0
+    while True:
+        customers = list(Customer.objects.filter(identity_key="", id__gt=last_id)
+                         .order_by("id").only("id", "email", "phone")[:batch_size])
+        if not customers:
+            return
+        last_id = customers[-1].id
+        for customer in customers:
+            customer.identity_key = Customer.identity(customer.email, customer.phone)
+        Customer.objects.bulk_update(customers, ["identity_key"])
+        yield len(customers)
+
+
+def duplicated_keys() -> List[str]:
+    return list(Customer.objects
+                .exclude(identity_key="")
+                .values("identity_key")
+                .annotate(count=Count("id"))
+                .filter(count__gt=1)
+                .order_by("identity_key")
+                .values_list("identity_key", flat=True))
+
+
+def count_duplicated(batch_size: int = 1000) -> Tuple[int, int]:
+    """(customers without a key, keys with duplicates) as ``dedup`` would find them.
+
+    Missing keys are computed in memory, nothing is written.
+    """
+    counts = Counter(dict(Customer.objects
+                          .exclude(identity_key="")
+                          .values("identity_key")
+                          .annotate(count=Count("id"))
+                          .values_list("identity_key", "count")))
+    unkeyed = 0
+    for email, phone in (Customer.objects.filter(identity_key="")
+                         .values_list("email", "phone").iterator(chunk_size=batch_size)):
+        unkeyed += 1
+        key = Customer.identity(email, phone)
+        if key:
+            counts[key] += 1
+    return unkeyed, sum(1 for count in counts.values() if count > 1)
+
+
+def merge(keys: List[str]) -> int:
+    """Repoints the bookings of every duplicate to the oldest customer of its key.
+
+    Returns the number of customers removed.
+    """
+    keepers: Dict[str, int] = {}
+    duplicates: Dict[int, List[int]] = {}
+    with transaction.atomic():
+        for key, customer_id in (Customer.objects.filter(identity_key__in=keys)
+                                 .order_by("id").values_list("identity_key", "id")):
+            if key not in keepers:
+                keepers[key] = customer_id
+            else:
+                duplicates.setdefault(keepers[key], []).append(customer_id)
+        customers = Customer.objects.in_bulk(list(duplicates))
+        for keeper, ids in duplicates.items():
+            moved = list(Booking.objects.filter(customer_id__in=ids).values_list("id", flat=True))
+            Booking.objects.filter(id__in=moved).update(customer_id=keeper)
+            ArchivedBooking.objects.filter(customer_id__in=ids).update(customer_id=keeper)
+            # update() skips the signals, the feed learns about the moved bookings here
+            changes.customer_changed(customers[keeper], moved)
+        removed = [customer_id for ids in duplicates.values() for customer_id in ids]
+        Customer.objects.filter(id__in=removed).delete()
+    return len(removed)
+
+
+def dedup(batch_size: int = 500) -> Iterator[int]:
+    """Merges every duplicated key, ``batch_size`` keys per transaction."""
+    keys = duplicated_keys()
+    for start in range(0, len(keys), batch_size):
+        yield merge(keys[start:start + batch_size])
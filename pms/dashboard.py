@@ -0,0 +1,100 @@
+import logging
+from datetime import date, datetime, time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Func, Max, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from . import routers
+from .models import Booking, DailyRollup, Room, RoomNight
+
+DEFAULT_TIMEOUT = 30
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(day: date) -> str:
+    return "pms:dashboard:%s" % day.isoformat()
+
+
+def from_bookings(day: date) -> dict:
+    """Figures of the day read from the bookings, when the rollups cannot be trusted."""
+    day_range = (datetime.combine(day, time.min), datetime.combine(day, time.max))
+    created = Q(created__range=day_range)
+    active = ~Q(state=Booking.DELETED)
+    return (Booking.objects
+            # only rows created that day or still in the hotel, both indexed
+            .filter(created | Q(checkout__gte=day))
+            .aggregate(
+                new_bookings=Count("id", filter=created),
+                incoming_guests=Count("id", filter=Q(checkin=day) & active),
+                outcoming_guests=Count("id", filter=Q(checkout=day) & active),
+                invoiced=Sum("total", filter=created & active),
+                occupied_rooms=Count("id", filter=Q(checkin__lte=day, checkout__gt=day) & active),
+            ))
+
+
+def compute(day: date) -> dict:
+    """Figures of the day, read from the daily rollups in one query.
+
+    The rollups are adjusted by deltas on every booking write (see rollups),
+    so this reads the handful of rows of one date, one per room type,
+    however many bookings there are. The same query counts the nights of
+    the occupancy ledger: the rollups keep hard-deleted stays, so they never
+    count fewer occupied rooms than the ledger unless they missed bookings
+    (a database upgraded without ``backfill_rollups``, a write made around
+    the signals). The figures then come from the bookings and a warning is
+    logged. ``backfill_rollups --check`` compares every figure against a
+    full recompute.
+    """
+    # COUNT through Func so the subqueries are not grouped
+    rooms = Subquery(Room.objects.annotate(count=Func(F("id"), function="COUNT")).values("count"))
+    booked = Subquery(RoomNight.objects.filter(night=day).annotate(count=Func(F("id"), function="COUNT"))
+                      .values("count"))
+    figures = (DailyRollup.objects
+               .filter(date=day)
+               .aggregate(
+                   new_bookings=Coalesce(Sum("bookings_created"), 0),
+                   incoming_guests=Coalesce(Sum("arrivals"), 0),
+                   outcoming_guests=Coalesce(Sum("departures"), 0),
+                   invoiced=Sum("revenue"),
+                   occupied_rooms=Coalesce(Sum("occupied_rooms"), 0),
+                   # aggregate() only takes aggregates, Max over the constant
+                   # subqueries is NULL when the date has no rollups
+                   total_rooms=Coalesce(Max(rooms), rooms),
+                   booked_nights=Coalesce(Max(booked), booked),
+               ))
+    total_rooms = figures["total_rooms"]
+    if figures["occupied_rooms"] < figures["booked_nights"]:
+        logger.warning("daily rollups of %s miss bookings, run backfill_rollups", day)
+        figures.update(from_bookings(day))
+    occupied_rooms = figures["occupied_rooms"]
+    occupancy_rate = (occupied_rooms / total_rooms * 100) if total_rooms > 0 else 0
+    return {
+        'new_bookings': figures["new_bookings"],
+        'incoming_guests': figures["incoming_guests"],
+        'outcoming_guests': figures["outcoming_guests"],
+        'invoiced': {'total__sum': figures["invoiced"]},
+        'occupancy_rate': round(occupancy_rate, 2),  # Redondear a 2 decimales
+        'total_rooms': total_rooms,
+        'occupied_rooms': occupied_rooms,
+    }
+
+
+def snapshot(day: date = None) -> dict:
+    """Dashboard figures of the day, served from a short-lived cache."""
+    day = day or date.today()
+    key = cache_key(day)
+    figures = cache.get(key)
+    if figures is None:
+        # cached for every client, never from a replica that may lag
+        with routers.primary():
+            figures = compute(day)
+        cache.set(key, figures, getattr(settings, "DASHBOARD_CACHE_TIMEOUT", DEFAULT_TIMEOUT))
+    return figures
+
+
+def invalidate() -> None:
+    # only today's figures are cached, older keys expire on their own
+    cache.delete(cache_key(date.today()))
@@ -0,0 +1,74 @@
+"""Streaming booking export as CSV or JSON Lines.
+
+Rows are read with ``values_list(...).iterator()``, so the customer and room
+come from the same join and the database cursor is consumed in chunks: memory
+stays flat however many bookings match. The columns are the ones
+``importer`` reads, an export can be imported again. Archived bookings follow
+the live ones: each table is streamed on its own in primary key order, one
+after the other, rather than as a sorted union the database would have to
+materialize first.
+"""
+import csv
+import json
+from datetime import date
+from itertools import chain
+from typing import Iterator, List, Optional
+
+from django.db.models import Q, QuerySet
+
+from .importer import CSV, JSONL
+from .models import ArchivedBooking, Booking
+
+COLUMNS = ("code", "state", "room", "room_type", "checkin", "checkout", "guests", "total", "created",
+           "name", "email", "phone")
+# the queryset values behind COLUMNS, in the same order
+VALUES = ("code", "state", "room__name", "room__room_type__name", "checkin", "checkout", "guests", "total",
+          "created", "customer__name", "customer__email", "customer__phone")
+
+CONTENT_TYPES = {CSV: "text/csv", JSONL: "application/x-ndjson"}
+
+
+class Echo:
+    # file-like object for csv.writer that hands back each line instead of storing it
+    def write(self, value: str) -> str:
+        return value
+
+
+def bookings(start: Optional[date] = None, end: Optional[date] = None, state: Optional[str] = None,
+             room: Optional[str] = None) -> List[QuerySet]:
+    """Live and archived bookings whose stay overlaps [start, end], optionally for one state and room.
+
+    Two querysets of ``VALUES`` rows, live then archived, each ordered by id.
+    """
+    conditions = Q()
+    if start:
+        conditions &= Q(checkout__gt=start)
+    if end:
+        conditions &= Q(checkin__lte=end)
+    if state:
+        conditions &= Q(state=state)
+    if room:
+        room_filter = Q(room__name__iexact=room)
+        if room.isdigit():
+            room_filter |= Q(room_id=int(room))
+        conditions &= room_filter
+    return [model.objects.filter(conditions).order_by("id").values_list(*VALUES)
+            for model in (Booking, ArchivedBooking)]
+
+
+def rows(querysets: List[QuerySet], chunk_size: int = 2000) -> Iterator[dict]:
+    # the archive query only starts once the live rows are consumed
+    for values in chain.from_iterable(queryset.iterator(chunk_size=chunk_size) for queryset in querysets):
+        yield dict(zip(COLUMNS, values))
+
+
+def lines(querysets: List[QuerySet], fmt: str, chunk_size: int = 2000) -> Iterator[str]:
+    """The export one line at a time, header first for CSV."""
+    if fmt == JSONL:
+        for row in rows(querysets, chunk_size):
+            yield json.dumps(row, default=str) + "\n"
+        return
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows(querysets, chunk_size):
+        yield writer.writerow(row.values())
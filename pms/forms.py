@@ -19,6 +19,15 @@ class RoomSearchForm(ModelForm):
             'guests': forms.DateInput(attrs={'type': 'number', 'min': 1, 'max': 4}),
         }
 
+    def clean(self):
+        # the stay is priced night by night, it needs at least one
+        cleaned_data = super().clean()
+        checkin = cleaned_data.get("checkin")
+        checkout = cleaned_data.get("checkout")
+        if checkin and checkout and checkout <= checkin:
+            raise forms.ValidationError("La fecha de salida debe ser posterior a la fecha de entrada.")
+        return cleaned_data
+
 
 class CustomerForm(ModelForm):
     class Meta:
@@ -33,7 +42,8 @@ class CustomerForm(ModelForm):
 class BookingForm(ModelForm):
     class Meta:
         model = Booking
-        fields = "__all__"
+        # the code is drawn by the allocator when the booking is saved
+        exclude = ["code"]
         labels = {
         }
         widgets = {
@@ -0,0 +1,137 @@
+"""SQLite FTS5 index over booking code and customer name, email and phone.
+
+The ``pms_booking_fts`` table uses the booking id as rowid and is kept in sync
+by triggers on ``pms_booking``, ``pms_archivedbooking`` and ``pms_customer``.
+Archived bookings keep their id, so one index covers both tables. The
+migrations build the index from their own frozen copy of this SQL
+(``pms/migrations/_fts.py``), ``install`` runs after every migrate to
+restore anything missing.
+"""
+
+FTS_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS pms_booking_fts USING fts5(
+    code, name, email, phone,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+BOOKING_ROW = """
+SELECT b.id, b.code, c.name, c.email, c.phone
+FROM pms_booking b LEFT JOIN pms_customer c ON c.id = b.customer_id
+"""
+
+ARCHIVED_ROW = """
+SELECT b.id, b.code, c.name, c.email, c.phone
+FROM pms_archivedbooking b LEFT JOIN pms_customer c ON c.id = b.customer_id
+"""
+
+TRIGGERS = {
+    "pms_booking_fts_insert": """
+        CREATE TRIGGER IF NOT EXISTS pms_booking_fts_insert AFTER INSERT ON pms_booking BEGIN
+            INSERT INTO pms_booking_fts(rowid, code, name, email, phone)
+            """ + BOOKING_ROW + """ WHERE b.id = new.id;
+        END
+    """,
+    "pms_booking_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS pms_booking_fts_update AFTER UPDATE OF code, customer_id ON pms_booking BEGIN
+            DELETE FROM pms_booking_fts WHERE rowid = old.id;
+            INSERT INTO pms_booking_fts(rowid, code, name, email, phone)
+            """ + BOOKING_ROW + """ WHERE b.id = new.id;
+        END
+    """,
+    "pms_booking_fts_delete": """
+        CREATE TRIGGER IF NOT EXISTS pms_booking_fts_delete AFTER DELETE ON pms_booking BEGIN
+            DELETE FROM pms_booking_fts WHERE rowid = old.id;
+        END
+    """,
+    "pms_customer_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS pms_customer_fts_update AFTER UPDATE OF name, email, phone ON pms_customer BEGIN
+            UPDATE pms_booking_fts SET name = new.name, email = new.email, phone = new.phone
+            WHERE rowid IN (SELECT id FROM pms_booking WHERE customer_id = new.id);
+        END
+    """,
+    "pms_archivedbooking_fts_insert": """
+        CREATE TRIGGER IF NOT EXISTS pms_archivedbooking_fts_insert AFTER INSERT ON pms_archivedbooking BEGIN
+            INSERT INTO pms_booking_fts(rowid, code, name, email, phone)
+            """ + ARCHIVED_ROW + """ WHERE b.id = new.id;
+        END
+    """,
+    "pms_archivedbooking_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS pms_archivedbooking_fts_update
+        AFTER UPDATE OF code, customer_id ON pms_archivedbooking BEGIN
+            DELETE FROM pms_booking_fts WHERE rowid = old.id;
+            INSERT INTO pms_booking_fts(rowid, code, name, email, phone)
+            """ + ARCHIVED_ROW + """ WHERE b.id = new.id;
+        END
+    """,
+    "pms_archivedbooking_fts_delete": """
+        CREATE TRIGGER IF NOT EXISTS pms_archivedbooking_fts_delete AFTER DELETE ON pms_archivedbooking BEGIN
+            DELETE FROM pms_booking_fts WHERE rowid = old.id;
+        END
+    """,
+    "pms_customer_archive_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS pms_customer_archive_fts_update
+        AFTER UPDATE OF name, email, phone ON pms_customer BEGIN
+            UPDATE pms_booking_fts SET name = new.name, email = new.email, phone = new.phone
+            WHERE rowid IN (SELECT id FROM pms_archivedbooking WHERE customer_id = new.id);
+        END
+    """,
+}
+
+# tables a trigger needs, triggers are only created once all of them exist
+# (the archive table comes in a later migration than the index)
+TRIGGER_TABLES = {
+    "pms_booking_fts_insert": ("pms_booking",),
+    "pms_booking_fts_update": ("pms_booking",),
+    "pms_booking_fts_delete": ("pms_booking",),
+    "pms_customer_fts_update": ("pms_customer", "pms_booking"),
+    "pms_archivedbooking_fts_insert": ("pms_archivedbooking",),
+    "pms_archivedbooking_fts_update": ("pms_archivedbooking",),
+    "pms_archivedbooking_fts_delete": ("pms_archivedbooking",),
+    "pms_customer_archive_fts_update": ("pms_customer", "pms_archivedbooking"),
+}
+
+
+def supported(connection) -> bool:
+    return connection.vendor == "sqlite"
+
+
+def install(connection) -> None:
+    # creates the table and triggers that are missing, safe to run repeatedly
+    if not supported(connection):
+        return
+    with connection.cursor() as cursor:
+        tables = set(connection.introspection.table_names(cursor))
+        cursor.execute(FTS_TABLE)
+        for name, trigger in TRIGGERS.items():
+            if tables.issuperset(TRIGGER_TABLES[name]):
+                cursor.execute(trigger)
+
+
+def rebuild(connection) -> None:
+    # refills the index from the booking and archive tables
+    if not supported(connection):
+        return
+    with connection.cursor() as cursor:
+        tables = set(connection.introspection.table_names(cursor))
+        cursor.execute("DELETE FROM pms_booking_fts")
+        cursor.execute("INSERT INTO pms_booking_fts(rowid, code, name, email, phone) " + BOOKING_ROW)
+        if "pms_archivedbooking" in tables:
+            cursor.execute("INSERT INTO pms_booking_fts(rowid, code, name, email, phone) " + ARCHIVED_ROW)
+
+
+def drop_triggers(connection) -> None:
+    if not supported(connection):
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute("DROP TRIGGER IF EXISTS %s" % name)
+
+
+def uninstall(connection) -> None:
+    if not supported(connection):
+        return
+    drop_triggers(connection)
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS pms_booking_fts")
+
@@ -0,0 +1,69 @@
+"""Availability of every room over a window of dates.
+
+The active stays overlapping the window come from one range query, and each
+room's nights are kept as a Python int used as a bitset: bit ``i`` is set when
+the room is taken on ``start + i``. A stay is a single shift-and-or however
+long it is, so 500 rooms over a year cost a few hundred small ints.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List
+
+from django.utils.html import escape
+
+from . import catalog
+from .models import Booking
+
+MAX_DAYS = 365
+
+
+@dataclass
+class AvailabilityGrid:
+    start: date
+    days: int
+    rooms: list
+    bitmaps: Dict[int, int]
+
+    @classmethod
+    def build(cls, start: date, days: int) -> "AvailabilityGrid":
+        days = max(1, min(days, MAX_DAYS))
+        end = start + timedelta(days=days)
+        bitmaps: Dict[int, int] = {}
+        stays = (Booking.objects
+                 .filter(state=Booking.NEW, room__isnull=False, checkin__lt=end, checkout__gt=start)
+                 .values_list("room_id", "checkin", "checkout"))
+        for room_id, checkin, checkout in stays:
+            first = max((checkin - start).days, 0)
+            last = min((checkout - start).days, days)
+            bitmaps[room_id] = bitmaps.get(room_id, 0) | (((1 << (last - first)) - 1) << first)
+        return cls(start, days, catalog.get_catalog().rooms, bitmaps)
+
+    @property
+    def dates(self) -> List[date]:
+        return [self.start + timedelta(days=offset) for offset in range(self.days)]
+
+    def bits(self, room_id) -> str:
+        # "1" for every taken night, first night first
+        return format(self.bitmaps.get(room_id, 0), "0%sb" % self.days)[::-1]
+
+    def row(self, room_id) -> List[int]:
+        return [int(bit) for bit in self.bits(room_id)]
+
+    def as_json(self) -> dict:
+        return {
+            "start": self.start.isoformat(),
+            "days": self.days,
+            "dates": [day.isoformat() for day in self.dates],
+            "rooms": [{"id": room.id, "name": room.name,
+                       "room_type": room.room_type.name if room.room_type else None}
+                      for room in self.rooms],
+            "matrix": [self.row(room.id) for room in self.rooms],
+        }
+
+    def html_rows(self) -> List[str]:
+        # table rows built as strings, a template loop over every cell would
+        # take longer than the query
+        cells = {"0": '<td class="grid-free"></td>', "1": '<td class="grid-taken"></td>'}
+        return ['<tr><th scope="row">%s</th>%s</tr>' % (escape(room.name),
+                                                        "".join(cells[bit] for bit in self.bits(room.id)))
+                for room in self.rooms]
@@ -0,0 +1,252 @@
+"""Bulk booking import from CSV or JSON Lines.
+
+Rows are read as a stream and written in chunks: one overlap query, one code
+check and a few ``bulk_create`` calls per chunk, so memory stays flat however
+long the input is. ``bulk_create`` skips the model signals, the occupancy
+ledger, rollups, change feed and availability index are updated here
+instead. Rows with the email and phone of a known customer are booked under
+that customer.
+
+Expected columns: room (name or id), checkin, checkout (YYYY-MM-DD), guests,
+total, name, email, phone, and optionally code and state (NEW or DEL).
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from datetime import date
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, TextIO, Tuple
+
+from django.db import IntegrityError, transaction
+
+from . import availability, changes, customers, dashboard, memo, occupancy, rollups
+from .availability import RoomIntervals
+from .models import ArchivedBooking, Booking, BookingChange, Customer, Room, RoomNight
+from .reservation_code import allocator
+
+CSV = "csv"
+JSONL = "jsonl"
+# set on rows that could not even be decoded
+INVALID = "__invalid__"
+
+
+class RowError(Exception):
+    pass
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    rejected: int = 0
+
+
+@dataclass
+class ParsedRow:
+    line: int
+    raw: dict
+    room_id: int
+    checkin: date
+    checkout: date
+    guests: int
+    total: float
+    state: str
+    code: str
+    customer: Dict[str, str] = field(default_factory=dict)
+
+
+def read_rows(stream: TextIO, fmt: str) -> Iterator[dict]:
+    if fmt == CSV:
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            yield {"line": line.rstrip("\n"), INVALID: "invalid JSON: %s" % error}
+
+
+class RejectWriter:
+    # rejected rows go to a side file in the input format, with the reason
+    def __init__(self, stream: TextIO, fmt: str):
+        self.stream = stream
+        self.fmt = fmt
+        self.writer = None
+
+    def write(self, raw: dict, error: str) -> None:
+        row = {key: value for key, value in raw.items() if key != INVALID}
+        row["error"] = error
+        if self.fmt == JSONL:
+            self.stream.write(json.dumps(row, default=str) + "\n")
+            return
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.stream, fieldnames=list(row), extrasaction="ignore")
+            self.writer.writeheader()
+        self.writer.writerow(row)
+
+
+class BookingImporter:
+    def __init__(self, rejects: RejectWriter, chunk_size: int = 1000):
+        self.rejects = rejects
+        self.chunk_size = chunk_size
+        self.result = ImportResult()
+        rooms = list(Room.objects.values_list("id", "name", "room_type_id"))
+        self.room_ids = {name.strip().lower(): room_id for room_id, name, _ in rooms}
+        self.room_types = {room_id: room_type_id for room_id, _, room_type_id in rooms}
+
+    def run(self, rows: Iterable[dict]) -> ImportResult:
+        numbered = enumerate(rows, start=1)
+        while True:
+            chunk = list(islice(numbered, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+        return self.result
+
+    def reject(self, raw: dict, error: str) -> None:
+        self.result.rejected += 1
+        self.rejects.write(raw, error)
+
+    def parse(self, line: int, raw: dict) -> ParsedRow:
+        if INVALID in raw:
+            raise RowError(raw[INVALID])
+
+        def value(name):
+            text = str(raw.get(name) or "").strip()
+            if not text:
+                raise RowError("missing %s" % name)
+            return text
+
+        room = value("room")
+        room_id = int(room) if room.isdigit() and int(room) in self.room_types else self.room_ids.get(room.lower())
+        if room_id is None:
+            raise RowError("unknown room %s" % room)
+        try:
+            checkin = date.fromisoformat(value("checkin"))
+            checkout = date.fromisoformat(value("checkout"))
+            guests = int(value("guests"))
+            total = float(value("total"))
+        except ValueError as error:
+            raise RowError(str(error))
+        if checkout <= checkin:
+            raise RowError("checkout must be after checkin")
+        state = str(raw.get("state") or Booking.NEW).strip().upper()
+        if state not in (Booking.NEW, Booking.DELETED):
+            raise RowError("unknown state %s" % state)
+        return ParsedRow(
+            line=line, raw=raw, room_id=room_id, checkin=checkin, checkout=checkout,
+            guests=guests, total=total, state=state,
+            code=str(raw.get("code") or "").strip().upper(),
+            customer={"name": value("name"), "email": str(raw.get("email") or "").strip(),
+                      "phone": str(raw.get("phone") or "").strip()},
+        )
+
+    def existing_stays(self, rows: List[ParsedRow]) -> Dict[int, RoomIntervals]:
+        # one range query for every room and date of the chunk
+        stays: Dict[int, RoomIntervals] = {}
+        active = [row for row in rows if row.state == Booking.NEW]
+        if not active:
+            return stays
+        bookings = (Booking.objects
+                    .filter(room_id__in={row.room_id for row in active}, state=Booking.NEW,
+                            checkin__lt=max(row.checkout for row in active),
+                            checkout__gt=min(row.checkin for row in active))
+                    .values_list("id", "room_id", "checkin", "checkout"))
+        for booking_id, room_id, checkin, checkout in bookings:
+            stays.setdefault(room_id, RoomIntervals()).add(checkin.toordinal(), checkout.toordinal(), booking_id)
+        return stays
+
+    def taken_codes(self, rows: List[ParsedRow]) -> set:
+        codes = [row.code for row in rows if row.code]
+        if not codes:
+            return set()
+        # archived codes stay reserved, the booking could not be archived otherwise
+        return set(Booking.objects.filter(code__in=codes).values_list("code", flat=True)
+                   .union(ArchivedBooking.objects.filter(code__in=codes).values_list("code", flat=True)))
+
+    def import_chunk(self, chunk: List[Tuple[int, dict]]) -> None:
+        rows = []
+        for line, raw in chunk:
+            try:
+                rows.append(self.parse(line, raw))
+            except RowError as error:
+                self.reject(raw, str(error))
+
+        stays = self.existing_stays(rows)
+        taken = self.taken_codes(rows)
+        accepted = []
+        for row in rows:
+            if row.code and row.code in taken:
+                self.reject(row.raw, "code %s already exists" % row.code)
+                continue
+            if row.state == Booking.NEW:
+                intervals = stays.setdefault(row.room_id, RoomIntervals())
+                start, end = row.checkin.toordinal(), row.checkout.toordinal()
+                if intervals.conflicts(start, end):
+                    self.reject(row.raw, "room not available for these dates")
+                    continue
+                # later rows of the file see this one too
+                intervals.add(start, end, -row.line)
+            if row.code:
+                taken.add(row.code)
+            accepted.append(row)
+        if not accepted:
+            return
+
+        try:
+            self.save(accepted)
+        except IntegrityError as error:
+            for row in accepted:
+                self.reject(row.raw, "not saved: %s" % error)
+            return
+        self.result.imported += len(accepted)
+
+    def identity_keys(self, rows: List[ParsedRow]) -> List[str]:
+        # rows without email or phone get a customer of their own
+        return [Customer.identity(row.customer["email"], row.customer["phone"]) or "line:%s" % row.line
+                for row in rows]
+
+    def customer_ids(self, rows: List[ParsedRow]) -> Dict[str, int]:
+        # returning guests keep their customer, one query for the known ones
+        # and one bulk insert for the rest of the chunk
+        keys = self.identity_keys(rows)
+        ids = customers.existing(keys)
+        new = {}
+        for row, key in zip(rows, keys):
+            if key not in ids and key not in new:
+                new[key] = customers.build(**row.customer)
+        created = Customer.objects.bulk_create(list(new.values()))
+        ids.update((key, customer.id) for key, customer in zip(new, created))
+        return ids
+
+    def save(self, rows: List[ParsedRow]) -> None:
+        codes = iter(allocator.allocate(sum(1 for row in rows if not row.code)))
+        with transaction.atomic():
+            customer_ids = self.customer_ids(rows)
+            bookings = Booking.objects.bulk_create([
+                Booking(room_id=row.room_id, customer_id=customer_ids[key], checkin=row.checkin,
+                        checkout=row.checkout, guests=row.guests, total=row.total, state=row.state,
+                        code=row.code or next(codes))
+                for row, key in zip(rows, self.identity_keys(rows))])
+            RoomNight.objects.bulk_create(
+                [night for booking in bookings for night in occupancy.expected_nights(booking)])
+            stored = Customer.objects.filter(id__in=set(customer_ids.values())).values(*changes.CUSTOMER_FIELDS)
+            changes.record_many(bookings, BookingChange.CREATED, {row["id"]: row for row in stored})
+            rollups.apply(rollups.recompute(
+                rollups.stay(booking.created, booking.state, booking.checkin, booking.checkout,
+                             booking.total, self.room_types.get(booking.room_id))
+                for booking in bookings))
+            stays = [(b.id, b.room_id, b.state, b.checkin, b.checkout) for b in bookings]
+
+            def committed():
+                for stay in stays:
+                    availability.booking_changed(*stay)
+                memo.rooms_changed(stay[1] for stay in stays)
+                dashboard.invalidate()
+            transaction.on_commit(committed)
+
+
+def import_bookings(stream: TextIO, fmt: str, rejects: TextIO, chunk_size: int = 1000) -> ImportResult:
+    importer = BookingImporter(RejectWriter(rejects, fmt), chunk_size=chunk_size)
+    return importer.run(read_rows(stream, fmt))
@@ -0,0 +1,31 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pms import archive
+
+
+class Command(BaseCommand):
+    help = "Moves bookings whose checkout is older than --days days to the archive table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=365,
+                            help="archive stays that left more than this many days ago")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="bookings moved per transaction")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="only count the bookings that would be archived")
+
+    def handle(self, *args, **options):
+        if options["days"] < 1:
+            raise CommandError("--days must be at least 1, stays still running are never archived")
+        before = date.today() - timedelta(days=options["days"])
+        if options["dry_run"]:
+            count = archive.candidates(before).count()
+            self.stdout.write("%s bookings left before %s" % (count, before))
+            return
+        moved = 0
+        for count in archive.archive(before, batch_size=options["batch_size"]):
+            moved += count
+            self.stdout.write("%s bookings archived" % moved)
+        self.stdout.write(self.style.SUCCESS("Bookings archived, %s moved" % moved))
@@ -0,0 +1,43 @@
+from itertools import chain
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from pms import rollups
+from pms.models import ArchivedBooking, Booking, DailyRollup
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the daily rollups from every booking, or compares them with a recompute with --check. "
+            "Booking writes made while it runs may be lost, run it when the desk is quiet.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000,
+                            help="bookings read per database round-trip")
+        parser.add_argument("--check", action="store_true",
+                            help="only report drift, do not write to the rollups")
+
+    def handle(self, *args, **options):
+        # totals are kept per date and room type, memory does not grow with bookings
+        # archived bookings are history the rollups keep
+        stays = chain.from_iterable(model.objects
+                                    .values_list(*rollups.STAY_FIELDS)
+                                    .iterator(chunk_size=options["batch_size"])
+                                    for model in (Booking, ArchivedBooking))
+        totals = rollups.recompute(rollups.stay(*values) for values in stays)
+        if options["check"]:
+            drifted = 0
+            for (day, room_type), field, stored, expected in rollups.drift(totals):
+                drifted += 1
+                self.stdout.write("drift on %s, room type %s: %s is %s, expected %s"
+                                  % (day, room_type, field, stored, expected))
+            if drifted:
+                raise CommandError("%s daily figures out of sync with the bookings" % drifted)
+            self.stdout.write(self.style.SUCCESS("Daily rollups in sync"))
+            return
+        rows = [DailyRollup(date=day, room_type_id=room_type, **{f: figures[f] for f in rollups.FIELDS})
+                for (day, room_type), figures in totals.items()]
+        with transaction.atomic():
+            DailyRollup.objects.all().delete()
+            DailyRollup.objects.bulk_create(rows, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("Daily rollups rebuilt, %s rows" % len(rows)))
@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pms.benchmarks.database import scratch_database
+from pms.models import Booking
+from pms.reservation_code import allocator, generate
+
+
+class Command(BaseCommand):
+    help = "Measures reservation code allocation throughput against a scratch database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--existing", type=int, default=1_000_000,
+                            help="bookings seeded before measuring")
+        parser.add_argument("--block", type=int, default=10_000,
+                            help="codes requested per bulk allocation")
+        parser.add_argument("--rounds", type=int, default=5,
+                            help="bulk allocations measured")
+        parser.add_argument("--singles", type=int, default=1_000,
+                            help="single bookings saved through the allocator")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.seed(options["existing"])
+            self.bench_blocks(options["block"], options["rounds"])
+            self.bench_singles(options["singles"])
+
+    def seed(self, existing):
+        started = time.perf_counter()
+        codes = set()
+        batch = []
+        with transaction.atomic():
+            while len(codes) < existing:
+                code = generate.get()
+                if code in codes:
+                    continue
+                codes.add(code)
+                batch.append(Booking(checkin="2024-01-01", checkout="2024-01-02",
+                                     guests=1, total=0, code=code, state=Booking.DELETED))
+                if len(batch) == 5000:
+                    Booking.objects.bulk_create(batch)
+                    batch = []
+            Booking.objects.bulk_create(batch)
+        self.stdout.write("seeded %s bookings in %.1fs" % (existing, time.perf_counter() - started))
+
+    def bench_blocks(self, block, rounds):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            codes = allocator.allocate(block)
+            assert len(set(codes)) == block
+        elapsed = time.perf_counter() - started
+        self.stdout.write("bulk allocation: %s codes in %.2fs, %.0f codes/s"
+                          % (block * rounds, elapsed, block * rounds / elapsed))
+
+    def bench_singles(self, singles):
+        started = time.perf_counter()
+        with transaction.atomic():
+            for _ in range(singles):
+                allocator.save_booking(Booking(checkin="2024-01-01", checkout="2024-01-02",
+                                               guests=1, total=0, state=Booking.DELETED))
+        elapsed = time.perf_counter() - started
+        self.stdout.write("single inserts: %s bookings in %.2fs, %.0f bookings/s"
+                          % (singles, elapsed, singles / elapsed))
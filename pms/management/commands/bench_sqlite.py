@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+
+from pms import dashboard, reservations, search
+from pms.benchmarks import datagen
+from pms.benchmarks.database import scratch_database
+from pms.models import Booking, Customer, Room
+from pms.sqlite import PROFILES
+
+
+class Command(BaseCommand):
+    help = ("Measures mixed read/write throughput on a scratch SQLite file "
+            "under each pragma profile, reader and writer processes running at once")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+        parser.add_argument("--readers", type=int, default=4, help="processes reading the home list and dashboard")
+        parser.add_argument("--writers", type=int, default=2, help="processes creating bookings")
+        parser.add_argument("--seconds", type=float, default=5.0, help="measured time per profile")
+        parser.add_argument("--bookings", type=int, default=20_000, help="bookings seeded before measuring")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            self.stderr.write("the pragma profiles only apply to SQLite")
+            return
+        for profile in options["profiles"]:
+            with tempfile.TemporaryDirectory() as directory, override_settings(SQLITE_PROFILE=profile):
+                # the journal mode is stored in the file, every profile gets a new one
+                with scratch_database(name=os.path.join(directory, "bench.sqlite3")):
+                    connection.close()
+                    datagen.generate(datagen.DatasetSize(rooms=100, bookings=options["bookings"],
+                                                         customers=2000))
+                    counts = self.run_mix(options["readers"], options["writers"], options["seconds"])
+            elapsed = options["seconds"]
+            self.stdout.write("%-11s reads %7.0f/s  writes %6.0f/s  locked errors %s" % (
+                profile, counts["reads"] / elapsed, counts["writes"] / elapsed, counts["locked"]))
+
+    def run_mix(self, readers, writers, seconds):
+        # processes rather than threads: threads of one process would measure
+        # the interpreter lock, not the database locks
+        context = multiprocessing.get_context("fork")
+        counts = {name: context.Value("i", 0) for name in ("reads", "writes", "locked")}
+        room_ids = list(Room.objects.values_list("id", flat=True))
+        connections.close_all()
+        stop = time.time() + seconds
+        workers = ([context.Process(target=_read, args=(counts, stop)) for _ in range(readers)]
+                   + [context.Process(target=_write, args=(counts, stop, room_ids, seed)) for seed in range(writers)])
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return {name: value.value for name, value in counts.items()}
+
+
+def _count(counts, name):
+    with counts[name].get_lock():
+        counts[name].value += 1
+
+
+def _read(counts, stop):
+    # what the home page and the dashboard read
+    while time.time() < stop:
+        try:
+            list(Booking.objects.select_related("customer", "room").order_by(*search.LIST_ORDERING)[:50])
+            dashboard.compute(date.today())
+            _count(counts, "reads")
+        except OperationalError:
+            _count(counts, "locked")
+
+
+def _write(counts, stop, room_ids, seed):
+    rng = random.Random(seed)
+    while time.time() < stop:
+        checkin = date.today() + timedelta(days=rng.randrange(400, 4000))
+        booking = Booking(room_id=rng.choice(room_ids), checkin=checkin,
+                          checkout=checkin + timedelta(days=rng.randint(1, 4)), guests=1, total=0)
+        try:
+            booking.customer = Customer.objects.create(name="Bench", email="b@x.com", phone="0")
+            reservations.create_booking(booking)
+            _count(counts, "writes")
+        except reservations.RoomUnavailable:
+            _count(counts, "writes")
+        except OperationalError:
+            _count(counts, "locked")
@@ -0,0 +1,73 @@
+import json
+import platform
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from pms.benchmarks import datagen, views
+from pms.benchmarks.database import scratch_database
+
+
+class Command(BaseCommand):
+    help = ("Times the pms views against a seeded synthetic dataset on a scratch database, "
+            "or compares two result files")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=500)
+        parser.add_argument("--bookings", type=int, default=1_000_000)
+        parser.add_argument("--customers", type=int, default=200_000)
+        parser.add_argument("--seed", type=int, default=0, help="seeds the dataset and the requests")
+        parser.add_argument("--repeat", type=int, default=50, help="measured requests per view")
+        parser.add_argument("--only", nargs="+", help="views to measure, all of them by default")
+        parser.add_argument("--output", help="JSON file the results are written to")
+        parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                            help="compares two result files instead of measuring")
+
+    def handle(self, *args, **options):
+        if options["compare"]:
+            return self.compare(*options["compare"])
+
+        size = datagen.DatasetSize(options["rooms"], options["bookings"], options["customers"], options["seed"])
+        setup_test_environment()
+        try:
+            with scratch_database():
+                started = time.perf_counter()
+                datagen.generate(size, stdout=self.stdout if options["verbosity"] > 1 else None)
+                self.stdout.write("seeded %s rooms, %s bookings in %.1fs"
+                                  % (size.rooms, size.bookings, time.perf_counter() - started))
+                results = views.run(options["repeat"], seed=options["seed"], only=options["only"])
+        finally:
+            teardown_test_environment()
+
+        for name, result in results.items():
+            self.stdout.write("%-28s p50 %8.2f ms  p95 %8.2f ms  %3s queries"
+                              % (name, result["p50_ms"], result["p95_ms"], result["queries"]))
+        if options["output"]:
+            report = {
+                "dataset": {"rooms": size.rooms, "bookings": size.bookings,
+                            "customers": size.customers, "seed": size.seed},
+                "environment": {"python": platform.python_version(), "django": django.get_version()},
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS("results written to %s" % options["output"]))
+
+    def compare(self, baseline_path, current_path):
+        try:
+            with open(baseline_path) as baseline, open(current_path) as current:
+                baseline, current = json.load(baseline), json.load(current)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        if baseline["dataset"] != current["dataset"]:
+            self.stderr.write("the runs used different datasets, the comparison is only indicative")
+        for row in views.compare(baseline["results"], current["results"]):
+            style = {"slower": self.style.ERROR, "faster": self.style.SUCCESS}.get(row["verdict"], str)
+            self.stdout.write(style("%-28s p50 %8.2f -> %8.2f ms (%+.0f%%)  p95 %8.2f -> %8.2f ms (%+.0f%%)  "
+                                    "queries %s -> %s  %s" % (
+                                        row["view"], row["p50_ms"][0], row["p50_ms"][1], row["p50_ms"][2] * 100,
+                                        row["p95_ms"][0], row["p95_ms"][1], row["p95_ms"][2] * 100,
+                                        row["queries"][0], row["queries"][1], row["verdict"])))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from pms import customers
+
+
+class Command(BaseCommand):
+    help = "Merges customers with the same email and phone, their bookings move to the oldest one"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="identities merged per transaction")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="only count the duplicated identities")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if options["dry_run"]:
+            unkeyed, duplicated = customers.count_duplicated(batch_size)
+            if unkeyed:
+                self.stdout.write("%s customers without identity key would be updated" % unkeyed)
+            self.stdout.write("%s identities with duplicates" % duplicated)
+            return
+        filled = sum(customers.fill_keys(batch_size))
+        if filled:
+            self.stdout.write("%s customers without identity key updated" % filled)
+        removed = 0
+        for count in customers.dedup(batch_size):
+            removed += count
+            self.stdout.write("%s duplicates merged" % removed)
+        self.stdout.write(self.style.SUCCESS("Customers deduplicated, %s removed" % removed))
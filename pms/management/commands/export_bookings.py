@@ -0,0 +1,33 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pms import exporter
+
+
+class Command(BaseCommand):
+    help = "Streams bookings as CSV or JSON Lines to a file or stdout"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=[exporter.CSV, exporter.JSONL], default=exporter.CSV)
+        parser.add_argument("--output", help="file to write, stdout by default")
+        parser.add_argument("--start", type=date.fromisoformat, help="stays leaving after this date (YYYY-MM-DD)")
+        parser.add_argument("--end", type=date.fromisoformat, help="stays arriving up to this date (YYYY-MM-DD)")
+        parser.add_argument("--state", help="only bookings in this state (NEW or DEL)")
+        parser.add_argument("--room", help="room name or id")
+        parser.add_argument("--chunk-size", type=int, default=2000,
+                            help="bookings read per database round-trip")
+
+    def handle(self, *args, **options):
+        bookings = exporter.bookings(options["start"], options["end"], options["state"], options["room"])
+        lines = exporter.lines(bookings, options["format"], chunk_size=options["chunk_size"])
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        try:
+            with open(options["output"], "w", newline="", encoding="utf-8") as output:
+                output.writelines(lines)
+        except OSError as error:
+            raise CommandError(error)
+        self.stderr.write(self.style.SUCCESS("Bookings exported to %s" % options["output"]))
@@ -0,0 +1,35 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pms import importer
+
+
+class Command(BaseCommand):
+    help = "Imports bookings from a CSV or JSON Lines file, rejected rows go to a side file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file with one booking per row")
+        parser.add_argument("--format", choices=[importer.CSV, importer.JSONL],
+                            help="input format, guessed from the file extension by default")
+        parser.add_argument("--rejects", help="where to write rejected rows (default: <path>.rejects)")
+        parser.add_argument("--chunk-size", type=int, default=1000,
+                            help="rows written per transaction")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"]
+        if fmt is None:
+            extension = os.path.splitext(path)[1].lower()
+            fmt = importer.JSONL if extension in (".jsonl", ".ndjson", ".json") else importer.CSV
+        rejects_path = options["rejects"] or path + ".rejects"
+        try:
+            with open(path, newline="", encoding="utf-8") as stream, \
+                    open(rejects_path, "w", newline="", encoding="utf-8") as rejects:
+                result = importer.import_bookings(stream, fmt, rejects, chunk_size=options["chunk_size"])
+        except OSError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            "%s bookings imported, %s rejected" % (result.imported, result.rejected)))
+        if result.rejected:
+            self.stdout.write("Rejected rows written to %s" % rejects_path)
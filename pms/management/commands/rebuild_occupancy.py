@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from pms import occupancy
+from pms.models import Booking, RoomNight
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-night occupancy ledger from Booking, or checks it for drift with --check"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="only report drift, do not write to the ledger")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="bookings processed per transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        check = options["check"]
+        drifted = 0
+        last_id = 0
+        # walk the bookings by id so memory stays flat however big the table is
+        while True:
+            bookings = list(Booking.objects
+                            .filter(id__gt=last_id)
+                            .order_by("id")
+                            .only("id", "room_id", "state", "checkin", "checkout")[:batch_size])
+            if not bookings:
+                break
+            first_id, last_id = bookings[0].id, bookings[-1].id
+            expected = {(n.booking_id, n.room_id, n.night)
+                        for booking in bookings for n in occupancy.expected_nights(booking)}
+            ledger = RoomNight.objects.filter(booking_id__gte=first_id, booking_id__lte=last_id)
+            actual = set(ledger.values_list("booking_id", "room_id", "night"))
+            if expected == actual:
+                continue
+            stale = {row[0] for row in expected ^ actual}
+            drifted += len(stale)
+            if check:
+                for booking_id in sorted(stale):
+                    self.stdout.write("drift in booking %s" % booking_id)
+                continue
+            with transaction.atomic():
+                ledger.delete()
+                RoomNight.objects.bulk_create(
+                    RoomNight(booking_id=booking_id, room_id=room_id, night=night)
+                    for booking_id, room_id, night in expected)
+
+        if check and drifted:
+            raise CommandError("%s bookings out of sync with the occupancy ledger" % drifted)
+        if check:
+            self.stdout.write(self.style.SUCCESS("Occupancy ledger in sync"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Occupancy ledger rebuilt, %s bookings fixed" % drifted))
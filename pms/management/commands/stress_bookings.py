@@ -0,0 +1,125 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from pms import reservations
+from pms.benchmarks.database import scratch_database
+from pms.models import Booking, Customer, Room, Room_type
+
+# active bookings of a room sharing at least one night
+DOUBLE_BOOKINGS = """
+    SELECT COUNT(*) FROM pms_booking a JOIN pms_booking b
+      ON a.room_id = b.room_id AND a.id < b.id
+     AND a.checkin < b.checkout AND b.checkin < a.checkout
+   WHERE a.state = 'NEW' AND b.state = 'NEW'
+"""
+
+
+class Command(BaseCommand):
+    help = ("Books and cancels a few rooms from many threads at once on a scratch database "
+            "and checks that no room ends up booked twice")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--attempts", type=int, default=200, help="bookings tried per thread")
+        parser.add_argument("--cancellers", type=int, default=2,
+                            help="threads cancelling bookings while the others book")
+        parser.add_argument("--rooms", type=int, default=20)
+        parser.add_argument("--days", type=int, default=365, help="dates the stays are drawn from")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, "stress.sqlite3") if connection.vendor == "sqlite" else None
+            with scratch_database(name=name):
+                room_ids = self.seed(options["rooms"])
+                started = time.perf_counter()
+                outcomes = self.hammer(room_ids, options["threads"], options["attempts"], options["days"],
+                                       options["cancellers"])
+                elapsed = time.perf_counter() - started
+                with connection.cursor() as cursor:
+                    cursor.execute(DOUBLE_BOOKINGS)
+                    doubles = cursor.fetchone()[0]
+
+        tried = options["threads"] * options["attempts"]
+        self.stdout.write("%s attempts from %s threads in %.2fs, %.0f attempts/s"
+                          % (tried, options["threads"], elapsed, tried / elapsed))
+        self.stdout.write("booked %(booked)s, rejected as taken %(taken)s, cancelled %(cancelled)s, "
+                          "failed %(failed)s" % outcomes)
+        self.stdout.write("%.0f bookings/s" % (outcomes["booked"] / elapsed))
+        if doubles:
+            raise CommandError("%s overlapping pairs of active bookings" % doubles)
+        self.stdout.write(self.style.SUCCESS("no double bookings"))
+
+    def seed(self, rooms):
+        room_type = Room_type.objects.create(name="Stress", price=30.0, max_guests=2)
+        return [Room.objects.create(name="Stress %s" % number, room_type=room_type).id
+                for number in range(rooms)]
+
+    def hammer(self, room_ids, threads, attempts, days, cancellers=0):
+        outcomes = {"booked": 0, "taken": 0, "cancelled": 0, "failed": 0}
+        counter_lock = threading.Lock()
+        start = date.today()
+        booked = []
+        bookers_done = threading.Event()
+
+        def count(outcome):
+            with counter_lock:
+                outcomes[outcome] += 1
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(attempts):
+                    checkin = start + timedelta(days=rng.randrange(days))
+                    booking = Booking(room_id=rng.choice(room_ids), checkin=checkin,
+                                      checkout=checkin + timedelta(days=rng.randint(1, 4)), guests=1, total=0,
+                                      customer=Customer.objects.create(name="Stress", email="s@x.com", phone="0"))
+                    try:
+                        reservations.create_booking(booking)
+                        with counter_lock:
+                            booked.append(booking.id)
+                        outcome = "booked"
+                    except reservations.RoomUnavailable:
+                        outcome = "taken"
+                    except OperationalError:
+                        # busy timeout expired
+                        outcome = "failed"
+                    count(outcome)
+            finally:
+                connections.close_all()
+
+        def canceller(seed):
+            # cancels bookings made by the other threads while they keep booking
+            rng = random.Random(-seed - 1)
+            try:
+                while not bookers_done.is_set():
+                    with counter_lock:
+                        booking_id = booked.pop(rng.randrange(len(booked))) if booked else None
+                    if booking_id is None:
+                        time.sleep(0.001)
+                        continue
+                    try:
+                        reservations.cancel_booking(booking_id)
+                        outcome = "cancelled"
+                    except OperationalError:
+                        outcome = "failed"
+                    count(outcome)
+            finally:
+                connections.close_all()
+
+        bookers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+        cancelling = [threading.Thread(target=canceller, args=(seed,)) for seed in range(cancellers)]
+        for thread in bookers + cancelling:
+            thread.start()
+        for thread in bookers:
+            thread.join()
+        bookers_done.set()
+        for thread in cancelling:
+            thread.join()
+        return outcomes
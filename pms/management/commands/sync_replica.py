@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ("Copies the primary SQLite database onto the SQLite replicas, "
+            "for trying the replica routing locally")
+
+    def handle(self, *args, **options):
+        source = connections[DEFAULT_DB_ALIAS]
+        aliases = getattr(settings, "DATABASE_REPLICAS", [])
+        if not aliases:
+            raise CommandError("no DATABASE_REPLICAS configured, set PMS_REPLICA_DB to add one")
+        source.ensure_connection()
+        for alias in aliases:
+            target = connections[alias]
+            if source.vendor != "sqlite" or target.vendor != "sqlite":
+                raise CommandError("%s is not SQLite, real replicas are fed by the database itself" % alias)
+            target.ensure_connection()
+            # online backup: a consistent copy even while the primary is written
+            source.connection.backup(target.connection)
+            self.stdout.write(self.style.SUCCESS("%s copied to %s" % (source.settings_dict["NAME"], alias)))
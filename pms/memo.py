@@ -0,0 +1,145 @@
+"""Memoized availability checks, invalidated by per-room versions.
+
+The AJAX date check sends the same (room, checkin, checkout) again and again
+while a form is edited. Answers are kept in a per-process LRU keyed on the
+question and on the room's version, a token in the Django cache replaced
+once any booking write of the room is committed. A changed room never
+matches its old entries, so an answer is either current or not found, and a
+repeated check costs one cache read and a dictionary lookup.
+
+The version is read before the answer is computed: a write committed in
+between replaces the version and leaves the new entry unreachable. Every
+worker process must see the versions the others replace, so the memo only
+runs on a cache shared between them (memcached, Redis, files); with a
+per-process cache (LocMemCache) or one that keeps nothing (DummyCache)
+checks go straight to the database. ``AVAILABILITY_MEMO_CACHE`` names the
+cache alias, ``default`` unless set.
+
+Only the SQL availability backend is memoized, the memory one already
+answers from a dictionary.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import availability
+
+DEFAULT_SIZE = 4096
+
+# backends another worker process never reads from
+UNSHARED_BACKENDS = (DummyCache, LocMemCache)
+
+
+def version_key(room_id) -> str:
+    return "pms:availability:room:%s:version" % room_id
+
+
+def version_cache():
+    return caches[getattr(settings, "AVAILABILITY_MEMO_CACHE", DEFAULT_CACHE_ALIAS)]
+
+
+def room_version(room_id) -> Optional[str]:
+    """Current version token of the room, None when the cache is not shared."""
+    cache = version_cache()
+    if isinstance(cache, UNSHARED_BACKENDS):
+        return None
+    key = version_key(room_id)
+    version = cache.get(key)
+    if version is None:
+        # first check of the room since the cache lost it, any fresh token works
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def rooms_changed(room_ids: Iterable) -> None:
+    # called on commit of a booking write, entries of older versions are left to the LRU
+    cache = version_cache()
+    if isinstance(cache, UNSHARED_BACKENDS):
+        return
+    for room_id in {room_id for room_id in room_ids if room_id is not None}:
+        cache.set(version_key(room_id), uuid.uuid4().hex, timeout=None)
+
+
+class AvailabilityMemo:
+    def __init__(self, size: int = DEFAULT_SIZE):
+        self.size = size
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def get(self, room_id, checkin, checkout, exclude, compute: Callable[[], List[int]]) -> List[int]:
+        version = room_version(room_id)
+        if version is None or self.size <= 0:
+            with self.lock:
+                self.bypassed += 1
+            return compute()
+        key = (room_id, checkin, checkout, exclude, version)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return list(self.entries[key])
+            self.misses += 1
+        # computed outside the lock, two threads asking the same may both compute
+        value = compute()
+        with self.lock:
+            self.entries[key] = tuple(value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed,
+                    "evictions": self.evictions, "entries": len(self.entries), "size": self.size,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+_memo: Optional[AvailabilityMemo] = None
+_memo_lock = threading.Lock()
+
+
+def get_memo() -> AvailabilityMemo:
+    global _memo
+    if _memo is None:
+        with _memo_lock:
+            if _memo is None:
+                _memo = AvailabilityMemo(getattr(settings, "AVAILABILITY_MEMO_SIZE", DEFAULT_SIZE))
+    return _memo
+
+
+def reset() -> None:
+    # drops the entries and the statistics of this process
+    global _memo
+    with _memo_lock:
+        _memo = None
+
+
+def conflicting_bookings(room_id, checkin, checkout, exclude=None) -> List[int]:
+    """``availability.conflicting_bookings`` through the memo."""
+    def compute():
+        return availability.conflicting_bookings(room_id, checkin, checkout, exclude)
+    if availability.uses_memory():
+        return compute()
+    return get_memo().get(room_id, checkin, checkout, exclude, compute)
+
+
+def is_room_free(room_id, checkin, checkout, exclude=None) -> bool:
+    return not conflicting_bookings(room_id, checkin, checkout, exclude)
+
+
+def stats() -> Dict[str, float]:
+    return get_memo().stats()
@@ -0,0 +1,77 @@
+"""Per-request database instrumentation.
+
+``QueryBudgetMiddleware`` counts the queries of every request and the time
+spent in them, on all database connections. The figures go out as a
+``Server-Timing`` header and as one ``pms.queries`` log record per request,
+and are checked against ``QUERY_BUDGETS``, the most queries each URL name may
+run. With ``QUERY_BUDGET_STRICT`` (on under tests) a request over budget
+raises ``QueryBudgetExceeded``, so an N+1 fails the suite instead of reaching
+production.
+
+Streamed responses are measured up to the point the view returns, queries
+run while the body is streamed are not counted.
+"""
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("pms.queries")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    # execute_wrapper callable, installed on every connection for one request
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.duration += time.perf_counter() - started
+
+
+def get_budget(url_name):
+    budgets = getattr(settings, "QUERY_BUDGETS", {})
+    return budgets.get(url_name, getattr(settings, "QUERY_BUDGET_DEFAULT", None))
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        url_name = match.url_name if match else None
+        budget = get_budget(url_name)
+        response["Server-Timing"] = 'db;dur=%.1f;desc="%s queries", total;dur=%.1f' % (
+            counter.duration * 1000, counter.queries, total * 1000)
+        over = budget is not None and counter.queries > budget
+        logger.log(logging.WARNING if over else logging.DEBUG,
+                   "%s %s queries=%s db_ms=%.1f total_ms=%.1f budget=%s",
+                   request.method, url_name or request.path, counter.queries,
+                   counter.duration * 1000, total * 1000, budget,
+                   extra={"url_name": url_name, "path": request.path, "method": request.method,
+                          "queries": counter.queries, "db_ms": round(counter.duration * 1000, 1),
+                          "total_ms": round(total * 1000, 1), "budget": budget})
+        if over and getattr(settings, "QUERY_BUDGET_STRICT", False):
+            raise QueryBudgetExceeded("%s ran %s queries, its budget is %s"
+                                      % (url_name or request.path, counter.queries, budget))
+        return response
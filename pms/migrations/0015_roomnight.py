@@ -0,0 +1,51 @@
+# Generated by Django 4.0.2 on 2026-10-18 05:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+from datetime import timedelta
+
+
+def fill_ledger(apps, schema_editor):
+    Booking = apps.get_model('pms', 'Booking')
+    RoomNight = apps.get_model('pms', 'RoomNight')
+    rows = []
+    bookings = (Booking.objects
+                .filter(state='NEW', room__isnull=False)
+                .values_list('id', 'room_id', 'checkin', 'checkout'))
+    for booking_id, room_id, checkin, checkout in bookings.iterator():
+        night = checkin
+        while night < checkout:
+            rows.append(RoomNight(booking_id=booking_id, room_id=room_id, night=night))
+            night += timedelta(days=1)
+        if len(rows) >= 1000:
+            RoomNight.objects.bulk_create(rows)
+            rows = []
+    RoomNight.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pms', '0014_alter_booking_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pms.booking')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pms.room')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='roomnight',
+            index=models.Index(fields=['night', 'room'], name='roomnight_night_room_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='roomnight',
+            constraint=models.UniqueConstraint(fields=('booking', 'night'), name='roomnight_booking_night_uniq'),
+        ),
+        migrations.RunPython(fill_ledger, migrations.RunPython.noop),
+    ]
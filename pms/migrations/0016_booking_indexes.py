@@ -0,0 +1,37 @@
+# Generated by Django 4.0.2 on 2026-10-18 05:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pms', '0015_roomnight'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['room', 'state', 'checkin', 'checkout'], name='booking_room_state_stay_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('state', 'NEW')), fields=['room', 'checkin', 'checkout'], name='booking_active_stay_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['created'], name='booking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['checkin', 'state'], name='booking_checkin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['checkout', 'state'], name='booking_checkout_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['code'], name='booking_code_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Full-text index over booking code and customer data, SQLite only.
+# Other backends keep searching through the ORM (see pms/search.py).
+
+from django.db import migrations
+
+from pms.migrations import _fts as fts
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(fts.FTS_TABLE)
+    for trigger in fts.BOOKING_TRIGGERS.values():
+        schema_editor.execute(trigger)
+    schema_editor.execute('INSERT INTO pms_booking_fts(rowid, code, name, email, phone) ' + fts.BOOKING_ROW)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in fts.BOOKING_TRIGGERS:
+        schema_editor.execute('DROP TRIGGER IF EXISTS %s' % name)
+    schema_editor.execute('DROP TABLE IF EXISTS pms_booking_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pms', '0016_booking_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.0.2 on 2026-10-18 05:28
+
+from django.db import migrations, models
+import pms.reservation_code.generate
+from pms.migrations import _fts as fts
+
+
+def reassign_duplicate_codes(apps, schema_editor):
+    # every booking but the oldest of each repeated code gets a fresh one
+    Booking = apps.get_model('pms', 'Booking')
+    used = set(Booking.objects.values_list('code', flat=True))
+    repeated = (Booking.objects
+                .values('code')
+                .annotate(total=models.Count('id'))
+                .filter(total__gt=1)
+                .values_list('code', flat=True))
+    for code in list(repeated):
+        for booking in Booking.objects.filter(code=code).order_by('id')[1:]:
+            new_code = pms.reservation_code.generate.get()
+            while new_code in used:
+                new_code = pms.reservation_code.generate.get()
+            used.add(new_code)
+            booking.code = new_code
+            booking.save(update_fields=['code'])
+
+
+def drop_triggers(apps, schema_editor):
+    # SQLite rebuilds pms_booking to alter it, the rename fails while a trigger refers to it
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in fts.BOOKING_TRIGGERS:
+        schema_editor.execute('DROP TRIGGER IF EXISTS %s' % name)
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in fts.BOOKING_TRIGGERS.values():
+        schema_editor.execute(trigger)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pms', '0017_booking_fts'),
+    ]
+
+    operations = [
+        migrations.RunPython(reassign_duplicate_codes, migrations.RunPython.noop),
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_code_idx',
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='code',
+            field=models.CharField(default=pms.reservation_code.generate.get, max_length=8, unique=True),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
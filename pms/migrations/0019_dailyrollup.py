@@ -0,0 +1,64 @@
+# Generated by Django 4.0.2 on 2026-10-18 05:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+
+def fill_rollups(apps, schema_editor):
+    # the figures of pms.rollups.contributions, as they were when the table came
+    Booking = apps.get_model('pms', 'Booking')
+    DailyRollup = apps.get_model('pms', 'DailyRollup')
+    totals = defaultdict(Counter)
+    bookings = Booking.objects.values_list('created', 'state', 'checkin', 'checkout', 'total',
+                                           'room__room_type_id')
+    for created, state, checkin, checkout, total, room_type in bookings.iterator():
+        created = created.date()
+        totals[(created, room_type)]['bookings_created'] += 1
+        if state == 'DEL':
+            totals[(checkin, room_type)]['cancellations'] += 1
+            continue
+        totals[(created, room_type)]['revenue'] += total or 0
+        totals[(checkin, room_type)]['arrivals'] += 1
+        totals[(checkout, room_type)]['departures'] += 1
+        night = checkin
+        while night < checkout:
+            totals[(night, room_type)]['occupied_rooms'] += 1
+            night += timedelta(days=1)
+    DailyRollup.objects.bulk_create(
+        [DailyRollup(date=day, room_type_id=room_type, **figures) for (day, room_type), figures in totals.items()],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pms', '0018_booking_code_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bookings_created', models.IntegerField(default=0)),
+                ('arrivals', models.IntegerField(default=0)),
+                ('departures', models.IntegerField(default=0)),
+                ('occupied_rooms', models.IntegerField(default=0)),
+                ('revenue', models.FloatField(default=0)),
+                ('cancellations', models.IntegerField(default=0)),
+                ('room_type', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='pms.room_type')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrollup',
+            constraint=models.UniqueConstraint(fields=('date', 'room_type'), name='rollup_date_room_type_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('room_type__isnull', True)), fields=('date',), name='rollup_date_no_room_type_uniq'),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.0.2 on 2026-10-18 05:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pms', '0019_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('price', models.FloatField()),
+                ('room_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rates', to='pms.room_type')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='rate',
+            constraint=models.UniqueConstraint(fields=('room_type', 'date'), name='rate_room_type_date_uniq'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.0.2 on 2026-10-18 05:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+from pms.migrations import _fts as fts
+
+
+def create_triggers(apps, schema_editor):
+    # archived bookings stay in the index under their booking id
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in fts.ARCHIVE_TRIGGERS.values():
+        schema_editor.execute(trigger)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in fts.ARCHIVE_TRIGGERS:
+        schema_editor.execute('DROP TRIGGER IF EXISTS %s' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pms', '0020_rate'),
+    ]
+
+    # the archive triggers of the FTS index need the new table
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('state', models.CharField(choices=[('NEW', 'Nueva'), ('DEL', 'Cancelada')], max_length=3)),
+                ('checkin', models.DateField()),
+                ('checkout', models.DateField()),
+                ('guests', models.IntegerField()),
+                ('total', models.FloatField()),
+                ('code', models.CharField(max_length=8, unique=True)),
+                ('created', models.DateTimeField()),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_bookings', to='pms.customer')),
+                ('room', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_bookings', to='pms.room')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedbooking',
+            index=models.Index(fields=['checkout'], name='archived_booking_checkout_idx'),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.0.2 on 2026-10-18 05:56
+
+from django.db import migrations, models
+from pms.migrations import _fts as fts
+
+
+def identity(email, phone):
+    # Customer.identity when the key was introduced, historical models have no methods
+    email = (email or '').strip().lower()
+    digits = ''.join(char for char in (phone or '') if char.isdigit())
+    if digits.startswith('00'):
+        digits = digits[2:]
+    if not email and not digits:
+        return ''
+    return '%s|%s' % (email, digits)
+
+
+def fill_identity_keys(apps, schema_editor):
+    Customer = apps.get_model('pms', 'Customer')
+    customers = list(Customer.objects.only('id', 'email', 'phone'))
+    for customer in customers:
+        customer.identity_key = identity(customer.email, customer.phone)
+    Customer.objects.bulk_update(customers, ['identity_key'], batch_size=1000)
+
+
+def drop_triggers(apps, schema_editor):
+    # SQLite rebuilds pms_customer to add the column, the rename at the end
+    # fails while a trigger refers to the table being replaced
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in [*fts.BOOKING_TRIGGERS, *fts.ARCHIVE_TRIGGERS]:
+        schema_editor.execute('DROP TRIGGER IF EXISTS %s' % name)
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in [*fts.BOOKING_TRIGGERS.values(), *fts.ARCHIVE_TRIGGERS.values()]:
+        schema_editor.execute(trigger)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pms', '0021_archivedbooking'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.AddField(
+            model_name='customer',
+            name='identity_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=320),
+        ),
+        migrations.RunPython(fill_identity_keys, migrations.RunPython.noop),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,33 @@
+# Codes are matched by prefix on their unique index, which is case sensitive:
+# every stored code is upper-cased, a code whose upper-cased form is taken
+# gets a fresh one.
+
+from django.db import migrations
+from django.db.models.functions import Upper
+import pms.reservation_code.generate
+
+
+def uppercase_codes(apps, schema_editor):
+    Booking = apps.get_model('pms', 'Booking')
+    ArchivedBooking = apps.get_model('pms', 'ArchivedBooking')
+    used = set(Booking.objects.values_list('code', flat=True)) | set(
+        ArchivedBooking.objects.values_list('code', flat=True))
+    for model in (Booking, ArchivedBooking):
+        lowered = model.objects.exclude(code=Upper('code')).values_list('id', 'code')
+        for booking_id, code in list(lowered):
+            new_code = code.upper()
+            while new_code in used:
+                new_code = pms.reservation_code.generate.get()
+            used.add(new_code)
+            model.objects.filter(pk=booking_id).update(code=new_code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pms', '0022_customer_identity_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(uppercase_codes, migrations.RunPython.noop),
+    ]
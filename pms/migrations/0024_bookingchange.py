@@ -0,0 +1,24 @@
+# Generated by Django 4.0.2 on 2026-10-18 06:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pms', '0023_uppercase_booking_codes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('created', 'Creada'), ('cancelled', 'Cancelada'), ('dates', 'Cambio de fechas'), ('customer', 'Cambio de cliente'), ('updated', 'Modificada'), ('removed', 'Archivada o borrada')], max_length=10)),
+                ('changed', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField(default=dict)),
+                ('booking', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='changes', to='pms.booking')),
+            ],
+        ),
+    ]
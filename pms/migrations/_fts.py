@@ -0,0 +1,81 @@
+"""SQL of the FTS5 index as the migrations that built it created it.
+
+Frozen strings only: pms.fts may change with the application, the migrations
+that already ran must keep building the index they built. A later change to
+the index ships its own SQL in the migration that makes it.
+"""
+
+FTS_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS pms_booking_fts USING fts5(
+    code, name, email, phone,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+BOOKING_ROW = """
+SELECT b.id, b.code, c.name, c.email, c.phone
+FROM pms_booking b LEFT JOIN pms_customer c ON c.id = b.customer_id
+"""
+
+ARCHIVED_ROW = """
+SELECT b.id, b.code, c.name, c.email, c.phone
+FROM pms_archivedbooking b LEFT JOIN pms_customer c ON c.id = b.customer_id
+"""
+
+# triggers of 0017, on the booking and customer tables
+BOOKING_TRIGGERS = {
+    "pms_booking_fts_insert": """
+        CREATE TRIGGER IF NOT EXISTS pms_booking_fts_insert AFTER INSERT ON pms_booking BEGIN
+            INSERT INTO pms_booking_fts(rowid, code, name, email, phone)
+            """ + BOOKING_ROW + """ WHERE b.id = new.id;
+        END
+    """,
+    "pms_booking_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS pms_booking_fts_update AFTER UPDATE OF code, customer_id ON pms_booking BEGIN
+            DELETE FROM pms_booking_fts WHERE rowid = old.id;
+            INSERT INTO pms_booking_fts(rowid, code, name, email, phone)
+            """ + BOOKING_ROW + """ WHERE b.id = new.id;
+        END
+    """,
+    "pms_booking_fts_delete": """
+        CREATE TRIGGER IF NOT EXISTS pms_booking_fts_delete AFTER DELETE ON pms_booking BEGIN
+            DELETE FROM pms_booking_fts WHERE rowid = old.id;
+        END
+    """,
+    "pms_customer_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS pms_customer_fts_update AFTER UPDATE OF name, email, phone ON pms_customer BEGIN
+            UPDATE pms_booking_fts SET name = new.name, email = new.email, phone = new.phone
+            WHERE rowid IN (SELECT id FROM pms_booking WHERE customer_id = new.id);
+        END
+    """,
+}
+
+# triggers of 0021, once the archive table exists
+ARCHIVE_TRIGGERS = {
+    "pms_archivedbooking_fts_insert": """
+        CREATE TRIGGER IF NOT EXISTS pms_archivedbooking_fts_insert AFTER INSERT ON pms_archivedbooking BEGIN
+            INSERT INTO pms_booking_fts(rowid, code, name, email, phone)
+            """ + ARCHIVED_ROW + """ WHERE b.id = new.id;
+        END
+    """,
+    "pms_archivedbooking_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS pms_archivedbooking_fts_update
+        AFTER UPDATE OF code, customer_id ON pms_archivedbooking BEGIN
+            DELETE FROM pms_booking_fts WHERE rowid = old.id;
+            INSERT INTO pms_booking_fts(rowid, code, name, email, phone)
+            """ + ARCHIVED_ROW + """ WHERE b.id = new.id;
+        END
+    """,
+    "pms_archivedbooking_fts_delete": """
+        CREATE TRIGGER IF NOT EXISTS pms_archivedbooking_fts_delete AFTER DELETE ON pms_archivedbooking BEGIN
+            DELETE FROM pms_booking_fts WHERE rowid = old.id;
+        END
+    """,
+    "pms_customer_archive_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS pms_customer_archive_fts_update
+        AFTER UPDATE OF name, email, phone ON pms_customer BEGIN
+            UPDATE pms_booking_fts SET name = new.name, email = new.email, phone = new.phone
+            WHERE rowid IN (SELECT id FROM pms_archivedbooking WHERE customer_id = new.id);
+        END
+    """,
+}
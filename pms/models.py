@@ -1,5 +1,7 @@
 from django.db import models
 
+from .reservation_code import generate
+
 
 # Create your models here.
 
@@ -7,6 +9,27 @@ class Customer(models.Model):
     name = models.CharField(max_length=200)
     email = models.EmailField()
     phone = models.CharField(max_length=50)  # TODO:ADD REGEX FOR PHONE VALIDATION
+    # lowercased email and phone digits, a returning guest is found by it
+    # instead of getting a new row on every stay (see pms/customers.py)
+    identity_key = models.CharField(max_length=320, editable=False, db_index=True, default="")
+
+    @staticmethod
+    def identity(email, phone) -> str:
+        email = (email or "").strip().lower()
+        digits = "".join(char for char in (phone or "") if char.isdigit())
+        if digits.startswith("00"):
+            # 0034... and +34... are the same number
+            digits = digits[2:]
+        if not email and not digits:
+            return ""
+        return "%s|%s" % (email, digits)
+
+    def save(self, *args, **kwargs):
+        self.identity_key = self.identity(self.email, self.phone)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"email", "phone"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "identity_key"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -48,8 +71,141 @@ class Booking(models.Model):
     guests = models.IntegerField()
     customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True)
     total = models.FloatField()
-    code = models.CharField(max_length=8)
+    code = models.CharField(max_length=8, unique=True, default=generate.get)
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # overlap checks: room + state + checkin/checkout
+            models.Index(fields=["room", "state", "checkin", "checkout"], name="booking_room_state_stay_idx"),
+            models.Index(fields=["room", "checkin", "checkout"], name="booking_active_stay_idx",
+                         condition=models.Q(state="NEW")),
+            # dashboard: created today, arrivals and departures of the day
+            models.Index(fields=["created"], name="booking_created_idx"),
+            models.Index(fields=["checkin", "state"], name="booking_checkin_idx"),
+            models.Index(fields=["checkout", "state"], name="booking_checkout_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # codes are looked up by prefix on their index, in one case only
+        if self.code:
+            self.code = self.code.strip().upper()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.code
+
+
+class ArchivedBooking(models.Model):
+    # bookings long checked out, moved off the Booking table by the
+    # archive_bookings command; the id is the one the booking had
+    id = models.BigIntegerField(primary_key=True)
+    state = models.CharField(max_length=3, choices=Booking.STATE_CHOICES)
+    checkin = models.DateField()
+    checkout = models.DateField()
+    room = models.ForeignKey(Room, on_delete=models.SET_NULL, null=True, related_name="archived_bookings")
+    guests = models.IntegerField()
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, related_name="archived_bookings")
+    total = models.FloatField()
+    code = models.CharField(max_length=8, unique=True)
+    created = models.DateTimeField()
+    archived = models.DateTimeField(auto_now_add=True)
+
+    # copied as they are from Booking
+    COPIED_FIELDS = ("id", "state", "checkin", "checkout", "room_id", "guests", "customer_id", "total", "code",
+                     "created")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["checkout"], name="archived_booking_checkout_idx"),
+        ]
+
+    def __str__(self):
+        return self.code
+
+
+class RoomNight(models.Model):
+    # one row per room and night taken by an active booking, so availability
+    # searches only touch the nights they ask about
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE)
+    night = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["night", "room"], name="roomnight_night_room_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["booking", "night"], name="roomnight_booking_night_uniq"),
+        ]
+
+    def __str__(self):
+        return "%s %s" % (self.room_id, self.night)
+
+
+class DailyRollup(models.Model):
+    # figures of one date and room type, kept up to date from booking changes
+    # so history reports never re-scan the bookings
+    date = models.DateField()
+    # history outlives deleted room types, the id is kept without a constraint
+    room_type = models.ForeignKey(Room_type, on_delete=models.DO_NOTHING, null=True, db_constraint=False)
+    bookings_created = models.IntegerField(default=0)
+    arrivals = models.IntegerField(default=0)
+    departures = models.IntegerField(default=0)
+    occupied_rooms = models.IntegerField(default=0)
+    revenue = models.FloatField(default=0)
+    cancellations = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "room_type"], name="rollup_date_room_type_uniq"),
+            # NULLs are distinct in unique indexes, rooms without a type get their own
+            models.UniqueConstraint(fields=["date"], condition=models.Q(room_type__isnull=True),
+                                    name="rollup_date_no_room_type_uniq"),
+        ]
+
+    def __str__(self):
+        return "%s %s" % (self.date, self.room_type)
+
+
+class Rate(models.Model):
+    # price of one night of a room type on a date, the type's price applies on dates without one
+    room_type = models.ForeignKey(Room_type, on_delete=models.CASCADE, related_name="rates")
+    date = models.DateField()
+    price = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["room_type", "date"], name="rate_room_type_date_uniq"),
+        ]
+
+    def __str__(self):
+        return "%s %s %s" % (self.room_type, self.date, self.price)
+
+
+class BookingChange(models.Model):
+    # append-only log of booking writes, the id is the feed cursor
+    CREATED = "created"
+    CANCELLED = "cancelled"
+    DATES = "dates"
+    CUSTOMER = "customer"
+    UPDATED = "updated"
+    REMOVED = "removed"
+    KIND_CHOICES = [
+        (CREATED, "Creada"),
+        (CANCELLED, "Cancelada"),
+        (DATES, "Cambio de fechas"),
+        (CUSTOMER, "Cambio de cliente"),
+        (UPDATED, "Modificada"),
+        (REMOVED, "Archivada o borrada"),
+    ]
+    # the log outlives archived and deleted bookings, the id is kept without a constraint
+    booking = models.ForeignKey(Booking, on_delete=models.DO_NOTHING, db_constraint=False,
+                                related_name="changes")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    changed = models.DateTimeField(auto_now_add=True)
+    # the booking as it is after the change
+    data = models.JSONField(default=dict)
+
+    def __str__(self):
+        return "%s %s %s" % (self.id, self.booking_id, self.kind)
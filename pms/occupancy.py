@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+from typing import Iterator, List
+
+from .models import Booking, RoomNight
+
+
+def as_date(value) -> date:
+    # accepts date, datetime or "YYYY-MM-DD" strings as they arrive from forms
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    if hasattr(value, "date"):
+        return value.date()
+    return value
+
+
+def nights(checkin: date, checkout: date) -> Iterator[date]:
+    # a stay occupies the nights in [checkin, checkout)
+    night = checkin
+    while night < checkout:
+        yield night
+        night += timedelta(days=1)
+
+
+def expected_nights(booking: Booking) -> List[RoomNight]:
+    # ledger rows an active booking should have, cancelled bookings have none
+    if booking.state != Booking.NEW or booking.room_id is None:
+        return []
+    return [RoomNight(room_id=booking.room_id, booking_id=booking.id, night=night)
+            for night in nights(as_date(booking.checkin), as_date(booking.checkout))]
+
+
+def occupy(booking: Booking) -> None:
+    # must run in the same transaction as the booking write
+    RoomNight.objects.bulk_create(expected_nights(booking))
+
+
+def release(booking_id: int) -> None:
+    RoomNight.objects.filter(booking_id=booking_id).delete()
+
+
+def sync(booking: Booking) -> None:
+    # rewrites the nights of a booking after its dates or state changed
+    release(booking.id)
+    occupy(booking)
+
+
+def occupied_rooms(checkin, checkout):
+    # ids of the rooms taken for at least one night of [checkin, checkout)
+    return (RoomNight.objects
+            .filter(night__gte=checkin, night__lt=checkout)
+            .values("room"))
@@ -0,0 +1,102 @@
+from dataclasses import dataclass, field
+from typing import Any, Iterable, List, Optional, Sequence
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+
+DEFAULT_PAGE_SIZE = 50
+
+
+@dataclass
+class KeysetPage:
+    """One page of a keyset paginated listing.
+
+    Cursors are the primary key of the boundary row, so they stay valid no
+    matter how many rows are inserted before or after them.
+    """
+    object_list: List[Any] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+
+def get_page_size() -> int:
+    return getattr(settings, "BOOKINGS_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+
+
+def _field_names(ordering: Sequence[str]) -> List[str]:
+    return [key.lstrip("-") for key in ordering]
+
+
+def _reverse(ordering: Sequence[str]) -> List[str]:
+    return [key[1:] if key.startswith("-") else "-" + key for key in ordering]
+
+
+def _seek(ordering: Sequence[str], boundary: dict) -> Q:
+    # (a, b) after (x, y) in the given ordering is: a > x OR (a = x AND b > y)
+    # with "<" instead of ">" for the descending keys.
+    condition = Q()
+    equal = {}
+    for key in ordering:
+        name = key.lstrip("-")
+        lookup = "lt" if key.startswith("-") else "gt"
+        condition |= Q(**equal, **{"%s__%s" % (name, lookup): boundary[name]})
+        equal[name] = boundary[name]
+    return condition
+
+
+def _boundary(queryset: QuerySet, ordering: Sequence[str], cursor: Optional[str]) -> Optional[dict]:
+    if not cursor or not str(cursor).isdigit():
+        return None
+    return queryset.filter(pk=cursor).values(*_field_names(ordering)).first()
+
+
+def paginate(queryset: QuerySet, ordering: Iterable[str], after: Optional[str] = None,
+             before: Optional[str] = None, page_size: Optional[int] = None) -> KeysetPage:
+    """Returns the page of ``queryset`` that follows ``after`` or precedes ``before``.
+
+    ``ordering`` must be a total order, so it has to end with a unique field
+    such as ``"-id"``. Unknown or stale cursors fall back to the first page.
+    """
+    ordering = list(ordering)
+    page_size = page_size or get_page_size()
+
+    boundary = _boundary(queryset, ordering, before)
+    if boundary is not None:
+        # walk backwards from the cursor and flip the rows back in place
+        rows = list(queryset
+                    .filter(_seek(_reverse(ordering), boundary))
+                    .order_by(*_reverse(ordering))[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        return KeysetPage(
+            object_list=rows,
+            # the next page starts after the last row shown, not after the cursor
+            next_cursor=str(rows[-1].pk) if rows else str(before),
+            previous_cursor=str(rows[0].pk) if has_more else None,
+        )
+
+    boundary = _boundary(queryset, ordering, after)
+    if boundary is not None:
+        queryset = queryset.filter(_seek(ordering, boundary))
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    return KeysetPage(
+        object_list=rows,
+        next_cursor=str(rows[-1].pk) if has_more else None,
+        previous_cursor=str(rows[0].pk) if boundary is not None and rows else None,
+    )
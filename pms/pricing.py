@@ -0,0 +1,72 @@
+"""Stay prices from the rate calendar.
+
+A night costs the ``Rate`` of its room type and date, or the room type's price
+when the calendar has none. For a window of dates the calendar becomes, per
+room type, an array of cumulative night prices: the total of any stay inside
+the window is ``prefix[checkout] - prefix[checkin]``, one subtraction however
+long the stay. Building the arrays is one pass over the nights per room type
+(``array`` and ``itertools.accumulate`` loop in C), then every room and
+candidate stay is priced in constant time.
+"""
+from array import array
+from datetime import date
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import catalog
+from .models import Rate
+from .occupancy import as_date
+
+
+class PriceTable:
+    """Cumulative night prices of every room type over [start, end)."""
+
+    def __init__(self, start: date, end: date, base_prices: Dict[int, float],
+                 rates: Iterable[Tuple[int, date, float]] = ()):
+        self.start = start
+        self.end = end
+        days = max((end - start).days, 0)
+        nightly = {room_type: array("d", [price]) * days for room_type, price in base_prices.items()}
+        first = start.toordinal()
+        for room_type, day, price in rates:
+            if room_type in nightly:
+                nightly[room_type][day.toordinal() - first] = price
+        self.prefix = {room_type: array("d", accumulate(prices, initial=0.0))
+                       for room_type, prices in nightly.items()}
+
+    def _offset(self, day: date) -> int:
+        day = as_date(day)
+        if not self.start <= day <= self.end:
+            raise ValueError("%s is outside the priced window %s - %s" % (day, self.start, self.end))
+        return (day - self.start).days
+
+    def total(self, room_type_id: int, checkin, checkout) -> Optional[float]:
+        """Price of the stay, None for a room type the table does not know."""
+        prefix = self.prefix.get(room_type_id)
+        if prefix is None:
+            return None
+        return round(prefix[self._offset(checkout)] - prefix[self._offset(checkin)], 2)
+
+    def totals(self, stays: Iterable[Tuple[int, date, date]]) -> List[Optional[float]]:
+        """Prices of many (room type, checkin, checkout) stays at once."""
+        return [self.total(room_type_id, checkin, checkout) for room_type_id, checkin, checkout in stays]
+
+
+def price_table(start, end, base_prices: Optional[Dict[int, float]] = None) -> PriceTable:
+    """Prices over [start, end) with one query for the calendar.
+
+    ``base_prices`` maps the room types to price to their own price, by
+    default every room type of the room catalog.
+    """
+    start, end = as_date(start), as_date(end)
+    if base_prices is None:
+        base_prices = {room.room_type.id: room.room_type.price
+                       for room in catalog.get_catalog().rooms if room.room_type is not None}
+    rates = (Rate.objects
+             .filter(room_type_id__in=base_prices, date__gte=start, date__lt=end)
+             .values_list("room_type_id", "date", "price"))
+    return PriceTable(start, end, base_prices, rates)
+
+
+def stay_total(room_type_id: int, checkin, checkout) -> Optional[float]:
+    return price_table(checkin, checkout).total(room_type_id, checkin, checkout)
@@ -0,0 +1,86 @@
+"""Reservation codes that are unique across bookings.
+
+Uniqueness is enforced by the unique index on ``Booking.code``, codes of
+archived bookings are checked too so a booking can always be archived. Single
+bookings take a random code and retry on the rare conflict, the archive is
+only asked about a code the caller chose and about the replacements drawn
+after a conflict. Bulk writers reserve a block of codes checked against both
+tables with one query per chunk.
+"""
+from typing import List
+
+from django.db import IntegrityError, transaction
+
+from . import generate
+
+MAX_ATTEMPTS = 5
+# codes per "IN" lookup, well under SQLite's bound parameter limit
+CHECK_CHUNK = 500
+
+
+class CodeAllocationError(Exception):
+    pass
+
+
+def _taken(codes: List[str]) -> set:
+    from pms.models import ArchivedBooking, Booking
+    taken = set()
+    for start in range(0, len(codes), CHECK_CHUNK):
+        chunk = codes[start:start + CHECK_CHUNK]
+        taken.update(Booking.objects.filter(code__in=chunk).values_list("code", flat=True)
+                     .union(ArchivedBooking.objects.filter(code__in=chunk).values_list("code", flat=True)))
+    return taken
+
+
+def allocate(count: int) -> List[str]:
+    """Returns ``count`` distinct codes that no booking uses yet.
+
+    Only collisions are checked again, so the database is asked about each
+    code once in the common case, batched by ``CHECK_CHUNK``. The codes are
+    not reserved: the unique index still rejects a concurrent writer that
+    happens to pick the same one.
+    """
+    codes: set = set()
+    for _ in range(MAX_ATTEMPTS):
+        candidates = set()
+        while len(codes) + len(candidates) < count:
+            code = generate.get()
+            if code not in codes:
+                candidates.add(code)
+        codes |= candidates - _taken(list(candidates))
+        if len(codes) >= count:
+            return list(codes)
+    raise CodeAllocationError("could not allocate %s reservation codes" % count)
+
+
+def _draw_unarchived() -> str:
+    from pms.models import ArchivedBooking
+    for _ in range(MAX_ATTEMPTS):
+        code = generate.get()
+        if not ArchivedBooking.objects.filter(code=code).exists():
+            return code
+    raise CodeAllocationError("could not find a free reservation code")
+
+
+def save_booking(booking) -> None:
+    """Saves a new booking, drawing another code when its code is taken.
+
+    A drawn code goes straight to the insert, a repeat among 36**8 codes is
+    rare enough to be left to the unique index.
+    """
+    from pms.models import ArchivedBooking, Booking
+    if not booking.code:
+        booking.code = generate.get()
+    elif ArchivedBooking.objects.filter(code=booking.code).exists():
+        booking.code = _draw_unarchived()
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                booking.save(force_insert=True)
+            return
+        except IntegrityError:
+            # any other constraint failure is not ours to retry
+            if not Booking.objects.filter(code=booking.code).exists():
+                raise
+            booking.code = _draw_unarchived()
+    raise CodeAllocationError("could not find a free reservation code")
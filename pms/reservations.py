@@ -0,0 +1,94 @@
+"""Booking writes serialized per room.
+
+Checking availability and saving the booking must happen as one step,
+otherwise two desks booking the same room at the same moment both see it
+free. Every write of a booking's stay (create, date change, cancellation) runs
+in a transaction that first locks the room: a row lock with
+``SELECT ... FOR UPDATE`` where the database has them, the database write lock
+on SQLite, which has no row locks. The check reads the database rather than
+the in-memory index, which only learns about other processes' writes later.
+"""
+from typing import Optional
+
+from django.db import connections, router, transaction
+from django.db.models import F
+
+from .models import Booking, Room
+from .reservation_code import allocator
+
+
+class RoomUnavailable(Exception):
+    def __init__(self, room_id, checkin, checkout, conflicts):
+        super().__init__("room %s is not available from %s to %s" % (room_id, checkin, checkout))
+        self.conflicts = conflicts
+
+
+def lock_room(room_id) -> None:
+    """Holds the room until the surrounding transaction ends."""
+    connection = connections[router.db_for_write(Room)]
+    if not connection.in_atomic_block:
+        raise transaction.TransactionManagementError("lock_room() must run inside a transaction")
+    if connection.vendor == "sqlite":
+        # a write statement takes the database write lock, like BEGIN IMMEDIATE
+        # would; waiting writers queue behind it up to the busy timeout
+        Room.objects.filter(pk=room_id).update(id=F("id"))
+    else:
+        list(Room.objects.select_for_update().filter(pk=room_id).values_list("id"))
+
+
+def stored_conflicts(room_id, checkin, checkout, exclude=None):
+    return list(Booking.objects
+                .filter(room_id=room_id, state=Booking.NEW, checkin__lt=checkout, checkout__gt=checkin)
+                .exclude(pk=exclude)
+                .values_list("id", flat=True))
+
+
+def save_if_free(booking: Booking) -> Booking:
+    """``create_booking`` for a caller whose transaction already locked the room."""
+    conflicts = stored_conflicts(booking.room_id, booking.checkin, booking.checkout)
+    if conflicts:
+        raise RoomUnavailable(booking.room_id, booking.checkin, booking.checkout, conflicts)
+    # the booking signals take its nights in the ledger
+    allocator.save_booking(booking)
+    return booking
+
+
+def create_booking(booking: Booking) -> Booking:
+    """Saves a new booking unless its room is taken, raises RoomUnavailable otherwise."""
+    with transaction.atomic():
+        lock_room(booking.room_id)
+        save_if_free(booking)
+    return booking
+
+
+def change_dates(booking: Booking, checkin, checkout) -> Booking:
+    """Moves a booking to new dates unless they clash, raises RoomUnavailable otherwise."""
+    with transaction.atomic():
+        lock_room(booking.room_id)
+        conflicts = stored_conflicts(booking.room_id, checkin, checkout, exclude=booking.pk)
+        if conflicts:
+            raise RoomUnavailable(booking.room_id, checkin, checkout, conflicts)
+        booking.checkin, booking.checkout = checkin, checkout
+        booking.save(update_fields=["checkin", "checkout"])
+    return booking
+
+
+def cancel_booking(booking_id) -> Optional[Booking]:
+    """Cancels the booking under the lock of its room, None when there is no such booking.
+
+    The room is read before the transaction: on SQLite a transaction that
+    reads before its first write cannot wait for the write lock.
+    """
+    room_id = Booking.objects.filter(pk=booking_id).values_list("room_id", flat=True).first()
+    with transaction.atomic():
+        lock_room(room_id)
+        booking = Booking.objects.filter(pk=booking_id).first()
+        if booking is None:
+            return None
+        if booking.room_id != room_id:
+            # moved to another room meanwhile
+            lock_room(booking.room_id)
+        # saved through the model so the booking signals see the cancellation and free its nights
+        booking.state = Booking.DELETED
+        booking.save(update_fields=["state"])
+    return booking
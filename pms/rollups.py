@@ -0,0 +1,165 @@
+"""Daily rollups of bookings per date and room type.
+
+Each booking contributes to the rollups through ``contributions``:
+
+- ``bookings_created`` on the date it was created, whatever its state
+- ``revenue`` on the date it was created, unless it is cancelled
+- ``arrivals`` on its checkin date and ``departures`` on its checkout date
+- ``occupied_rooms`` on every night of [checkin, checkout)
+- ``cancellations`` on its checkin date once it is cancelled
+
+A booking write applies the difference between the contributions before and
+after it, in the same transaction, so reports read O(days) rows however many
+bookings there are.
+"""
+from collections import Counter, defaultdict
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import Booking, DailyRollup, Room
+from .occupancy import as_date, nights
+
+FIELDS = ("bookings_created", "arrivals", "departures", "occupied_rooms", "revenue", "cancellations")
+
+# the booking values the rollups depend on
+STAY_FIELDS = ("created", "state", "checkin", "checkout", "total", "room__room_type_id")
+
+Key = Tuple[date, Optional[int]]
+
+
+def stay(created, state, checkin, checkout, total, room_type_id) -> dict:
+    return {"created": as_date(created), "state": state, "checkin": as_date(checkin),
+            "checkout": as_date(checkout), "total": total or 0, "room_type_id": room_type_id}
+
+
+def stored_stay(booking_id) -> Optional[dict]:
+    # the stay as the database has it, before a pending save
+    values = Booking.objects.filter(pk=booking_id).values_list(*STAY_FIELDS).first()
+    return stay(*values) if values else None
+
+
+def booking_stay(booking) -> dict:
+    room_type_id = None
+    if booking.room_id is not None:
+        room_type_id = Room.objects.filter(pk=booking.room_id).values_list("room_type_id", flat=True).first()
+    return stay(booking.created, booking.state, booking.checkin, booking.checkout, booking.total, room_type_id)
+
+
+def contributions(values: Optional[dict]) -> Dict[Key, Counter]:
+    figures: Dict[Key, Counter] = defaultdict(Counter)
+    if values is None:
+        return figures
+    room_type = values["room_type_id"]
+    active = values["state"] != Booking.DELETED
+    figures[(values["created"], room_type)]["bookings_created"] += 1
+    if not active:
+        figures[(values["checkin"], room_type)]["cancellations"] += 1
+        return figures
+    figures[(values["created"], room_type)]["revenue"] += values["total"]
+    figures[(values["checkin"], room_type)]["arrivals"] += 1
+    figures[(values["checkout"], room_type)]["departures"] += 1
+    for night in nights(values["checkin"], values["checkout"]):
+        figures[(night, room_type)]["occupied_rooms"] += 1
+    return figures
+
+
+def difference(before: Optional[dict], after: Optional[dict]) -> Dict[Key, Dict[str, float]]:
+    delta: Dict[Key, Dict[str, float]] = defaultdict(dict)
+    old, new = contributions(before), contributions(after)
+    for key in set(old) | set(new):
+        for field in FIELDS:
+            change = new[key][field] - old[key][field]
+            if change:
+                delta[key][field] = change
+    return delta
+
+
+def apply(delta: Dict[Key, Dict[str, float]]) -> None:
+    """Adds the changes to the rollup rows, creating the missing ones.
+
+    A stay touches one row per night, but its nights all change the same
+    way: the missing rows are created empty in one insert, then rows sharing
+    the same changes are updated together. A write costs a few statements
+    however long the stay.
+    """
+    delta = {key: changes for key, changes in delta.items() if changes}
+    if not delta:
+        return
+    # rows another transaction created first are left alone
+    DailyRollup.objects.bulk_create([DailyRollup(date=day, room_type_id=room_type) for day, room_type in delta],
+                                    ignore_conflicts=True)
+    groups: Dict[Tuple[Optional[int], Tuple], List[date]] = defaultdict(list)
+    for (day, room_type), changes in delta.items():
+        groups[(room_type, tuple(sorted(changes.items())))].append(day)
+    for (room_type, changes), days in groups.items():
+        (DailyRollup.objects
+         .filter(date__in=days, room_type_id=room_type)
+         .update(**{field: F(field) + change for field, change in changes}))
+
+
+def record(before: Optional[dict], after: Optional[dict]) -> None:
+    apply(difference(before, after))
+
+
+def recompute(stays: Iterable[dict]) -> Dict[Key, Counter]:
+    totals: Dict[Key, Counter] = defaultdict(Counter)
+    for one in stays:
+        for key, figures in contributions(one).items():
+            totals[key].update(figures)
+    return totals
+
+
+def drift(totals: Dict[Key, Counter]) -> Iterator[Tuple[Key, str, float, float]]:
+    """(key, field, stored, expected) of every figure that differs from ``totals``.
+
+    Rows missing on either side count as zeros.
+    """
+    stored = {(row.date, row.room_type_id): row for row in DailyRollup.objects.iterator()}
+    for key in sorted(set(stored) | set(totals), key=lambda key: (key[0], key[1] or 0)):
+        row = stored.get(key)
+        for field in FIELDS:
+            expected = totals[key][field] if key in totals else 0
+            actual = getattr(row, field) if row else 0
+            # revenue is a float sum, added in another order than the recompute
+            if abs(actual - expected) > 1e-6:
+                yield key, field, actual, expected
+
+
+def _period_days(period: date, start: date, end: date, group: str) -> int:
+    # days of the period that fall inside [start, end]
+    if group == "day":
+        return 1
+    if period.month == 12:
+        following = date(period.year + 1, 1, 1)
+    else:
+        following = date(period.year, period.month + 1, 1)
+    return (min(end.toordinal() + 1, following.toordinal()) - max(start, period).toordinal())
+
+
+def report(start: date, end: date, group: str = "day", total_rooms: int = 0) -> dict:
+    """Figures between start and end (both included), read from the rollups only.
+
+    Rows are grouped by day or month, and broken down by room type. The
+    occupancy rate compares occupied room-nights with ``total_rooms`` on
+    every night of the period.
+    """
+    sums = {field: Sum(field) for field in FIELDS}
+    rows = DailyRollup.objects.filter(date__range=(start, end))
+    period = TruncMonth("date") if group == "month" else F("date")
+    periods = list(rows
+                   .annotate(period=period)
+                   .values("period")
+                   .annotate(**sums)
+                   .order_by("period"))
+    for row in periods:
+        capacity = total_rooms * _period_days(row["period"], start, end, group)
+        row["occupancy_rate"] = round(row["occupied_rooms"] / capacity * 100, 2) if capacity else 0
+    room_types = list(rows
+                      .values("room_type", "room_type__name")
+                      .annotate(**sums)
+                      .order_by("room_type__name"))
+    totals = rows.aggregate(**sums)
+    return {"periods": periods, "room_types": room_types, "totals": totals}
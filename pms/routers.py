@@ -0,0 +1,107 @@
+"""Read replicas for the read-heavy views.
+
+Views named in ``REPLICA_READ_VIEWS`` read the pms tables from one of the
+``DATABASE_REPLICAS`` aliases, everything else, and every write to them, goes
+to the primary (``default``). A client whose request wrote to the pms tables gets a
+cookie that keeps its reads on the primary for ``REPLICA_STICKY_SECONDS``,
+so the booking it just made is on the next page even if the replica lags.
+
+Caches shared by every request (room catalog, availability index, dashboard
+figures) are always built from the primary, see ``primary()``.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# holds the reads of pms models on the primary until the timestamp it carries
+STICKY_COOKIE = "pms_primary_until"
+
+
+class RequestRouting:
+    __slots__ = ("replica", "wrote")
+
+    def __init__(self):
+        self.replica = False
+        self.wrote = False
+
+
+_request: ContextVar[Optional[RequestRouting]] = ContextVar("pms_request_routing", default=None)
+_force_primary: ContextVar[bool] = ContextVar("pms_force_primary", default=False)
+
+
+def replicas() -> List[str]:
+    return list(getattr(settings, "DATABASE_REPLICAS", []))
+
+
+@contextmanager
+def primary():
+    """Reads inside the block go to the primary, whatever the view."""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _request.get()
+        if (routing is None or not routing.replica or _force_primary.get()
+                or model._meta.app_label != "pms"):
+            return None
+        aliases = replicas()
+        return random.choice(aliases) if aliases else None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != "pms":
+            return None
+        routing = _request.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routing = RequestRouting()
+        token = _request.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        if routing.wrote:
+            sticky = getattr(settings, "REPLICA_STICKY_SECONDS", 10)
+            response.set_cookie(STICKY_COOKIE, "%.0f" % (time.time() + sticky), max_age=sticky,
+                                httponly=True, samesite="Lax")
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routing = _request.get()
+        if routing is None or request.method not in ("GET", "HEAD") or not replicas():
+            return None
+        match = request.resolver_match
+        if match and match.url_name in getattr(settings, "REPLICA_READ_VIEWS", ()):
+            routing.replica = not self.pinned(request)
+        return None
+
+    @staticmethod
+    def pinned(request) -> bool:
+        try:
+            return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
@@ -0,0 +1,114 @@
+import re
+from typing import List, Optional, Tuple
+
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.db.models.expressions import RawSQL
+
+from . import fts
+from .models import ArchivedBooking, Booking
+
+# newest bookings first, id breaks ties between bookings created together
+LIST_ORDERING = ("-created", "-id")
+# best full-text match first (bm25 is lower for better matches)
+RANK_ORDERING = ("search_rank", "-id")
+
+# code matches count more than customer name, email or phone
+RANK = "bm25(pms_booking_fts, 10.0, 5.0, 1.0, 1.0)"
+# archived matches are paged on their own cursor, under the last page of live ones
+ARCHIVE_PAGE_SIZE = 20
+
+# reservation codes are stored upper-cased (see Booking.save)
+CODE_PREFIX = re.compile(r"[A-Z0-9]{1,8}")
+FULL_CODE = re.compile(r"[A-Z0-9]{8}")
+AUTOCOMPLETE_FIELDS = ("id", "code", "state", "checkin", "checkout", "customer__name")
+
+
+def match_expression(text: str) -> str:
+    # every word of the filter as a quoted prefix term, all of them required
+    return " ".join('"%s"*' % word for word in re.findall(r"\w+", text))
+
+
+def normalize_code(text: str) -> str:
+    return text.strip().upper()
+
+
+def is_code_prefix(text: str) -> bool:
+    return bool(CODE_PREFIX.fullmatch(normalize_code(text)))
+
+
+def code_range(prefix: str) -> Q:
+    """Codes starting with ``prefix``, as a range the unique index on code can seek.
+
+    ``startswith`` becomes ``LIKE ... ESCAPE`` on SQLite, which never uses the
+    index; ``code >= "AB" AND code < "AC"`` is one index range scan.
+    """
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(code__gte=prefix, code__lt=upper)
+
+
+def find_code(text: str) -> Optional[Booking]:
+    # exact lookup through the unique index, None unless text is a whole code
+    code = normalize_code(text)
+    if not FULL_CODE.fullmatch(code):
+        return None
+    return Booking.objects.select_related("customer", "room").filter(code=code).first()
+
+
+def autocomplete(prefix: str, limit: int = 10) -> List[dict]:
+    """The first ``limit`` live and archived bookings whose code starts with ``prefix``.
+
+    Each table is read with one range scan of its code index that stops
+    after ``limit`` rows, however many bookings there are.
+    """
+    prefix = normalize_code(prefix)
+    if not CODE_PREFIX.fullmatch(prefix):
+        return []
+    matches = []
+    for model, archived in ((Booking, False), (ArchivedBooking, True)):
+        rows = model.objects.filter(code_range(prefix)).order_by("code").values(*AUTOCOMPLETE_FIELDS)[:limit]
+        matches += [dict(row, archived=archived) for row in rows]
+    matches.sort(key=lambda row: row["code"])
+    return matches[:limit]
+
+
+def search_bookings(text: str) -> Tuple[QuerySet, Tuple[str, ...]]:
+    """Bookings matching ``text`` by code or customer, with their ordering.
+
+    On SQLite the search goes through the FTS5 index with prefix matching and
+    bm25 ranking. Other backends match the code by prefix on its index and the
+    customer name with ``icontains``.
+    """
+    bookings = Booking.objects.all()
+    if not fts.supported(connections[bookings.db]):
+        matches = Q(customer__name__icontains=text)
+        if is_code_prefix(text):
+            matches |= code_range(normalize_code(text))
+        return bookings.filter(matches), LIST_ORDERING
+
+    expression = match_expression(text)
+    if not expression:
+        return bookings.none(), LIST_ORDERING
+    # joined rather than a correlated subquery: the MATCH runs once, not once per matching booking
+    bookings = bookings.extra(tables=["pms_booking_fts"],
+                              where=["pms_booking_fts.rowid = pms_booking.id", "pms_booking_fts MATCH %s"],
+                              params=[expression])
+    return bookings.annotate(search_rank=RawSQL(RANK, ())), RANK_ORDERING
+
+
+def search_archive(text: str) -> Tuple[QuerySet, Tuple[str, ...]]:
+    """Archived bookings matching ``text``, through the same index as ``search_bookings``."""
+    bookings = ArchivedBooking.objects.all()
+    if not fts.supported(connections[bookings.db]):
+        matches = Q(customer__name__icontains=text)
+        if is_code_prefix(text):
+            matches |= code_range(normalize_code(text))
+        return bookings.filter(matches), LIST_ORDERING
+    expression = match_expression(text)
+    if not expression:
+        return bookings.none(), LIST_ORDERING
+    # the index rowid is the booking id, archived bookings keep it
+    bookings = bookings.extra(tables=["pms_booking_fts"],
+                              where=["pms_booking_fts.rowid = pms_archivedbooking.id", "pms_booking_fts MATCH %s"],
+                              params=[expression])
+    return bookings.annotate(search_rank=RawSQL(RANK, ())), RANK_ORDERING
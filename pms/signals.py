@@ -0,0 +1,83 @@
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import availability, catalog, changes, dashboard, fts, memo, occupancy, rollups
+from .occupancy import as_date
+from .models import Booking, Customer, Room, Room_type
+
+
+@receiver(pre_save, sender=Booking)
+def booking_saving(sender, instance, **kwargs):
+    # the rollups need the stay as it was before this save
+    instance._previous_stay = None if instance._state.adding else rollups.stored_stay(instance.pk)
+    # a booking moved to another room changes the availability of both
+    instance._previous_room = None if instance._state.adding else (
+        Booking.objects.filter(pk=instance.pk).values_list("room_id", flat=True).first())
+
+
+def _stay_moved(instance, previous, previous_room) -> bool:
+    # whether the nights the booking holds in the ledger have to be rewritten
+    if previous is None:
+        return True
+    return (previous["state"] != instance.state or previous_room != instance.room_id
+            or previous["checkin"] != as_date(instance.checkin)
+            or previous["checkout"] != as_date(instance.checkout))
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, created, **kwargs):
+    # ledger, rollups and change feed are written in the same transaction as
+    # the booking, whatever saved it (views, admin, shell)
+    previous = getattr(instance, "_previous_stay", None)
+    if created:
+        occupancy.occupy(instance)
+    elif _stay_moved(instance, previous, getattr(instance, "_previous_room", None)):
+        occupancy.sync(instance)
+    rollups.record(previous, rollups.booking_stay(instance))
+    changes.record(instance, changes.kind_of(previous, instance))
+    # the in-memory index must only see committed stays
+    stay = (instance.pk, instance.room_id, instance.state, instance.checkin, instance.checkout)
+    rooms = (instance.room_id, getattr(instance, "_previous_room", None))
+    transaction.on_commit(lambda: availability.booking_changed(*stay))
+    transaction.on_commit(lambda: memo.rooms_changed(rooms))
+    transaction.on_commit(dashboard.invalidate)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    # the ledger rows go with the booking through the cascade,
+    # the rollups keep deleted bookings, they are history
+    changes.record_removed(instance)
+    booking_id, room_id = instance.pk, instance.room_id
+    transaction.on_commit(lambda: availability.booking_deleted(booking_id))
+    transaction.on_commit(lambda: memo.rooms_changed([room_id]))
+    transaction.on_commit(dashboard.invalidate)
+
+
+@receiver(post_save, sender=Customer)
+def customer_saved(sender, instance, created, **kwargs):
+    # new customers have no bookings yet, edits show up in the feed of each of theirs
+    if not created:
+        changes.customer_changed(instance)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def room_changed(sender, **kwargs):
+    # the occupancy rate depends on the number of rooms
+    transaction.on_commit(dashboard.invalidate)
+    transaction.on_commit(catalog.reset)
+
+
+@receiver(post_save, sender=Room_type)
+@receiver(post_delete, sender=Room_type)
+def room_type_changed(sender, **kwargs):
+    transaction.on_commit(catalog.reset)
+
+
+def install_fts(sender, using, **kwargs):
+    # migrations that rebuild pms_booking or pms_customer drop the FTS triggers
+    connection = connections[using]
+    if fts.supported(connection) and "pms_booking" in connection.introspection.table_names():
+        fts.install(connection)
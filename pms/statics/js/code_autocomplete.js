@@ -0,0 +1,28 @@
+// suggests reservation codes while a code is typed in the booking search box
+const codeInput = document.querySelector("#booking-filter")
+const codeList = document.querySelector("#booking-codes")
+let codeRequest = null
+
+codeInput.addEventListener("input", (e) => {
+    const prefix = e.target.value.trim().toUpperCase()
+    if (!/^[A-Z0-9]{2,8}$/.test(prefix)) {
+        codeList.innerHTML = ""
+        return
+    }
+    if (codeRequest) {
+        codeRequest.abort()
+    }
+    codeRequest = new AbortController()
+    fetch(codeInput.dataset.url + "?q=" + encodeURIComponent(prefix), {signal: codeRequest.signal})
+        .then((response) => response.json())
+        .then((data) => {
+            codeList.innerHTML = ""
+            for (const match of data.results) {
+                const option = document.createElement("option")
+                option.value = match.code
+                option.label = (match.customer || "") + " · " + match.checkin
+                codeList.appendChild(option)
+            }
+        })
+        .catch(() => {})
+})
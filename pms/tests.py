@@ -1,8 +1,29 @@
-from django.test import TestCase, Client, override_settings
+from unittest import skipUnless
+from unittest.mock import patch
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
-from datetime import timedelta
-from .models import Room, Room_type, Booking, Customer
+from datetime import date, timedelta
+from io import StringIO
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+from . import archive, availability, catalog, changes, dashboard, exporter, importer, memo, pricing, reservations, rollups, routers, search, sqlite
+from .availability import AvailabilityIndex
+from .middleware import QueryBudgetExceeded
+from .benchmarks import datagen, views as benchmark_views
+from .reservation_code import allocator
+from .models import ArchivedBooking, Room, Room_type, Booking, BookingChange, Customer, DailyRollup, Rate, RoomNight
 
 @override_settings(DEBUG=True)
 class RoomFilterTest(TestCase):
@@ -233,3 +254,1416 @@ class EditBookingDatesTest(TestCase):
         
         
 
+
+@override_settings(BOOKINGS_PAGE_SIZE=2)
+class HomePaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        today = timezone.now().date()
+        cls.bookings = []
+        for i in range(5):
+            customer = Customer.objects.create(name=f"Guest {i}", email="guest@test.es", phone="1")
+            cls.bookings.append(Booking.objects.create(
+                room=room,
+                customer=customer,
+                checkin=today + timedelta(days=i * 2),
+                checkout=today + timedelta(days=i * 2 + 1),
+                guests=1,
+                total=30.0,
+                code=f"PAGE000{i}",
+            ))
+
+    def test_first_page_in_one_query(self):
+        """The first page loads bookings with customer and room in a single query"""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'))
+        page = response.context['page']
+        self.assertEqual([b.code for b in page], ["PAGE0004", "PAGE0003"])
+        self.assertFalse(page.has_previous)
+        self.assertTrue(page.has_next)
+
+    def test_next_and_previous_cursors(self):
+        """Following the cursors walks through every booking and back"""
+        page = self.client.get(reverse('home')).context['page']
+        seen = [b.code for b in page]
+        while page.has_next:
+            page = self.client.get(reverse('home') + f'?after={page.next_cursor}').context['page']
+            seen += [b.code for b in page]
+        self.assertEqual(seen, [f"PAGE000{i}" for i in reversed(range(5))])
+
+        page = self.client.get(reverse('home') + f'?before={page.previous_cursor}').context['page']
+        self.assertEqual([b.code for b in page], ["PAGE0002", "PAGE0001"])
+        self.assertTrue(page.has_previous)
+
+        # forward again from a page reached backwards, no row is skipped
+        page = self.client.get(reverse('home') + f'?after={page.next_cursor}').context['page']
+        self.assertEqual([b.code for b in page], ["PAGE0000"])
+
+    def test_search_uses_same_paging(self):
+        """Booking search results are paged like the home listing"""
+        response = self.client.get(reverse('booking_search') + '?filter=PAGE')
+        page = response.context['page']
+        self.assertEqual(len(page), 2)
+        self.assertContains(response, 'filter=PAGE&after=')
+        seen = [b.code for b in page]
+        while page.has_next:
+            response = self.client.get(reverse('booking_search'), {'filter': 'PAGE', 'after': page.next_cursor})
+            page = response.context['page']
+            seen += [b.code for b in page]
+        self.assertEqual(sorted(seen), [f"PAGE000{i}" for i in range(5)])
+
+
+class OccupancyLedgerTest(TestCase):
+    def setUp(self):
+        self.room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=self.room_type)
+        self.other_room = Room.objects.create(name="Room 1.2", room_type=self.room_type)
+        self.checkin = timezone.now().date() + timedelta(days=10)
+        self.checkout = self.checkin + timedelta(days=3)
+
+    def book(self, room):
+        return self.client.post(reverse('booking', kwargs={'pk': room.id}), {
+            'customer-name': 'Chapp Test',
+            'customer-email': 'asd@as.es',
+            'customer-phone': '1',
+            'booking-checkin': self.checkin,
+            'booking-checkout': self.checkout,
+            'booking-guests': 2,
+            'booking-total': 90.0,
+            'booking-state': 'NEW',
+        })
+
+    def search(self):
+        return self.client.post(reverse('search'), {
+            'checkin': self.checkin,
+            'checkout': self.checkout,
+            'guests': 2,
+        })
+
+    def test_booking_takes_its_nights(self):
+        """Creating a booking writes one ledger row per night"""
+        self.book(self.room)
+        booking = Booking.objects.get()
+        nights = RoomNight.objects.filter(booking=booking).values_list('night', flat=True)
+        self.assertEqual(sorted(nights), [self.checkin + timedelta(days=i) for i in range(3)])
+
+    def test_search_excludes_occupied_rooms(self):
+        """Rooms with a night in the ledger are not offered"""
+        self.book(self.room)
+        rooms = list(self.search().context['rooms'])
+        self.assertEqual(rooms, [self.other_room])
+
+    def test_cancel_releases_nights(self):
+        """Cancelling a booking frees its nights"""
+        self.book(self.room)
+        booking = Booking.objects.get()
+        self.client.post(reverse('delete_booking', kwargs={'pk': booking.id}))
+        self.assertFalse(RoomNight.objects.exists())
+        self.assertEqual(len(self.search().context['rooms']), 2)
+
+    def test_orm_writes_keep_the_ledger(self):
+        """Saves outside the views (admin, shell) move and free the nights too"""
+        booking = Booking.objects.create(room=self.room, checkin=self.checkin, checkout=self.checkout,
+                                         guests=1, total=90.0)
+        self.assertEqual(RoomNight.objects.filter(booking=booking).count(), 3)
+        booking.room, booking.checkout = self.other_room, self.checkin + timedelta(days=1)
+        booking.save()
+        self.assertEqual(list(RoomNight.objects.values_list('room_id', 'night')),
+                         [(self.other_room.id, self.checkin)])
+        booking.state = Booking.DELETED
+        booking.save()
+        self.assertFalse(RoomNight.objects.exists())
+        call_command('rebuild_occupancy', '--check', stdout=StringIO())
+
+    def test_rebuild_command_fixes_drift(self):
+        """The rebuild command reports and repairs a ledger out of sync"""
+        self.book(self.room)
+        RoomNight.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_occupancy', '--check', stdout=StringIO())
+        call_command('rebuild_occupancy', stdout=StringIO())
+        self.assertEqual(RoomNight.objects.count(), 3)
+        call_command('rebuild_occupancy', '--check', stdout=StringIO())
+
+
+class AvailabilityIndexTest(TestCase):
+    def setUp(self):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        self.today = timezone.now().date()
+        self.booking = Booking.objects.create(
+            room=self.room, checkin=self.today + timedelta(days=2), checkout=self.today + timedelta(days=5),
+            guests=1, total=90.0, code='INDEX001')
+        self.index = AvailabilityIndex.from_db()
+
+    def tearDown(self):
+        availability.reset()
+
+    def days(self, start, end):
+        return self.today + timedelta(days=start), self.today + timedelta(days=end)
+
+    def test_overlaps_are_half_open(self):
+        """A stay blocks [checkin, checkout) and nothing else"""
+        self.assertEqual(self.index.conflicts(self.room.id, *self.days(4, 6)), [self.booking.id])
+        self.assertEqual(self.index.conflicts(self.room.id, *self.days(0, 10)), [self.booking.id])
+        self.assertEqual(self.index.conflicts(self.room.id, *self.days(5, 6)), [])
+        self.assertEqual(self.index.conflicts(self.room.id, *self.days(0, 2)), [])
+        self.assertEqual(self.index.conflicts(self.room.id, *self.days(3, 4), exclude=self.booking.id), [])
+
+    def test_long_stay_found_behind_short_ones(self):
+        """Stays starting well before the range are still checked"""
+        self.index.update(999, self.room.id, Booking.NEW, *self.days(-30, 30))
+        self.assertEqual(sorted(self.index.conflicts(self.room.id, *self.days(10, 11))), [999])
+
+    def test_update_moves_and_cancels(self):
+        """Updates replace the stay of a booking and cancelled ones leave the index"""
+        self.index.update(self.booking.id, self.room.id, Booking.NEW, *self.days(10, 12))
+        self.assertEqual(self.index.conflicts(self.room.id, *self.days(2, 5)), [])
+        self.assertEqual(self.index.occupied_rooms(*self.days(11, 12)), {self.room.id})
+        self.index.update(self.booking.id, self.room.id, Booking.DELETED, *self.days(10, 12))
+        self.assertEqual(self.index.occupied_rooms(*self.days(0, 30)), set())
+
+    @override_settings(AVAILABILITY_BACKEND='memory')
+    def test_check_dates_endpoint_reads_index(self):
+        """The AJAX check answers from memory and sees committed cancellations"""
+        url = reverse('check_booking_availability', kwargs={'pk': self.booking.id})
+        other = Booking.objects.create(
+            room=self.room, checkin=self.today + timedelta(days=6), checkout=self.today + timedelta(days=8),
+            guests=1, total=60.0, code='INDEX002')
+        availability.get_index()
+        dates = {'checkin': self.today + timedelta(days=6), 'checkout': self.today + timedelta(days=7)}
+        # only the change feed is asked for anything newer, no booking is read
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, dates)
+        self.assertTrue(queries.captured_queries)
+        self.assertTrue(all('FROM "pms_bookingchange"' in q['sql'] for q in queries.captured_queries))
+        self.assertFalse(response.json()['available'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_booking', kwargs={'pk': other.id}))
+        self.assertTrue(self.client.post(url, dates).json()['available'])
+
+    @override_settings(AVAILABILITY_BACKEND='memory')
+    def test_index_follows_writes_of_other_processes(self):
+        """Writes whose commit callbacks never ran here reach the index through the change feed"""
+        availability.get_index()
+        # no captureOnCommitCallbacks: like a write made by another worker or a command
+        other = Booking.objects.create(room=self.room, checkin=self.today + timedelta(days=6),
+                                       checkout=self.today + timedelta(days=8), guests=1, total=60.0)
+        self.assertEqual(availability.conflicting_bookings(self.room.id, *self.days(6, 7)), [other.id])
+        list(archive.archive(self.today + timedelta(days=30)))
+        self.assertEqual(availability.conflicting_bookings(self.room.id, *self.days(0, 30)), [])
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite syntax")
+class BookingQueryPlanTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        cls.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        today = timezone.now().date()
+        cls.booking = Booking.objects.create(
+            room=cls.room, checkin=today, checkout=today + timedelta(days=2),
+            guests=1, total=60.0, code='PLAN0001')
+
+    def assertNoBookingScan(self, queries):
+        booking_queries = [q['sql'] for q in queries
+                           if 'pms_booking' in q['sql'] and q['sql'].startswith('SELECT')]
+        self.assertTrue(booking_queries)
+        with connection.cursor() as cursor:
+            for sql in booking_queries:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+                full_scans = [step for step in plan if step.startswith('SCAN pms_booking')
+                              and 'INDEX' not in step]
+                self.assertFalse(full_scans, "full table scan in %s\n%s" % (sql, "\n".join(plan)))
+
+    def test_dashboard_uses_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dashboard'))
+        # the figures come from the rollups of the day, bookings are not read
+        self.assertFalse([q for q in queries if 'pms_booking' in q['sql']])
+        rollup_queries = [q['sql'] for q in queries if 'pms_dailyrollup' in q['sql']]
+        self.assertTrue(rollup_queries)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + rollup_queries[0])
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue([step for step in plan if step.startswith('SEARCH pms_dailyrollup')], "\n".join(plan))
+
+    def test_home_uses_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('home'))
+            self.client.get(reverse('home') + f'?after={self.booking.id}')
+        self.assertNoBookingScan(queries)
+
+    def test_overlap_checks_use_indexes(self):
+        today = timezone.now().date()
+        dates = {'checkin': today + timedelta(days=1), 'checkout': today + timedelta(days=3)}
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('check_booking_availability', kwargs={'pk': self.booking.id}), dates)
+            self.client.post(reverse('edit_booking_dates', kwargs={'pk': self.booking.id}), dates)
+        self.assertNoBookingScan(queries)
+
+    def test_code_lookup_uses_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            Booking.objects.filter(code='PLAN0001').first()
+        self.assertNoBookingScan(queries)
+
+
+class BookingSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        today = timezone.now().date()
+        cls.ana = Customer.objects.create(name="Ana García", email="ana@chapp.es", phone="600111222")
+        cls.luis = Customer.objects.create(name="Luis Anaya", email="luis@chapp.es", phone="600333444")
+        cls.ana_booking = Booking.objects.create(
+            room=room, customer=cls.ana, checkin=today, checkout=today + timedelta(days=1),
+            guests=1, total=30.0, code='ANA00001')
+        cls.luis_booking = Booking.objects.create(
+            room=room, customer=cls.luis, checkin=today, checkout=today + timedelta(days=1),
+            guests=1, total=30.0, code='LUIS0001')
+
+    def search(self, text):
+        response = self.client.get(reverse('booking_search'), {'filter': text})
+        return [booking.code for booking in response.context['bookings']]
+
+    def test_prefix_match_on_code_and_name(self):
+        """Codes and customer names match by prefix"""
+        self.assertEqual(self.search('LUIS'), ['LUIS0001'])
+        self.assertEqual(self.search('gar'), ['ANA00001'])
+        self.assertEqual(self.search('luis ana'), ['LUIS0001'])
+
+    def test_code_match_ranks_first(self):
+        """A code match ranks above a name match"""
+        self.assertEqual(self.search('ana'), ['ANA00001', 'LUIS0001'])
+
+    def test_index_follows_customer_edits(self):
+        """Editing the customer updates the full-text index"""
+        self.ana.name = "Ana Pérez"
+        self.ana.save()
+        self.assertEqual(self.search('perez'), ['ANA00001'])
+        self.assertEqual(self.search('garcia'), [])
+
+    def test_search_syntax_is_escaped(self):
+        """FTS operators typed by the user are treated as plain words"""
+        self.assertEqual(self.search('"gar*'), ['ANA00001'])
+        self.assertEqual(self.search('ana OR luis'), [])
+        self.assertEqual(self.search('***'), [])
+
+
+class ReservationCodeTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+
+    def fields(self, code):
+        return {'checkin': self.today, 'checkout': self.today + timedelta(days=1),
+                'guests': 1, 'total': 30.0, 'code': code}
+
+    def test_codes_are_unique_in_database(self):
+        """The database rejects a repeated code"""
+        Booking.objects.create(**self.fields('SAME0001'))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Booking.objects.create(**self.fields('SAME0001'))
+
+    def test_save_retries_on_conflict(self):
+        """A booking whose code is taken gets a new one"""
+        Booking.objects.create(**self.fields('SAME0001'))
+        booking = Booking(**self.fields('SAME0001'))
+        allocator.save_booking(booking)
+        self.assertNotEqual(booking.code, 'SAME0001')
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_drawn_code_is_not_looked_up(self):
+        """A fresh code goes straight to the insert, a chosen one is checked against the archive"""
+        with CaptureQueriesContext(connection) as queries:
+            allocator.save_booking(Booking(**self.fields('')))
+        self.assertFalse([q for q in queries if 'pms_archivedbooking' in q['sql']])
+        ArchivedBooking.objects.create(id=999, state=Booking.NEW, created=timezone.now(), **self.fields('OLD00001'))
+        booking = Booking(**self.fields('OLD00001'))
+        allocator.save_booking(booking)
+        self.assertNotEqual(booking.code, 'OLD00001')
+
+    def test_block_allocation_skips_taken_codes(self):
+        """Bulk allocation checks codes in chunks and replaces the taken ones"""
+        taken = ['TAKEN001', 'TAKEN002']
+        for code in taken:
+            Booking.objects.create(**self.fields(code))
+        drawn = iter(taken + ['FREE0001', 'FREE0002', 'FREE0003'])
+        with patch('pms.reservation_code.generate.get', lambda: next(drawn)), self.assertNumQueries(2):
+            codes = allocator.allocate(3)
+        self.assertEqual(sorted(codes), ['FREE0001', 'FREE0002', 'FREE0003'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardSnapshotTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        Room.objects.create(name="Room 1.2", room_type=room_type)
+        self.today = date.today()
+
+    def create_booking(self, **fields):
+        values = {'room': self.room, 'checkin': self.today, 'checkout': self.today + timedelta(days=2),
+                  'guests': 1, 'total': 60.0}
+        values.update(fields)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(**values)
+
+    def test_single_query(self):
+        """All the figures come from one query"""
+        self.create_booking()
+        self.create_booking(checkin=self.today - timedelta(days=2), checkout=self.today, total=40.0)
+        with self.assertNumQueries(1):
+            figures = dashboard.compute(self.today)
+        self.assertEqual(figures['new_bookings'], 2)
+        self.assertEqual(figures['incoming_guests'], 1)
+        self.assertEqual(figures['outcoming_guests'], 1)
+        self.assertEqual(figures['invoiced'], {'total__sum': 100.0})
+        self.assertEqual(figures['occupied_rooms'], 1)
+        self.assertEqual(figures['total_rooms'], 2)
+        self.assertEqual(figures['occupancy_rate'], 50.0)
+
+    def test_missing_rollups_fall_back_to_bookings(self):
+        """A day whose rollups miss stays of the ledger is read from the bookings"""
+        self.create_booking()
+        DailyRollup.objects.all().delete()
+        with self.assertLogs('pms.dashboard', 'WARNING'):
+            figures = dashboard.compute(self.today)
+        self.assertEqual(figures['new_bookings'], 1)
+        self.assertEqual(figures['incoming_guests'], 1)
+        self.assertEqual(figures['occupied_rooms'], 1)
+        self.assertEqual(figures['invoiced'], {'total__sum': 60.0})
+
+    def test_rooms_counted_without_bookings(self):
+        """The room count does not depend on matching bookings"""
+        self.assertEqual(dashboard.compute(self.today)['total_rooms'], 2)
+
+    def test_snapshot_cached_until_booking_changes(self):
+        """The page is served from cache until a booking is created or cancelled"""
+        self.client.get(reverse('dashboard'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('dashboard'))
+
+        booking = self.create_booking()
+        self.assertEqual(self.client.get(reverse('dashboard')).context['dashboard']['incoming_guests'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_booking', kwargs={'pk': booking.id}))
+        self.assertEqual(self.client.get(reverse('dashboard')).context['dashboard']['incoming_guests'], 0)
+
+
+class DailyRollupTest(TestCase):
+    def setUp(self):
+        self.double = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=self.double)
+        self.today = date.today()
+
+    def day(self, offset):
+        return self.today + timedelta(days=offset)
+
+    def rollup(self, offset):
+        row = DailyRollup.objects.filter(date=self.day(offset), room_type=self.double).first()
+        return {field: getattr(row, field) for field in rollups.FIELDS} if row else {}
+
+    def test_booking_lifecycle_updates_rollups(self):
+        """Creating, moving and cancelling a booking adjusts the rollups by deltas"""
+        booking = Booking.objects.create(room=self.room, checkin=self.day(1), checkout=self.day(3),
+                                         guests=1, total=60.0)
+        self.assertEqual(self.rollup(0)['bookings_created'], 1)
+        self.assertEqual(self.rollup(0)['revenue'], 60.0)
+        self.assertEqual(self.rollup(1)['arrivals'], 1)
+        self.assertEqual(self.rollup(2)['occupied_rooms'], 1)
+        self.assertEqual(self.rollup(3)['departures'], 1)
+        self.assertEqual(self.rollup(3)['occupied_rooms'], 0)
+
+        booking.checkin, booking.checkout = self.day(5), self.day(6)
+        booking.save()
+        self.assertEqual(self.rollup(1)['arrivals'], 0)
+        self.assertEqual(self.rollup(2)['occupied_rooms'], 0)
+        self.assertEqual(self.rollup(5)['arrivals'], 1)
+
+        self.client.post(reverse('delete_booking', kwargs={'pk': booking.id}))
+        self.assertEqual(self.rollup(0)['bookings_created'], 1)
+        self.assertEqual(self.rollup(0)['revenue'], 0)
+        self.assertEqual(self.rollup(5)['arrivals'], 0)
+        self.assertEqual(self.rollup(5)['cancellations'], 1)
+
+    def test_apply_cost_does_not_grow_with_the_stay(self):
+        """A stay's rollups are written in the same few statements for two nights or sixty"""
+        def stay(offset, nights):
+            return rollups.stay(self.today, Booking.NEW, self.day(offset), self.day(offset + nights), 60.0,
+                                self.double.id)
+        with CaptureQueriesContext(connection) as short:
+            rollups.record(None, stay(100, 2))
+        with CaptureQueriesContext(connection) as long:
+            rollups.record(None, stay(200, 60))
+        with CaptureQueriesContext(connection) as moved:
+            rollups.record(stay(200, 60), stay(201, 60))
+        # one insert of the missing rows, one update per distinct change
+        self.assertEqual(len(long), len(short))
+        self.assertLessEqual(len(moved), len(short))
+        self.assertEqual(self.rollup(230)['occupied_rooms'], 1)
+        self.assertEqual((self.rollup(200)['arrivals'], self.rollup(200)['occupied_rooms']), (0, 0))
+        self.assertEqual((self.rollup(201)['arrivals'], self.rollup(261)['departures']), (1, 1))
+
+    def write_stay(self, offset, nights):
+        # books, moves by a day and cancels one stay, returns the queries of each request
+        checkin, checkout = self.day(offset), self.day(offset + nights)
+        url = reverse('booking', kwargs={'pk': self.room.id}) + f'?checkin={checkin}&checkout={checkout}&guests=2'
+        with CaptureQueriesContext(connection) as booked:
+            self.client.post(url, {'customer-name': 'Ana', 'customer-email': f'ana{offset}@example.com',
+                                   'customer-phone': '600', 'booking-checkin': checkin,
+                                   'booking-checkout': checkout, 'booking-guests': 2, 'booking-total': 60.0,
+                                   'booking-state': 'NEW'})
+        booking = Booking.objects.get(checkin=checkin)
+        with CaptureQueriesContext(connection) as moved:
+            self.client.post(reverse('edit_booking_dates', kwargs={'pk': booking.id}),
+                             {'checkin': self.day(offset + 1), 'checkout': self.day(offset + nights + 1)})
+        with CaptureQueriesContext(connection) as cancelled:
+            self.client.post(reverse('delete_booking', kwargs={'pk': booking.id}))
+        self.assertEqual(Booking.objects.get(pk=booking.id).state, Booking.DELETED)
+        return len(booked), len(moved), len(cancelled)
+
+    def test_booking_writes_do_not_grow_with_the_stay(self):
+        """Booking, moving and cancelling a 60-night stay cost the queries of a 2-night one"""
+        self.assertEqual(self.write_stay(100, 60), self.write_stay(10, 2))
+        self.assertEqual(self.rollup(130)['occupied_rooms'], 0)
+
+    def test_backfill_matches_incremental(self):
+        """The backfill command rebuilds the same rows the signals maintain"""
+        for offset in range(3):
+            Booking.objects.create(room=self.room, checkin=self.day(offset), checkout=self.day(offset + 2),
+                                   guests=1, total=40.0 + offset)
+        maintained = sorted(DailyRollup.objects.values_list('date', 'room_type', *rollups.FIELDS))
+        DailyRollup.objects.all().delete()
+        call_command('backfill_rollups', stdout=StringIO())
+        self.assertEqual(sorted(DailyRollup.objects.values_list('date', 'room_type', *rollups.FIELDS)),
+                         maintained)
+
+    def test_check_reports_drift(self):
+        """--check passes on signal-maintained rollups and fails once a figure drifts"""
+        Booking.objects.create(room=self.room, checkin=self.day(1), checkout=self.day(3), guests=1, total=60.0)
+        out = StringIO()
+        call_command('backfill_rollups', '--check', stdout=out)
+        self.assertIn("in sync", out.getvalue())
+        DailyRollup.objects.filter(date=self.day(1)).update(arrivals=F('arrivals') + 1)
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('backfill_rollups', '--check', stdout=out)
+        self.assertIn("arrivals is 2, expected 1", out.getvalue())
+
+    def test_history_reads_only_rollups(self):
+        """The history page is served from the rollups"""
+        Booking.objects.create(room=self.room, checkin=self.day(0), checkout=self.day(2),
+                               guests=1, total=60.0)
+        url = reverse('dashboard_history') + f'?start={self.day(0)}&end={self.day(1)}'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse([q for q in queries if 'pms_booking' in q['sql']])
+        history = response.context['history']
+        self.assertEqual([row['occupied_rooms'] for row in history['periods']], [1, 1])
+        self.assertEqual([row['occupancy_rate'] for row in history['periods']], [100.0, 100.0])
+        self.assertEqual(history['totals']['revenue'], 60.0)
+
+        response = self.client.get(url + '&group=month')
+        self.assertEqual(sum(row['occupied_rooms'] for row in response.context['history']['periods']), 2)
+
+
+class ImportBookingsTest(TestCase):
+    def setUp(self):
+        self.double = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=self.double)
+        self.today = date.today()
+        Booking.objects.create(room=self.room, checkin=self.day(0), checkout=self.day(3), guests=1, total=90.0,
+                               customer=Customer.objects.create(name="Existing", email="e@x.com", phone="1"))
+
+    def day(self, offset):
+        return self.today + timedelta(days=offset)
+
+    def csv(self, *rows):
+        lines = ["room,checkin,checkout,guests,total,name,email,phone"]
+        lines += [",".join(str(value) for value in row) for row in rows]
+        return StringIO("\n".join(lines) + "\n")
+
+    def test_import_rejects_overlaps_and_invalid_rows(self):
+        """Rows overlapping stored or earlier imported stays go to the rejects file"""
+        stream = self.csv(
+            ("Room 1.1", self.day(3), self.day(5), 2, 60, "Ana", "ana@x.com", "600"),
+            ("Room 1.1", self.day(2), self.day(4), 1, 60, "Clash", "c@x.com", "601"),
+            ("Room 1.1", self.day(4), self.day(6), 1, 60, "Clash file", "cf@x.com", "602"),
+            ("Room 9.9", self.day(9), self.day(10), 1, 30, "Nowhere", "n@x.com", "603"),
+            ("Room 1.1", self.day(8), self.day(7), 1, 30, "Backwards", "b@x.com", "604"),
+        )
+        rejects = StringIO()
+        result = importer.import_bookings(stream, importer.CSV, rejects, chunk_size=2)
+        self.assertEqual((result.imported, result.rejected), (1, 4))
+        imported = Booking.objects.get(customer__name="Ana")
+        self.assertEqual(len(imported.code), 8)
+        self.assertEqual(RoomNight.objects.filter(booking=imported).count(), 2)
+        self.assertEqual(DailyRollup.objects.get(date=self.day(3), room_type=self.double).arrivals, 1)
+        rejected = {line.split(",")[5]: line for line in rejects.getvalue().splitlines()[1:]}
+        self.assertEqual(set(rejected), {"Clash", "Clash file", "Nowhere", "Backwards"})
+        self.assertIn("room not available", rejected["Clash file"])
+        self.assertIn("unknown room", rejected["Nowhere"])
+
+    def test_import_command_jsonl(self):
+        """The command reads JSON Lines and keeps given codes unique"""
+        rows = [
+            {"room": self.room.id, "checkin": str(self.day(5)), "checkout": str(self.day(6)), "guests": 1,
+             "total": 30, "name": "Luis", "email": "l@x.com", "phone": "7", "code": "abcd1234"},
+            {"room": self.room.id, "checkin": str(self.day(7)), "checkout": str(self.day(8)), "guests": 1,
+             "total": 30, "name": "Eva", "email": "e@x.com", "phone": "8", "code": "ABCD1234"},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bookings.jsonl")
+            with open(path, "w") as handle:
+                handle.write("\n".join(json.dumps(row) for row in rows) + "\n{broken\n")
+            out = StringIO()
+            call_command('import_bookings', path, stdout=out)
+            with open(path + ".rejects") as handle:
+                rejected = [json.loads(line) for line in handle]
+        self.assertIn("1 bookings imported, 2 rejected", out.getvalue())
+        self.assertTrue(Booking.objects.filter(code="ABCD1234", customer__name="Luis").exists())
+        errors = sorted(row["error"] for row in rejected)
+        self.assertIn("already exists", errors[0])
+        self.assertIn("invalid JSON", errors[1])
+
+
+class ExportBookingsTest(TestCase):
+    def setUp(self):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        self.other_room = Room.objects.create(name="Room 1.2", room_type=room_type)
+        self.today = date.today()
+        for offset, room in enumerate([self.room, self.other_room, self.room]):
+            Booking.objects.create(room=room, checkin=self.day(offset * 5), checkout=self.day(offset * 5 + 2),
+                                   guests=1, total=60.0,
+                                   customer=Customer.objects.create(name=f"Guest {offset}",
+                                                                    email=f"g{offset}@x.com", phone="600"))
+
+    def day(self, offset):
+        return self.today + timedelta(days=offset)
+
+    def test_streams_csv_with_one_query_per_table(self):
+        """The CSV export streams filtered rows with the customer joined in, live then archived"""
+        url = reverse('export_bookings') + f'?room=Room 1.1&start={self.day(1)}'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            content = b"".join(response.streaming_content).decode()
+        self.assertEqual(len(queries), 2)
+        lines = content.splitlines()
+        self.assertEqual(lines[0].split(","), list(exporter.COLUMNS))
+        self.assertEqual([line.split(",")[9] for line in lines[1:]], ["Guest 0", "Guest 2"])
+
+    def test_export_round_trips_through_import(self):
+        """A JSONL export is accepted by the importer"""
+        out = StringIO()
+        call_command('export_bookings', '--format', 'jsonl', '--state', Booking.NEW, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+        Booking.objects.all().delete()
+        result = importer.import_bookings(StringIO(out.getvalue()), importer.JSONL, StringIO())
+        self.assertEqual(result.imported, 3)
+        self.assertEqual(sorted(Booking.objects.values_list('customer__name', flat=True)),
+                         ["Guest 0", "Guest 1", "Guest 2"])
+
+
+class BookingLockTest(TestCase):
+    def setUp(self):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        self.checkin = date.today() + timedelta(days=10)
+        self.checkout = self.checkin + timedelta(days=3)
+
+    def book(self):
+        url = reverse('booking', kwargs={'pk': self.room.id}) + f'?checkin={self.checkin}&checkout={self.checkout}&guests=2'
+        return self.client.post(url, {
+            'customer-name': 'Chapp Test',
+            'customer-email': 'asd@as.es',
+            'customer-phone': '1',
+            'booking-checkin': self.checkin,
+            'booking-checkout': self.checkout,
+            'booking-guests': 2,
+            'booking-total': 90.0,
+            'booking-state': 'NEW',
+        })
+
+    def test_second_booking_of_the_same_stay_is_rejected(self):
+        """A booking that lost the race gets a 409 and leaves nothing behind"""
+        self.assertEqual(self.book().status_code, 302)
+        response = self.book()
+        self.assertEqual(response.status_code, 409)
+        self.assertContains(response, 'ya no está disponible', status_code=409)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(Customer.objects.count(), 1)
+
+    def test_room_is_locked_before_the_check(self):
+        """The room lock is the first statement of the booking transaction"""
+        with CaptureQueriesContext(connection) as queries:
+            self.book()
+        statements = [q['sql'] for q in queries]
+        locks = [i for i, sql in enumerate(statements) if sql.startswith('UPDATE "pms_room"')]
+        check = next(i for i, sql in enumerate(statements) if '"pms_booking"."checkin" <' in sql)
+        self.assertEqual(len(locks), 1)
+        self.assertLess(locks[0], check)
+
+    def test_cancellation_locks_the_room_first(self):
+        """Cancelling takes the room lock before it reads or writes anything in its transaction"""
+        self.book()
+        booking = Booking.objects.get()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post(reverse('delete_booking', kwargs={'pk': booking.id})).status_code, 302)
+        statements = [q['sql'] for q in queries]
+        savepoint = next(i for i, sql in enumerate(statements) if sql.startswith('SAVEPOINT'))
+        self.assertTrue(statements[savepoint + 1].startswith('UPDATE "pms_room"'), statements[savepoint + 1])
+        self.assertEqual(Booking.objects.get().state, Booking.DELETED)
+        self.assertFalse(RoomNight.objects.exists())
+        self.assertEqual(self.client.post(reverse('delete_booking', kwargs={'pk': 0})).status_code, 404)
+
+    def test_lock_needs_a_transaction(self):
+        """Locking outside a transaction would release the room at once"""
+        with self.assertRaises(transaction.TransactionManagementError):
+            with patch.object(connection, 'in_atomic_block', False):
+                reservations.lock_room(self.room.id)
+
+
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        for offset in range(0, 30, 3):
+            Booking.objects.create(room=self.room, checkin=date.today() + timedelta(days=offset),
+                                   checkout=date.today() + timedelta(days=offset + 2), guests=1, total=60.0,
+                                   customer=Customer.objects.create(name=f"Guest {offset}", email="g@x.com",
+                                                                    phone="600"))
+
+    def test_room_details_within_budget(self):
+        """Room details reads its bookings and their customers in one query"""
+        response = self.client.get(reverse('room_details', kwargs={'pk': self.room.id}))
+        self.assertContains(response, 'Guest 27')
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+
+    @override_settings(QUERY_BUDGETS={'room_details': 1})
+    def test_over_budget_fails_in_strict_mode(self):
+        """A view over its budget raises under tests and only logs otherwise"""
+        url = reverse('room_details', kwargs={'pk': self.room.id})
+        with self.assertLogs('pms.queries', 'WARNING'), \
+                self.assertRaisesMessage(QueryBudgetExceeded, 'room_details ran 2 queries, its budget is 1'):
+            self.client.get(url)
+        with override_settings(QUERY_BUDGET_STRICT=False), self.assertLogs('pms.queries', 'WARNING') as logs:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(logs.records[0].queries, 2)
+
+
+class ViewBenchmarkTest(TestCase):
+    def test_dataset_is_seeded_and_consistent(self):
+        """The generator repeats itself for a seed and never double books a room"""
+        size = datagen.DatasetSize(rooms=3, bookings=60, customers=10, seed=7)
+        datagen.generate(size)
+        stays = list(Booking.objects.order_by('id').values_list('room_id', 'checkin', 'checkout', 'state'))
+        self.assertEqual(len(stays), 60)
+        active = [stay for stay in stays if stay[3] == Booking.NEW]
+        for room_id, checkin, checkout, _ in active:
+            overlapping = [s for s in active if s[0] == room_id and s[1] < checkout and checkin < s[2]]
+            self.assertEqual(len(overlapping), 1)
+        self.assertEqual(RoomNight.objects.count(), sum((s[2] - s[1]).days for s in active))
+        self.assertTrue(DailyRollup.objects.exists())
+
+        Booking.objects.all().delete()
+        Room.objects.all().delete()
+        Room_type.objects.all().delete()
+        datagen.generate(size)
+        self.assertEqual([(s[1], s[2], s[3]) for s in stays],
+                         list(Booking.objects.order_by('id').values_list('checkin', 'checkout', 'state')))
+
+    def test_suite_times_every_view(self):
+        """Every view is measured, and a comparison flags the slower ones"""
+        datagen.generate(datagen.DatasetSize(rooms=4, bookings=40, customers=10))
+        results = benchmark_views.run(repeat=2, warmup=1)
+        self.assertEqual(set(results), {'home', 'room_search', 'booking_search', 'dashboard', 'room_details',
+                                        'rooms', 'check_booking_availability'})
+        self.assertTrue(all(result['p95_ms'] >= result['p50_ms'] for result in results.values()))
+
+        slower = dict(results['home'], p95_ms=results['home']['p95_ms'] * 2 + 5)
+        rows = benchmark_views.compare(results, dict(results, home=slower))
+        self.assertEqual({row['view']: row['verdict'] for row in rows if row['verdict'] != 'same'},
+                         {'home': 'slower'})
+
+
+@override_settings(ROOM_CATALOG_TIMEOUT=300)
+class RoomCatalogTest(TestCase):
+    def setUp(self):
+        self.double = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 2.1", room_type=self.double)
+        Room.objects.create(name="Room 3.1", room_type=self.double)
+        catalog.reset()
+        self.addCleanup(catalog.reset)
+
+    def ajax(self, query):
+        return self.client.get(reverse('rooms') + f'?q={query}', HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+
+    def test_ajax_filter_served_from_memory(self):
+        """Once the catalog is built the room filter runs no query"""
+        self.ajax('')
+        with self.assertNumQueries(0):
+            rooms = self.ajax('room 2')['rooms']
+        self.assertEqual(rooms, [{'id': self.room.id, 'name': 'Room 2.1', 'room_type__name': 'Doble'}])
+        self.assertIs(catalog.get_catalog().by_name['room 3.1'].room_type, catalog.get_catalog().get(self.room.id).room_type)
+
+    def test_room_and_type_changes_clear_the_catalog(self):
+        """Saving a room or a room type is visible on the next read"""
+        self.ajax('')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.name = "Room 9.9"
+            self.room.save()
+        self.assertEqual([room['name'] for room in self.ajax('9.9')['rooms']], ['Room 9.9'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.double.name = "Double"
+            self.double.save()
+        self.assertEqual(self.ajax('9.9')['rooms'][0]['room_type__name'], 'Double')
+
+
+class RateCalendarTest(TestCase):
+    def setUp(self):
+        self.double = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.suite = Room_type.objects.create(name="Suite", price=80.0, max_guests=4)
+        self.room = Room.objects.create(name="Room 1.1", room_type=self.double)
+        Room.objects.create(name="Room 5.1", room_type=self.suite)
+        self.checkin = date.today() + timedelta(days=10)
+        self.checkout = self.checkin + timedelta(days=4)
+        # two high season nights for the double rooms
+        for offset in (1, 2):
+            Rate.objects.create(room_type=self.double, date=self.checkin + timedelta(days=offset), price=50.0)
+
+    def test_price_table_totals_many_stays(self):
+        """Stays are priced night by night, base price where the calendar is empty"""
+        table = pricing.price_table(self.checkin, self.checkout)
+        day = lambda offset: self.checkin + timedelta(days=offset)
+        self.assertEqual(table.totals([
+            (self.double.id, day(0), day(4)),
+            (self.double.id, day(1), day(2)),
+            (self.double.id, day(3), day(4)),
+            (self.suite.id, day(0), day(4)),
+        ]), [160.0, 50.0, 30.0, 320.0])
+        self.assertIsNone(table.total(0, day(0), day(1)))
+        with self.assertRaises(ValueError):
+            table.total(self.double.id, day(0), day(5))
+
+    def test_search_and_booking_form_use_the_calendar(self):
+        """Room search and the booking form show the calendar total"""
+        response = self.client.post(reverse('search'), {'checkin': self.checkin, 'checkout': self.checkout,
+                                                        'guests': 1})
+        totals = {room.name: room.total for room in response.context['rooms']}
+        self.assertEqual(totals, {"Room 1.1": 160.0, "Room 5.1": 320.0})
+        response = self.client.get(reverse('booking', kwargs={'pk': self.room.id}),
+                                   {'checkin': self.checkin, 'checkout': self.checkout, 'guests': 1})
+        self.assertEqual(response.context['booking_form'].initial['total'], 160.0)
+
+    def test_checkout_before_checkin_is_rejected(self):
+        """Reversed or missing dates get a 400 with the form error instead of a pricing failure"""
+        reversed_dates = {'checkin': self.checkout, 'checkout': self.checkin, 'guests': 1}
+        response = self.client.post(reverse('search'), reversed_dates)
+        self.assertEqual(response.status_code, 400)
+        self.assertContains(response, "La fecha de salida debe ser posterior", status_code=400)
+        response = self.client.get(reverse('booking', kwargs={'pk': self.room.id}), reversed_dates)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('booking', kwargs={'pk': self.room.id}), {'guests': 1})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_queries_do_not_grow_with_rooms(self):
+        """Pricing more rooms costs no extra query"""
+        data = {'checkin': self.checkin, 'checkout': self.checkout, 'guests': 1}
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(reverse('search'), data)
+        Room.objects.bulk_create([Room(name=f"Room 9.{i}", room_type=self.double) for i in range(200)])
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.post(reverse('search'), data)
+        self.assertEqual(len(response.context['rooms']), 202)
+        self.assertEqual(len(many), len(few))
+
+
+class BatchAvailabilityTest(TestCase):
+    def setUp(self):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        self.other_room = Room.objects.create(name="Room 1.2", room_type=room_type)
+        self.today = date.today()
+        self.booking = Booking.objects.create(room=self.room, checkin=self.day(2), checkout=self.day(5),
+                                              guests=1, total=90.0)
+        self.addCleanup(availability.reset)
+
+    def day(self, offset):
+        return (self.today + timedelta(days=offset)).isoformat()
+
+    def post(self, queries):
+        return self.client.post(reverse('batch_availability'), json.dumps({'queries': queries}),
+                                content_type='application/json')
+
+    def check_batch(self):
+        queries = [
+            {'room': self.room.id, 'checkin': self.day(4), 'checkout': self.day(6)},
+            {'room': self.room.id, 'checkin': self.day(5), 'checkout': self.day(6)},
+            {'room': self.room.id, 'checkin': self.day(0), 'checkout': self.day(9), 'exclude': self.booking.id},
+            {'room': self.other_room.id, 'checkin': self.day(2), 'checkout': self.day(5)},
+            {'room': self.room.id, 'checkin': self.day(3), 'checkout': self.day(3)},
+            {'room': self.room.id},
+        ]
+        with CaptureQueriesContext(connection) as queries_run:
+            results = self.post(queries).json()['results']
+        self.assertEqual([result.get('conflicts') for result in results],
+                         [[self.booking.id], [], [], [], None, None])
+        self.assertEqual([result.get('available') for result in results[:4]], [False, True, True, True])
+        self.assertIn('error', results[4])
+        return queries_run
+
+    def test_batch_with_one_query(self):
+        """Every tuple is answered from a single database query"""
+        self.assertEqual(len(self.check_batch()), 1)
+
+    @override_settings(AVAILABILITY_BACKEND='memory')
+    def test_batch_from_memory(self):
+        """The in-memory index answers the same batch, only the change feed is read"""
+        availability.reset()
+        availability.get_index()
+        self.assertEqual([q['sql'].split(' FROM ')[1].split()[0] for q in self.check_batch()],
+                         ['"pms_bookingchange"'])
+
+    @override_settings(AVAILABILITY_BATCH_LIMIT=2)
+    def test_rejects_oversized_and_malformed_batches(self):
+        """Batches over the limit or without a query list get a 400"""
+        self.assertEqual(self.post([{}] * 3).status_code, 400)
+        response = self.client.post(reverse('batch_availability'), 'nope', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AvailabilityGridTest(TestCase):
+    def setUp(self):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        self.other_room = Room.objects.create(name="Room <1.2>", room_type=room_type)
+        self.today = date.today()
+        # starts before the window, ends inside it
+        Booking.objects.create(room=self.room, checkin=self.today - timedelta(days=3),
+                               checkout=self.today + timedelta(days=2), guests=1, total=90.0)
+        Booking.objects.create(room=self.room, checkin=self.today + timedelta(days=4),
+                               checkout=self.today + timedelta(days=9), guests=1, total=90.0)
+        Booking.objects.create(room=self.other_room, checkin=self.today + timedelta(days=1),
+                               checkout=self.today + timedelta(days=2), guests=1, total=30.0,
+                               state=Booking.DELETED)
+
+    def test_json_matrix(self):
+        """Stays are clipped to the window and cancelled ones are left out"""
+        url = reverse('availability_grid') + f'?start={self.today}&days=6&format=json'
+        data = self.client.get(url).json()
+        self.assertEqual([room['name'] for room in data['rooms']], ['Room 1.1', 'Room <1.2>'])
+        self.assertEqual(data['matrix'], [[1, 1, 0, 0, 1, 1], [0, 0, 0, 0, 0, 0]])
+        self.assertEqual(len(data['dates']), 6)
+
+    def test_html_grid_for_many_rooms(self):
+        """A year for 500 rooms renders from a couple of queries"""
+        room_type = Room_type.objects.get()
+        Room.objects.bulk_create([Room(name=f"Room 9.{i}", room_type=room_type) for i in range(500)])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('availability_grid') + f'?start={self.today}&days=400')
+        self.assertLessEqual(len(queries), 2)
+        self.assertEqual(response.context['grid'].days, 365)
+        self.assertContains(response, 'Room &lt;1.2&gt;')
+        self.assertEqual(response.content.count(b'grid-taken'), 2 + 5)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(TestCase):
+    # the replica test database stays empty, as a replica lagging behind would be
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        self.booking = Booking.objects.create(room=self.room, checkin=date.today(),
+                                              checkout=date.today() + timedelta(days=2), guests=1, total=60.0)
+
+    def listed(self):
+        return [booking.id for booking in self.client.get(reverse('home')).context['bookings']]
+
+    def test_read_views_use_the_replica(self):
+        """Listed views read the replica, the others and all writes use the primary"""
+        self.assertEqual(self.listed(), [])
+        response = self.client.get(reverse('edit_booking', kwargs={'pk': self.booking.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(routers.STICKY_COOKIE, self.client.cookies)
+
+    def test_client_that_wrote_reads_the_primary(self):
+        """After a write the same client keeps reading from the primary"""
+        self.client.post(reverse('delete_booking', kwargs={'pk': self.booking.id}))
+        self.assertIn(routers.STICKY_COOKIE, self.client.cookies)
+        self.assertEqual(self.listed(), [self.booking.id])
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            self.client.cookies[routers.STICKY_COOKIE] = "0"
+            self.assertEqual(self.listed(), [])
+
+    def test_dashboard_figures_read_the_primary(self):
+        """The shared dashboard figures are computed on the primary, even for a replica view"""
+        with override_settings(REPLICA_READ_VIEWS=['dashboard']):
+            figures = self.client.get(reverse('dashboard')).context['dashboard']
+        self.assertEqual((figures['incoming_guests'], figures['total_rooms']), (1, 1))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+class SqlitePragmaTest(TestCase):
+    def test_profile_applied_to_new_connections(self):
+        """Every connection gets the pragmas of the profile and the overrides"""
+        with override_settings(SQLITE_PROFILE='production', SQLITE_PRAGMAS={'cache_size': -1000}):
+            fresh = connections.create_connection('default')
+            self.addCleanup(fresh.close)
+            with fresh.cursor() as cursor:
+                values = [cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                          for name in ('synchronous', 'busy_timeout', 'temp_store', 'cache_size')]
+        self.assertEqual(values, [1, 5000, 2, -1000])
+
+    @override_settings(SQLITE_PROFILE='fastest')
+    def test_unknown_profile(self):
+        """A misspelt profile fails loudly instead of running untuned"""
+        with self.assertRaisesMessage(ValueError, "unknown SQLITE_PROFILE 'fastest'"):
+            sqlite.pragmas()
+
+
+class ArchiveBookingsTest(TestCase):
+    def setUp(self):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        today = date.today()
+        self.old = self.book("Old Guest", today - timedelta(days=400), today - timedelta(days=398))
+        self.cancelled = self.book("Gone Guest", today - timedelta(days=500), today - timedelta(days=490),
+                                   state=Booking.DELETED)
+        self.recent = self.book("Recent Guest", today - timedelta(days=3), today - timedelta(days=1))
+
+    def book(self, name, checkin, checkout, state=Booking.NEW):
+        customer = Customer.objects.create(name=name, email="g@x.com", phone="600")
+        return Booking.objects.create(room=self.room, customer=customer, checkin=checkin, checkout=checkout,
+                                      guests=1, total=60.0, state=state)
+
+    def test_command_moves_old_bookings_with_their_ids(self):
+        """Stays that left before the cutoff move to the archive, the ledger rows go and the rollups stay"""
+        revenue = DailyRollup.objects.aggregate(total=Sum("revenue"))["total"]
+        call_command('archive_bookings', '--days', '365', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(list(Booking.objects.values_list('id', flat=True)), [self.recent.id])
+        archived = ArchivedBooking.objects.get(pk=self.old.pk)
+        self.assertEqual((archived.code, archived.customer_id, archived.checkin),
+                         (self.old.code, self.old.customer_id, self.old.checkin))
+        self.assertEqual(ArchivedBooking.objects.get(pk=self.cancelled.pk).state, Booking.DELETED)
+        self.assertFalse(RoomNight.objects.filter(booking_id=self.old.pk).exists())
+        self.assertEqual(DailyRollup.objects.aggregate(total=Sum("revenue"))["total"], revenue)
+
+    def test_dry_run_only_counts(self):
+        """--dry-run leaves every booking in place"""
+        out = StringIO()
+        call_command('archive_bookings', '--dry-run', stdout=out)
+        self.assertIn("2 bookings", out.getvalue())
+        self.assertEqual(Booking.objects.count(), 3)
+
+    def test_search_and_export_read_the_archive(self):
+        """Archived bookings are still found by the search and included in the exports"""
+        list(archive.archive(date.today() - timedelta(days=365)))
+        response = self.client.get(reverse('booking_search') + '?filter=old')
+        self.assertEqual([b.code for b in response.context['archived']], [self.old.code])
+        self.assertContains(response, "Reservas archivadas")
+        self.assertNotContains(response, "No hay resultados")
+        exported = [row["code"] for row in exporter.rows(exporter.bookings())]
+        live = list(Booking.objects.order_by('id').values_list('code', flat=True))
+        archived = list(ArchivedBooking.objects.order_by('id').values_list('code', flat=True))
+        self.assertIn(self.old.code, archived)
+        self.assertEqual(exported, live + archived)
+
+    @override_settings(BOOKINGS_PAGE_SIZE=1)
+    def test_archived_matches_have_their_own_cursor(self):
+        """Archived matches follow the last live page and are paged on their own, never repeated"""
+        list(archive.archive(date.today() - timedelta(days=365)))
+        later = self.book("Later Guest", date.today() + timedelta(days=3), date.today() + timedelta(days=5))
+        url = reverse('booking_search') + '?filter=guest'
+        with patch('pms.search.ARCHIVE_PAGE_SIZE', 1):
+            first = self.client.get(url)
+            self.assertEqual(len(first.context['bookings']), 1)
+            self.assertFalse(first.context['archived'])
+            last = self.client.get(url + f'&after={first.context["page"].next_cursor}')
+            self.assertEqual([b.id for b in first.context['bookings']] + [b.id for b in last.context['bookings']],
+                             [later.id, self.recent.id])
+            archived = last.context['archived']
+            self.assertEqual(len(archived), 1)
+            following = self.client.get(url + f'&archived_after={archived.next_cursor}')
+        self.assertFalse(following.context['bookings'])
+        self.assertFalse(following.context['archived'].has_next)
+        self.assertEqual({b.id for b in archived} | {b.id for b in following.context['archived']},
+                         {self.old.id, self.cancelled.id})
+
+    def test_archived_codes_are_not_reused(self):
+        """The allocator skips codes held by archived bookings"""
+        list(archive.archive(date.today() - timedelta(days=365)))
+        with patch('pms.reservation_code.generate.get', side_effect=[self.old.code, "NEWCODE1"]):
+            self.assertEqual(allocator.allocate(1), ["NEWCODE1"])
+
+
+class CustomerIdentityTest(TestCase):
+    def setUp(self):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+
+    def book(self, checkin, email, phone):
+        checkout = checkin + timedelta(days=2)
+        url = reverse('booking', kwargs={'pk': self.room.id}) + f'?checkin={checkin}&checkout={checkout}&guests=2'
+        return self.client.post(url, {
+            'customer-name': 'Ana García',
+            'customer-email': email,
+            'customer-phone': phone,
+            'booking-checkin': checkin,
+            'booking-checkout': checkout,
+            'booking-guests': 2,
+            'booking-total': 60.0,
+            'booking-state': 'NEW',
+        })
+
+    def test_identity_is_normalized(self):
+        """Email case and phone formatting do not change the identity"""
+        self.assertEqual(Customer.identity(" Ana@Example.com ", "+34 600-111-222"),
+                         Customer.identity("ana@example.com", "0034600111222"))
+        self.assertEqual(Customer.identity("", ""), "")
+
+    def test_returning_guest_keeps_their_customer(self):
+        """A second stay with the same email and phone is booked under the same customer"""
+        today = date.today()
+        self.book(today + timedelta(days=10), "ana@example.com", "600 111 222")
+        self.book(today + timedelta(days=20), "ANA@example.com", "600111222")
+        self.assertEqual(Customer.objects.count(), 1)
+        self.assertEqual(Booking.objects.filter(customer=Customer.objects.get()).count(), 2)
+
+    def test_importer_reuses_known_customers(self):
+        """Imported rows of a known guest, or repeated within the file, share one customer"""
+        known = Customer.objects.create(name="Ana", email="ana@example.com", phone="600")
+        lines = "".join(json.dumps({"room": self.room.name, "checkin": str(date(2030, 1, day)),
+                                    "checkout": str(date(2030, 1, day + 1)), "guests": 1, "total": 30,
+                                    "name": "Ana", "email": email, "phone": "600"}) + "\n"
+                        for day, email in ((1, "Ana@example.com"), (3, "eva@example.com"), (5, "eva@example.com")))
+        result = importer.import_bookings(StringIO(lines), importer.JSONL, StringIO())
+        self.assertEqual(result.imported, 3)
+        self.assertEqual(Customer.objects.count(), 2)
+        self.assertEqual(Booking.objects.filter(customer=known).count(), 1)
+
+    def test_dedup_merges_and_repoints_bookings(self):
+        """dedup_customers keeps the oldest customer and moves the bookings of the others to it"""
+        first, second, third = [Customer.objects.create(name="Ana", email=email, phone="600")
+                                for email in ("ana@example.com", "ANA@example.com", "ana@example.com")]
+        Customer.objects.filter(pk=third.pk).update(identity_key="")
+        today = date.today()
+        bookings = [Booking.objects.create(room=self.room, customer=customer, guests=1, total=30.0,
+                                           checkin=today + timedelta(days=offset),
+                                           checkout=today + timedelta(days=offset + 1))
+                    for offset, customer in enumerate((first, second, third))]
+        ArchivedBooking.objects.create(id=10 ** 6, state=Booking.NEW, checkin=date(2020, 1, 1),
+                                       checkout=date(2020, 1, 2), room=self.room, guests=1,
+                                       customer=second, total=30.0, code="ARCH0001", created=timezone.now())
+        out = StringIO()
+        call_command('dedup_customers', '--batch-size', '1', stdout=out)
+        self.assertIn("2 removed", out.getvalue())
+        self.assertEqual(list(Customer.objects.values_list('id', flat=True)), [first.id])
+        self.assertEqual({b.customer_id for b in Booking.objects.filter(pk__in=[b.pk for b in bookings])},
+                         {first.id})
+        self.assertEqual(ArchivedBooking.objects.get().customer_id, first.id)
+
+    def test_dedup_dry_run_writes_nothing(self):
+        """--dry-run counts the duplicates, keys missing included, without touching the customers"""
+        for email in ("ana@example.com", "ANA@example.com", "eva@example.com"):
+            Customer.objects.create(name="Ana", email=email, phone="600")
+        Customer.objects.filter(email="ANA@example.com").update(identity_key="")
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('dedup_customers', '--dry-run', stdout=out)
+        self.assertIn("1 customers without identity key would be updated", out.getvalue())
+        self.assertIn("1 identities with duplicates", out.getvalue())
+        self.assertTrue(all(q['sql'].startswith('SELECT') for q in queries.captured_queries))
+        self.assertEqual(Customer.objects.filter(identity_key="").count(), 1)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite write lock')
+class ConcurrentBookingViewTest(TransactionTestCase):
+    # the in-memory test database fails on table locks at once, the workers
+    # post against a file copy of it where they queue on the busy timeout
+    THREADS = 6
+    CANCELLERS = 3
+
+    def setUp(self):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        # stays of the same room, cancelled while the others book
+        self.cancelled = [Booking.objects.create(room=self.room, guests=1, total=60.0,
+                                                 checkin=date.today() + timedelta(days=20 + 2 * number),
+                                                 checkout=date.today() + timedelta(days=21 + 2 * number)).id
+                          for number in range(self.CANCELLERS)]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'concurrent.sqlite3')
+        connection.ensure_connection()
+        with closing(sqlite3.connect(self.path)) as target:
+            connection.connection.backup(target)
+            # in the journal mode of the profile, as a deployed database already is:
+            # workers switching it at once would fail on each other
+            target.execute("PRAGMA journal_mode = %s" % sqlite.pragmas().get("journal_mode", "DELETE"))
+
+    def post_from_worker(self, kind, url, data, barrier, outcomes):
+        # a connection of its own to the file, for this thread only
+        settings_dict = dict(connection.settings_dict, NAME=self.path)
+        connections['default'] = type(connections['default'])(settings_dict, 'default')
+        try:
+            barrier.wait()
+            outcomes.append((kind, Client().post(url, data).status_code))
+        except Exception as error:
+            outcomes.append((kind, repr(error)))
+        finally:
+            connections['default'].close()
+
+    def booking_post(self, number):
+        checkin = date.today() + timedelta(days=10)
+        checkout = checkin + timedelta(days=2)
+        url = reverse('booking', kwargs={'pk': self.room.id}) + f'?checkin={checkin}&checkout={checkout}&guests=2'
+        return 'book', url, {
+            'customer-name': 'Guest %s' % number,
+            'customer-email': 'guest%s@example.com' % number,
+            'customer-phone': str(number),
+            'booking-checkin': checkin,
+            'booking-checkout': checkout,
+            'booking-guests': 2,
+            'booking-total': 60.0,
+            'booking-state': 'NEW',
+        }
+
+    def test_concurrent_posts_for_one_room(self):
+        """Guests booking and cancelling the same room at once never meet a locked database"""
+        posts = [self.booking_post(number) for number in range(self.THREADS)]
+        posts += [('cancel', reverse('delete_booking', kwargs={'pk': pk}), {}) for pk in self.cancelled]
+        barrier = threading.Barrier(len(posts))
+        outcomes = []
+        workers = [threading.Thread(target=self.post_from_worker, args=(*post, barrier, outcomes))
+                   for post in posts]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        booked = [status for kind, status in outcomes if kind == 'book']
+        cancelled = [status for kind, status in outcomes if kind == 'cancel']
+        self.assertEqual(sorted(booked, key=str), [302] + [409] * (self.THREADS - 1))
+        self.assertEqual(cancelled, [302] * self.CANCELLERS)
+        with closing(sqlite3.connect(self.path)) as copy:
+            self.assertEqual(copy.execute("SELECT COUNT(*) FROM pms_booking WHERE state = 'NEW'").fetchone()[0], 1)
+            # the customers of the rejected posts were rolled back with them
+            self.assertEqual(copy.execute("SELECT COUNT(*) FROM pms_customer").fetchone()[0], 1)
+
+
+class BookingCodeLookupTest(TestCase):
+    def setUp(self):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        customer = Customer.objects.create(name="Ana García", email="ana@example.com", phone="600")
+        today = date.today()
+        for offset, code in enumerate(("ab12cd34", "AB12ZZ99", "AB13AAAA", "XY000000")):
+            Booking.objects.create(room=self.room, customer=customer, code=code, guests=1, total=30.0,
+                                   checkin=today + timedelta(days=offset * 2),
+                                   checkout=today + timedelta(days=offset * 2 + 1))
+        ArchivedBooking.objects.create(id=10 ** 6, state=Booking.NEW, checkin=date(2020, 1, 1),
+                                       checkout=date(2020, 1, 2), room=self.room, guests=1, customer=customer,
+                                       total=30.0, code="AB12AAAA", created=timezone.now())
+
+    def test_codes_are_stored_upper_cased(self):
+        """A code given in lower case is saved upper-cased and found exactly"""
+        self.assertEqual(search.find_code("ab12cd34").code, "AB12CD34")
+
+    def test_full_code_search_shows_that_booking(self):
+        """A whole code in the search box is looked up directly, a prefix goes to the full search"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('booking_search') + '?filter=ab12cd34')
+        self.assertEqual([b.code for b in response.context['bookings']], ["AB12CD34"])
+        self.assertFalse(response.context['archived'])
+        self.assertFalse([q for q in queries if 'pms_booking_fts' in q['sql'] or 'pms_archivedbooking' in q['sql']])
+        self.assertIsNone(search.find_code("ab12"))
+        response = self.client.get(reverse('booking_search') + '?filter=ab12')
+        self.assertEqual(len(response.context['bookings']), 2)
+
+    def test_autocomplete_returns_prefix_matches_in_code_order(self):
+        """The endpoint lists live and archived codes with the prefix, first N only"""
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('booking_codes') + '?q=ab12&limit=2')
+        results = response.json()['results']
+        self.assertEqual([r['code'] for r in results], ["AB12AAAA", "AB12CD34"])
+        self.assertEqual([r['archived'] for r in results], [True, False])
+        self.assertEqual(results[1]['customer'], "Ana García")
+        self.assertEqual(self.client.get(reverse('booking_codes') + '?q=a b').json()['results'], [])
+
+    def test_prefix_lookup_is_an_index_range_scan(self):
+        """The prefix filter seeks the unique code index instead of scanning the table"""
+        plan = Booking.objects.filter(search.code_range("AB12")).order_by("code").values("code")[:10].explain()
+        self.assertIn("USING COVERING INDEX", plan)
+        self.assertIn("code>? AND code<?", plan)
+
+    def test_search_without_fts_matches_code_prefix(self):
+        """Backends without FTS match the code by prefix, not by substring"""
+        with patch('pms.fts.supported', return_value=False):
+            bookings, _ = search.search_bookings("ab12")
+            self.assertEqual(sorted(b.code for b in bookings), ["AB12CD34", "AB12ZZ99"])
+            bookings, _ = search.search_bookings("12cd")
+            self.assertEqual(list(bookings), [])
+
+
+class BookingChangeFeedTest(TestCase):
+    def setUp(self):
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        self.checkin = date.today() + timedelta(days=10)
+        self.checkout = self.checkin + timedelta(days=2)
+
+    def book(self):
+        url = reverse('booking', kwargs={'pk': self.room.id}) + \
+            f'?checkin={self.checkin}&checkout={self.checkout}&guests=2'
+        self.client.post(url, {
+            'customer-name': 'Ana García',
+            'customer-email': 'ana@example.com',
+            'customer-phone': '600',
+            'booking-checkin': self.checkin,
+            'booking-checkout': self.checkout,
+            'booking-guests': 2,
+            'booking-total': 60.0,
+            'booking-state': 'NEW',
+        })
+        return Booking.objects.latest('id')
+
+    def feed(self, after=0, limit=None):
+        url = reverse('booking_changes') + f'?after={after}' + (f'&limit={limit}' if limit else '')
+        return self.client.get(url).json()
+
+    def test_every_write_path_is_logged(self):
+        """Create, customer edit, date change and cancellation each append one change"""
+        booking = self.book()
+        self.client.post(reverse('edit_booking', kwargs={'pk': booking.id}), {
+            'customer-name': 'Ana G.', 'customer-email': 'ana@example.com', 'customer-phone': '600'})
+        new_checkout = self.checkout + timedelta(days=1)
+        self.client.post(reverse('edit_booking_dates', kwargs={'pk': booking.id}),
+                         {'checkin': self.checkin, 'checkout': new_checkout})
+        self.client.post(reverse('delete_booking', kwargs={'pk': booking.id}))
+        changes = self.feed()['changes']
+        self.assertEqual([c['kind'] for c in changes], ["created", "customer", "dates", "cancelled"])
+        self.assertEqual({c['booking'] for c in changes}, {booking.id})
+        self.assertEqual(changes[1]['booking_data']['customer']['name'], "Ana G.")
+        self.assertEqual(changes[2]['booking_data']['checkout'], new_checkout.isoformat())
+        self.assertEqual(changes[3]['booking_data']['state'], Booking.DELETED)
+
+    def test_cursor_pages_through_changes_in_one_query(self):
+        """?after= returns only newer changes, with the cursor to ask from next"""
+        self.book()
+        self.checkin, self.checkout = self.checkout, self.checkout + timedelta(days=2)
+        self.book()
+        with self.assertNumQueries(1):
+            first = self.feed(limit=1)
+        self.assertTrue(first['has_more'])
+        second = self.feed(after=first['next'])
+        self.assertEqual(len(second['changes']), 1)
+        self.assertFalse(second['has_more'])
+        self.assertGreater(second['changes'][0]['seq'], first['next'])
+        self.assertEqual(self.feed(after=second['next'])['changes'], [])
+
+    def test_bulk_writers_and_archive_are_logged(self):
+        """Imported bookings appear as created, archived ones as removed"""
+        line = json.dumps({"room": self.room.name, "checkin": "2020-01-01", "checkout": "2020-01-03",
+                           "guests": 1, "total": 60, "name": "Eva", "email": "eva@example.com", "phone": "1"})
+        importer.import_bookings(StringIO(line + "\n"), importer.JSONL, StringIO())
+        booking = Booking.objects.get()
+        list(archive.archive(date.today()))
+        kinds = list(BookingChange.objects.filter(booking_id=booking.id).order_by('id')
+                     .values_list('kind', flat=True))
+        self.assertEqual(kinds, [BookingChange.CREATED, BookingChange.REMOVED])
+        self.assertEqual(BookingChange.objects.first().data['customer']['email'], "eva@example.com")
+
+    def test_feed_refuses_other_databases(self):
+        """The system checks stop the app on a database whose ids may commit out of order"""
+        self.assertEqual(changes.check_database(), [])
+        with patch.object(connections['default'], 'vendor', 'postgresql'):
+            self.assertEqual([error.id for error in changes.check_database()], ['pms.E001'])
+
+
+MEMO_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'pms-availability-memo-tests')
+
+
+@override_settings(AVAILABILITY_BACKEND='sql',
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                       'LOCATION': MEMO_CACHE_DIR}})
+class AvailabilityMemoTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        memo.reset()
+        room_type = Room_type.objects.create(name="Doble", price=30.0, max_guests=2)
+        self.room = Room.objects.create(name="Room 1.1", room_type=room_type)
+        self.today = date.today()
+        self.booking = Booking.objects.create(room=self.room, checkin=self.today,
+                                              checkout=self.today + timedelta(days=2), guests=1, total=60.0)
+        self.url = reverse('check_booking_availability', kwargs={'pk': self.booking.id})
+        self.dates = {'checkin': self.today + timedelta(days=5), 'checkout': self.today + timedelta(days=7)}
+
+    def test_repeated_check_skips_the_overlap_query(self):
+        """The same question about an unchanged room is answered without the overlap query"""
+        with self.assertNumQueries(2):
+            self.assertTrue(self.client.post(self.url, self.dates).json()['available'])
+        # only the booking's room is read again
+        with self.assertNumQueries(1):
+            self.assertTrue(self.client.post(self.url, self.dates).json()['available'])
+        stats = self.client.get(reverse('availability_memo_stats')).json()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_booking_write_invalidates_the_room(self):
+        """A committed booking of the room replaces its version, the next check sees it"""
+        self.assertTrue(self.client.post(self.url, self.dates).json()['available'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(room=self.room, checkin=self.dates['checkin'], checkout=self.dates['checkout'],
+                                   guests=1, total=60.0)
+        self.assertFalse(self.client.post(self.url, self.dates).json()['available'])
+        self.assertEqual(memo.stats()['misses'], 2)
+
+    def test_lru_evicts_the_oldest_answer(self):
+        """The memo keeps AVAILABILITY_MEMO_SIZE answers, the least recently used go first"""
+        lru = memo.AvailabilityMemo(size=2)
+        for offset in range(3):
+            lru.get(self.room.id, self.day(offset), self.day(offset + 1), None, lambda: [])
+        lru.get(self.room.id, self.day(0), self.day(1), None, lambda: [])
+        self.assertEqual(lru.stats()['evictions'], 2)
+        self.assertEqual(lru.stats()['hits'], 0)
+
+    def check_from_two_workers(self, first, second):
+        # each worker reads and replaces room versions in its own cache object
+        with patch('pms.memo.version_cache', return_value=first):
+            self.assertTrue(self.client.post(self.url, self.dates).json()['available'])
+        with patch('pms.memo.version_cache', return_value=second), self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(room=self.room, checkin=self.dates['checkin'], checkout=self.dates['checkout'],
+                                   guests=1, total=60.0)
+        with patch('pms.memo.version_cache', return_value=first):
+            self.assertFalse(self.client.post(self.url, self.dates).json()['available'])
+
+    def test_shared_cache_carries_versions_between_workers(self):
+        """A write committed by another worker reaches this worker's memo through the shared cache"""
+        self.check_from_two_workers(FileBasedCache(MEMO_CACHE_DIR, {}), FileBasedCache(MEMO_CACHE_DIR, {}))
+        self.assertEqual(memo.stats()['misses'], 2)
+
+    def test_per_process_caches_bypass_the_memo(self):
+        """Two per-process caches never see each other's versions, checks read the database"""
+        self.check_from_two_workers(LocMemCache('memo-worker-a', {}), LocMemCache('memo-worker-b', {}))
+        self.assertEqual(memo.stats()['bypassed'], 2)
+        self.assertEqual(memo.stats()['entries'], 0)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_cache_without_storage_bypasses_the_memo(self):
+        """Without a cache to hold room versions every check reads the database"""
+        self.client.post(self.url, self.dates)
+        self.client.post(self.url, self.dates)
+        self.assertEqual(memo.stats()['bypassed'], 2)
+        self.assertEqual(memo.stats()['entries'], 0)
+
+    def day(self, offset):
+        return self.today + timedelta(days=offset)
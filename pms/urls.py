@@ -5,14 +5,21 @@ urlpatterns = [
 
     path("", views.HomeView.as_view(), name="home"),
     path("search/room/", views.RoomSearchView.as_view(), name="search"),
+    path("bookings/export/", views.BookingExportView.as_view(), name="export_bookings"),
+    path("bookings/changes/", views.booking_changes, name="booking_changes"),
     path("search/booking/", views.BookingSearchView.as_view(), name="booking_search"),
+    path("search/booking/codes/", views.booking_codes, name="booking_codes"),
     path("booking/<str:pk>/", views.BookingView.as_view(), name="booking"),
     path("booking/<str:pk>/edit", views.EditBookingView.as_view(), name="edit_booking"),
     path("booking/<str:pk>/delete", views.DeleteBookingView.as_view(), name="delete_booking"),
     path("rooms/", views.RoomsView.as_view(), name="rooms"),
+    path("rooms/availability/", views.AvailabilityGridView.as_view(), name="availability_grid"),
     path("room/<str:pk>/", views.RoomDetailsView.as_view(), name="room_details"),
     path("dashboard/", views.DashboardView.as_view(), name="dashboard"),
+    path("dashboard/history/", views.DashboardHistoryView.as_view(), name="dashboard_history"),
     path("booking/<str:pk>/edit-dates", views.EditBookingDatesView.as_view(), name="edit_booking_dates"),
     path('booking/<int:pk>/check-dates/', views.check_booking_availability, name='check_booking_availability'),
+    path('availability/batch/', views.batch_availability, name='batch_availability'),
+    path('availability/memo/stats/', views.availability_memo_stats, name='availability_memo_stats'),
 
 ]
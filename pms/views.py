@@ -1,14 +1,16 @@
-from django.db.models import F, Q, Count, Sum
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils.decorators import method_decorator
-from django.http import JsonResponse, HttpRequest, HttpResponse
+from django.http import Http404, JsonResponse, HttpRequest, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from typing import Dict, Any
 from django.views import View
 from .models import Room, Booking
 from .forms import *
 from .form_dates import Ymd
 from django.views.decorators.csrf import ensure_csrf_cookie
-from .reservation_code import generate
+from .pagination import KeysetPage, paginate
+from . import availability, catalog, changes, customers, dashboard, exporter, grid, memo, pricing, reservations, rollups, search
 from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -20,14 +22,33 @@ class BookingSearchView(View):
         query = request.GET.dict()
         if (not "filter" in query):
             return redirect("/")
-        bookings = (Booking.objects
-                    .filter(Q(code__icontains=query['filter']) | Q(customer__name__icontains=query['filter']))
-                    .order_by("-created"))
+        archived_after, archived_before = query.get("archived_after"), query.get("archived_before")
+        browsing_archive = archived_after is not None or archived_before is not None
+        # a whole reservation code is that booking alone, read through the unique index
+        booking = None if browsing_archive else search.find_code(query['filter'])
+        if booking is not None:
+            page = KeysetPage([booking])
+        elif browsing_archive:
+            # the live matches were all shown before the archived ones
+            page = KeysetPage()
+        else:
+            bookings, ordering = search.search_bookings(query['filter'])
+            bookings = bookings.select_related("customer", "room")
+            page = paginate(bookings, ordering, after=query.get("after"), before=query.get("before"))
+        archived_page = KeysetPage()
+        if booking is None and (browsing_archive or not page.has_next):
+            archived, archive_ordering = search.search_archive(query['filter'])
+            archived_page = paginate(archived.select_related("customer", "room"), archive_ordering,
+                                     after=archived_after, before=archived_before,
+                                     page_size=search.ARCHIVE_PAGE_SIZE)
         room_search_form = RoomSearchForm()
         context = {
-            'bookings': bookings,
+            'bookings': page,
+            'page': page,
+            'archived': archived_page,
             'form': room_search_form,
-            'filter': True
+            'filter': True,
+            'filter_query': query['filter']
         }
         return render(request, "home.html", context)
 
@@ -44,6 +65,10 @@ class RoomSearchView(View):
 
     # renders the search results of available rooms by date and guests
     def post(self, request):
+        room_search_form = RoomSearchForm(request.POST)
+        if not room_search_form.is_valid():
+            # missing dates or a checkout that is not after the checkin
+            return render(request, "booking_search_form.html", {'form': room_search_form}, status=400)
         query = request.POST.dict()
         # calculate number of days in the hotel
         checkin = Ymd.Ymd(query['checkin'])
@@ -53,23 +78,30 @@ class RoomSearchView(View):
         filters = {
             'room_type__max_guests__gte': query['guests']
         }
+        # rooms with at least one night taken in the requested stay
         exclude = {
-            'booking__checkin__lte': query['checkout'],
-            'booking__checkout__gte': query['checkin'],
-            'booking__state__exact': "NEW"
+            'id__in': availability.occupied_rooms(query['checkin'], query['checkout'])
         }
-        rooms = (Room.objects
-                 .filter(**filters)
-                 .exclude(**exclude)
-                 .annotate(total=total_days * F('room_type__price'))
-                 .order_by("room_type__max_guests", "name")
-                 )
-        total_rooms = (Room.objects
-                       .filter(**filters)
-                       .values("room_type__name", "room_type")
-                       .exclude(**exclude)
-                       .annotate(total=Count('room_type'))
-                       .order_by("room_type__max_guests"))
+        rooms = list(Room.objects
+                     .select_related("room_type")
+                     .filter(**filters)
+                     .exclude(**exclude)
+                     .order_by("room_type__max_guests", "name")
+                     )
+        # every room priced from the rate calendar, one table for the whole stay
+        prices = pricing.price_table(query['checkin'], query['checkout'],
+                                     {room.room_type_id: room.room_type.price for room in rooms})
+        for room in rooms:
+            room.total = prices.total(room.room_type_id, query['checkin'], query['checkout'])
+        # available rooms per type, counted from the rooms above rather than a second query
+        total_rooms = {}
+        for room in rooms:
+            group = total_rooms.setdefault(room.room_type_id, {
+                'room_type__name': room.room_type.name if room.room_type else None,
+                'room_type': room.room_type_id,
+                'total': 0})
+            group['total'] += 1
+        total_rooms = list(total_rooms.values())
         # prepare context data for template
         data = {
             'total_days': total_days
@@ -87,11 +119,14 @@ class RoomSearchView(View):
 
 
 class HomeView(View):
-    # renders home page with all the bookingings order by date of creation
+    # renders home page with the bookings order by date of creation, one page at a time
     def get(self, request):
-        bookings = Booking.objects.all().order_by("-created")
+        bookings = Booking.objects.select_related("customer", "room")
+        page = paginate(bookings, search.LIST_ORDERING,
+                        after=request.GET.get("after"), before=request.GET.get("before"))
         context = {
-            'bookings': bookings
+            'bookings': page,
+            'page': page
         }
         return render(request, "home.html", context)
 
@@ -102,18 +137,29 @@ class BookingView(View):
         # check if customer form is ok
         customer_form = CustomerForm(request.POST, prefix="customer")
         if customer_form.is_valid():
-            # save customer data
-            customer = customer_form.save()
-            # add the customer id to the booking form
-            temp_POST = request.POST.copy()
-            temp_POST.update({
-                'booking-customer': customer.id,
-                'booking-room': pk,
-                'booking-code': generate.get()})
-            # if ok, save booking data
-            booking_form = BookingForm(temp_POST, prefix="booking")
-            if booking_form.is_valid():
-                booking_form.save()
+            try:
+                with transaction.atomic():
+                    # the room lock is the first statement: a transaction that read
+                    # first could not take the write lock on SQLite while another
+                    # holds it, it fails with "database is locked" instead of waiting
+                    reservations.lock_room(pk)
+                    # a returning guest keeps their customer row
+                    customer = customers.get_or_create(**customer_form.cleaned_data)
+                    # add the customer id to the booking form
+                    temp_POST = request.POST.copy()
+                    temp_POST.update({
+                        'booking-customer': customer.id,
+                        'booking-room': pk})
+                    # if ok, save booking data now that the room is locked, if it is still free
+                    booking_form = BookingForm(temp_POST, prefix="booking")
+                    if booking_form.is_valid():
+                        reservations.save_if_free(booking_form.save(commit=False))
+            except reservations.RoomUnavailable:
+                # someone else booked the room meanwhile, the customer is rolled back too
+                messages.error(request, "La habitación ya no está disponible para las fechas seleccionadas.")
+                response = self.get(request, pk)
+                response.status_code = 409
+                return response
         return redirect('/')
 
     def get(self, request, pk):
@@ -122,12 +168,15 @@ class BookingView(View):
         # The second form is for the customer information
 
         query = request.GET.dict()
-        room = Room.objects.get(id=pk)
-        checkin = Ymd.Ymd(query['checkin'])
-        checkout = Ymd.Ymd(query['checkout'])
-        total_days = checkout - checkin
-        total = total_days * room.room_type.price  # total amount to be paid
-        query['total'] = total
+        room = catalog.get_catalog().get(pk)
+        if room is None:
+            raise Http404("No Room matches the given query.")
+        # the stay comes in the query string of the search results
+        stay_form = RoomSearchForm(request.GET)
+        if not stay_form.is_valid():
+            return HttpResponseBadRequest(stay_form.errors.as_text())
+        # total amount to be paid, night by night from the rate calendar
+        query['total'] = pricing.stay_total(room.room_type.id, query['checkin'], query['checkout'])
         url_query = request.GET.urlencode()
         booking_form = BookingFormExcluded(prefix="booking", initial=query)
         customer_form = CustomerForm(prefix="customer")
@@ -169,20 +218,15 @@ class EditBookingDatesView(View):
             checkin = form.cleaned_data['checkin']
             checkout = form.cleaned_data['checkout']
             
-            # Check if there are other bookings on the same dates for the same room
-            conflicting_bookings = Booking.objects.filter(
-                room=booking.room,
-                checkin__lt=checkout,
-                checkout__gt=checkin,
-            ).exclude(pk=booking.pk) # Exclude the current booking
-
-            if conflicting_bookings.exists():
+            # Check and save with the room locked, so no other booking takes these dates meanwhile
+            try:
+                reservations.change_dates(booking, checkin, checkout)
+            except reservations.RoomUnavailable:
                 messages.error(request, "No hay disponibilidad para las fechas seleccionadas.")
-            else:
-                form.save()
-                messages.success(request, "Las fechas de la reserva han sido actualizadas correctamente.")
-                return redirect('home')
-        
+                return render(request, 'edit_booking_dates.html', {'form': form, 'booking': booking})
+            messages.success(request, "Las fechas de la reserva han sido actualizadas correctamente.")
+            return redirect('home')
+
         return render(request, 'edit_booking_dates.html', {'form': form, 'booking': booking})
 
 @csrf_exempt  # permite llamadas AJAX sin token CSRF si lo pruebas directamente
@@ -191,7 +235,10 @@ def check_booking_availability(request, pk):
     Endpoint AJAX para validar disponibilidad de la habitación al cambiar fechas en el formulario.
     """
     if request.method == "POST":
-        booking = get_object_or_404(Booking, pk=pk)
+        # active bookings are known to the in-memory index, no query needed
+        room_id = availability.room_of(pk)
+        if room_id is None:
+            room_id = get_object_or_404(Booking, pk=pk).room_id
         checkin = request.POST.get('checkin')
         checkout = request.POST.get('checkout')
 
@@ -205,18 +252,105 @@ def check_booking_availability(request, pk):
         if checkout_date <= checkin_date:
             return JsonResponse({'available': False, 'error': 'La fecha de salida debe ser posterior a la de entrada.'})
 
-        conflicting = Booking.objects.filter(
-            room=booking.room,
-            checkin__lt=checkout_date,
-            checkout__gt=checkin_date
-        ).exclude(pk=booking.pk)
-
-        if conflicting.exists():
+        # repeated checks of an unchanged room are answered from the memo
+        if not memo.is_room_free(room_id, checkin_date, checkout_date, exclude=pk):
             return JsonResponse({'available': False, 'error': 'No hay disponibilidad para las fechas seleccionadas.'})
         else:
             return JsonResponse({'available': True})
 
         return JsonResponse({'available': False, 'error': 'Método no permitido.'})
+
+
+def availability_memo_stats(request):
+    """
+    Hit and miss counters of the availability check memo in this process, for tuning AVAILABILITY_MEMO_SIZE.
+    """
+    return JsonResponse({'backend': settings.AVAILABILITY_BACKEND, **memo.stats()})
+
+
+@csrf_exempt  # machine-to-machine endpoint for the channel manager
+def batch_availability(request):
+    """
+    Checks many (room, checkin, checkout) tuples in one request.
+
+    Body: {"queries": [{"room": 1, "checkin": "2024-05-01", "checkout": "2024-05-03", "exclude": 7}, ...]}
+    where "exclude" (a booking id being moved) is optional. Results come back in the same order,
+    with the ids of the conflicting bookings, or an "error" for a malformed tuple.
+    """
+    if request.method != "POST":
+        return JsonResponse({'error': 'Método no permitido.'}, status=405)
+    import json
+    from datetime import date
+    try:
+        queries = json.loads(request.body)["queries"]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Se esperaba un objeto JSON con la lista "queries".'}, status=400)
+    if not isinstance(queries, list):
+        return JsonResponse({'error': '"queries" debe ser una lista.'}, status=400)
+    limit = getattr(settings, 'AVAILABILITY_BATCH_LIMIT', 10000)
+    if len(queries) > limit:
+        return JsonResponse({'error': 'Como máximo %s consultas por petición.' % limit}, status=400)
+
+    results = [None] * len(queries)
+    valid = []
+    for position, item in enumerate(queries):
+        try:
+            stay = (int(item['room']), date.fromisoformat(item['checkin']), date.fromisoformat(item['checkout']),
+                    int(item['exclude']) if item.get('exclude') is not None else None)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            results[position] = {'error': 'Se esperaba room, checkin y checkout (YYYY-MM-DD).'}
+            continue
+        if stay[2] <= stay[1]:
+            results[position] = {'error': 'La fecha de salida debe ser posterior a la de entrada.'}
+            continue
+        valid.append((position, stay))
+
+    # all the tuples are answered together, not one query each
+    for (position, (room_id, checkin, checkout, _)), conflicts in zip(
+            valid, availability.batch_conflicts([stay for _, stay in valid])):
+        results[position] = {'room': room_id, 'checkin': checkin.isoformat(), 'checkout': checkout.isoformat(),
+                             'available': not conflicts, 'conflicts': conflicts}
+    return JsonResponse({'results': results})
+
+
+def booking_codes(request):
+    """
+    Autocomplete of reservation codes: GET ?q=<prefix>&limit=N returns the first N live or archived
+    bookings whose code starts with the prefix, in code order, read from the code index.
+    """
+    top = getattr(settings, 'CODE_AUTOCOMPLETE_LIMIT', 10)
+    try:
+        limit = min(max(int(request.GET.get('limit', top)), 1), top)
+    except ValueError:
+        limit = top
+    prefix = request.GET.get('q', '')
+    if not search.is_code_prefix(prefix):
+        return JsonResponse({'results': []})
+    matches = search.autocomplete(prefix, limit)
+    for match in matches:
+        match['checkin'] = match['checkin'].isoformat()
+        match['checkout'] = match['checkout'].isoformat()
+        match['customer'] = match.pop('customer__name')
+    return JsonResponse({'results': matches})
+
+
+def booking_changes(request):
+    """
+    Change feed of the bookings: GET ?after=<id>&limit=N returns the changes recorded after the
+    given id, oldest first. Consumers keep the "next" cursor and ask again with it.
+    """
+    top = getattr(settings, 'CHANGE_FEED_LIMIT', 500)
+    try:
+        after = max(int(request.GET.get('after', 0)), 0)
+        limit = min(max(int(request.GET.get('limit', top)), 1), top)
+    except ValueError:
+        return JsonResponse({'error': '"after" y "limit" deben ser números enteros.'}, status=400)
+    rows, has_more = changes.feed(after, limit)
+    results = [{'seq': row['id'], 'booking': row['booking_id'], 'kind': row['kind'],
+                'changed': row['changed'].isoformat(), 'booking_data': row['data']} for row in rows]
+    return JsonResponse({'changes': results, 'next': rows[-1]['id'] if rows else after, 'has_more': has_more})
+
+
 class DeleteBookingView(View):
     # renders the booking deletion form
     def get(self, request, pk):
@@ -228,7 +362,8 @@ class DeleteBookingView(View):
 
     # deletes the booking
     def post(self, request, pk):
-        Booking.objects.filter(id=pk).update(state="DEL")
+        if reservations.cancel_booking(pk) is None:
+            raise Http404("No Booking matches the given query.")
         return redirect("/")
 
 
@@ -251,80 +386,97 @@ class EditBookingView(View):
         booking = Booking.objects.get(id=pk)
         customer_form = CustomerForm(request.POST, prefix="customer", instance=booking.customer)
         if customer_form.is_valid():
-            customer_form.save()
+            # the change feed rows are written with the customer
+            with transaction.atomic():
+                customer_form.save()
             return redirect("/")
 
 
 class DashboardView(View):
     def get(self, request):
-        from datetime import date, time, datetime
+        context = {
+            'dashboard': dashboard.snapshot()
+        }
+        return render(request, "dashboard.html", context)
+
+
+class DashboardHistoryView(View):
+    # longest range accepted, ten years of daily rollups
+    MAX_DAYS = 3660
+
+    # renders the figures of a date range from the daily rollups
+    def get(self, request):
+        from datetime import date, timedelta
         today = date.today()
+        try:
+            start = date.fromisoformat(request.GET.get("start", ""))
+            end = date.fromisoformat(request.GET.get("end", ""))
+        except ValueError:
+            start, end = today - timedelta(days=30), today
+        if end < start:
+            start, end = end, start
+        start = max(start, end - timedelta(days=self.MAX_DAYS))
+        group = "month" if request.GET.get("group") == "month" else "day"
 
-        # get bookings created today
-        today_min = datetime.combine(today, time.min)
-        today_max = datetime.combine(today, time.max)
-        today_range = (today_min, today_max)
-        new_bookings = (Booking.objects
-                        .filter(created__range=today_range)
-                        .values("id")
-                        ).count()
-
-        # get incoming guests
-        incoming = (Booking.objects
-                    .filter(checkin=today)
-                    .exclude(state="DEL")
-                    .values("id")
-                    ).count()
-
-        # get outcoming guests
-        outcoming = (Booking.objects
-                     .filter(checkout=today)
-                     .exclude(state="DEL")
-                     .values("id")
-                     ).count()
-
-        # get outcoming guests
-        invoiced = (Booking.objects
-                    .filter(created__range=today_range)
-                    .exclude(state="DEL")
-                    .aggregate(Sum('total'))
-                    )
-         # Calculate occupancy rate
-        total_rooms = Room.objects.count()
-        confirmed_bookings = Booking.objects.filter(
-            Q(checkin__lte=today) &  # Check-in es hoy o antes
-            Q(checkout__gt=today) &   # Check-out es después de hoy
-            ~Q(state="DEL")           # No incluir reservas eliminadas
-        ).count()
-
-        occupancy_rate = (confirmed_bookings / total_rooms * 100) if total_rooms > 0 else 0
-
-        # preparing context data
-        dashboard = {
-            'new_bookings': new_bookings,
-            'incoming_guests': incoming,
-            'outcoming_guests': outcoming,
-            'invoiced': invoiced,
-            'occupancy_rate': round(occupancy_rate, 2),  # Redondear a 2 decimales
-            'total_rooms': total_rooms,
-            'occupied_rooms': confirmed_bookings
+        context = {
+            'start': start,
+            'end': end,
+            'group': group,
+            'history': rollups.report(start, end, group, total_rooms=Room.objects.count())
         }
+        return render(request, "dashboard_history.html", context)
 
+
+class BookingExportView(View):
+    # streams the bookings as CSV or JSON Lines, filtered by stay dates, state and room
+    def get(self, request):
+        from datetime import date
+        fmt = exporter.JSONL if request.GET.get("format") == exporter.JSONL else exporter.CSV
+        dates = {}
+        for name in ("start", "end"):
+            try:
+                dates[name] = date.fromisoformat(request.GET.get(name, ""))
+            except ValueError:
+                dates[name] = None
+        bookings = exporter.bookings(state=request.GET.get("state") or None,
+                                     room=request.GET.get("room") or None, **dates)
+        response = StreamingHttpResponse(exporter.lines(bookings, fmt), content_type=exporter.CONTENT_TYPES[fmt])
+        response["Content-Disposition"] = 'attachment; filename="bookings.%s"' % fmt
+        return response
+
+
+class AvailabilityGridView(View):
+    # renders every room against the dates of a window, as HTML or as a JSON matrix
+    def get(self, request):
+        from datetime import date
+        from django.utils.safestring import mark_safe
+        try:
+            start = date.fromisoformat(request.GET.get("start", ""))
+        except ValueError:
+            start = date.today()
+        try:
+            days = int(request.GET.get("days", 30))
+        except ValueError:
+            days = 30
+        availability_grid = grid.AvailabilityGrid.build(start, days)
+        if request.GET.get("format") == "json":
+            return JsonResponse(availability_grid.as_json())
         context = {
-            'dashboard': dashboard
+            'grid': availability_grid,
+            'rows': mark_safe("".join(availability_grid.html_rows())),
         }
-        return render(request, "dashboard.html", context)
+        return render(request, "availability_grid.html", context)
 
 
 class RoomDetailsView(View):
     def get(self, request, pk):
         # renders room details
-        room = Room.objects.get(id=pk)
-        bookings = room.booking_set.all()
+        room = Room.objects.select_related("room_type").get(id=pk)
+        # the customer of every row is read in the same query
+        bookings = room.booking_set.select_related("customer").order_by("checkin", "id")
         context = {
             'room': room,
             'bookings': bookings}
-        print(context)
         return render(request, "room_detail.html", context)
 
 
@@ -338,22 +490,15 @@ class RoomsView(View):
         # 1. Get the search parameter 'q' from the query string and normalize it.
         query = request.GET.get("q", "").strip()
 
-        # 2. Build the base queryset: select the fields to be displayed.
-        rooms = Room.objects.all().values("id", "name", "room_type__name")
-
-        # 3. Apply the filter if the user provided a search query.
-        if query:
-            rooms = rooms.filter(name__icontains=query)  # name__icontains -> contains the substring without differentiating uppercase/lowercase
-
-        # 4. Order results by name.
-        rooms = rooms.order_by("name")
+        # 2. Filter the in-memory room catalog: names containing the query, case-insensitive,
+        #    ordered by name. No database query while the catalog is warm.
+        rooms = [room.as_dict() for room in catalog.get_catalog().filter(query)]
 
-        # 5. If the request is AJAX, return JSON with the filtered list of rooms.
+        # 3. If the request is AJAX, return JSON with the filtered list of rooms.
         if request.headers.get("x-requested-with") == "XMLHttpRequest":
-            rooms_list = list(rooms)
-            return JsonResponse({"rooms": rooms_list})
+            return JsonResponse({"rooms": rooms})
 
-        # 6. For normal requests, render the template and pass the context.
+        # 4. For normal requests, render the template and pass the context.
         context: Dict[str, Any] = {
             "rooms": rooms,  # You can iterate over rooms in the template: for r in rooms
             "query": query,